@@ -0,0 +1,37 @@
+from typing import Awaitable, Callable, Optional
+
+from backend.utils.diagnostics import SamplingProfiler, SlowRequestLog
+from backend.utils.exceptions import ProfilerBusyException
+from backend.utils.settings_accumalator import Settings
+from fastapi import (APIRouter, Depends, HTTPException, Query, responses,
+                     status)
+
+
+class AdminRoutes():
+    """
+    Overview:
+        Diagnostics endpoints for a live worker, behind the same basic auth as the webhook
+        GET <admin>/profile?seconds=N: samples the worker for N seconds & returns the collapsed stacks (pipe into flamegraph.pl)
+        GET <admin>/slow-requests[?request_id=..]: the stage breakdowns of the latest slow requests, newest first
+    """
+
+    def __init__(self, settings: Settings, authorize: Callable[..., Awaitable], slow_request_log: SlowRequestLog, profiler: SamplingProfiler):
+        self.settings = settings
+        self.slow_request_log = slow_request_log
+        self.profiler = profiler
+        self.router = APIRouter(prefix=self.settings.configs_app.web_route_admin, dependencies=[Depends(authorize)])
+
+        @self.router.get('/profile')
+        async def get_profile(seconds: float = Query(default=10, gt=0, le=self.settings.configs_app.profiler_max_seconds)):
+            try:
+                collapsed_stacks = await self.profiler.profile(seconds)
+            except ProfilerBusyException as e:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+            return responses.PlainTextResponse(content=collapsed_stacks)
+
+        @self.router.get('/slow-requests')
+        async def get_slow_requests(request_id: Optional[str] = None):
+            return {
+                'threshold_seconds': self.slow_request_log.threshold_seconds,
+                'requests': self.slow_request_log.get_entries(request_id)
+            }
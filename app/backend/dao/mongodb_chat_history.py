@@ -0,0 +1,156 @@
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from backend.utils.generic import logger
+from bson import ObjectId
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import (BaseMessage, message_to_dict,
+                                     messages_from_dict)
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+SESSION_ID_KEY = 'SessionId'
+HISTORY_KEY = 'History'
+SUMMARY_KEY = 'summary'
+SUMMARIZED_UNTIL_KEY = 'summarized_until'
+SESSION_INDEX_NAME = 'SessionId_1__id_1'
+SESSION_INDEX_KEYS = [(SESSION_ID_KEY, ASCENDING), ('_id', ASCENDING)]
+
+
+class MongodbChatMessageHistory(BaseChatMessageHistory):
+    """
+    Overview:
+        Chat history of a single session (user phone number) stored over the shared MongoDB connection pool
+        Documents are stored in the same format as langchain_mongodb's MongoDBChatMessageHistory so existing chats remain readable
+        The request path uses the async interface; the sync one (for callers outside the event loop, e.g. jobs & scripts) runs the
+        same queries through the blocking pymongo collection wrapped by Motor, so both share one connection pool
+        Every query is filtered by SessionId & ordered by _id so it is bounded by the (SessionId, _id) index
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection, session_id: str):
+        self.collection = collection
+        self.session_id = session_id
+
+    @staticmethod
+    async def create_indexes(collection: AsyncIOMotorCollection):
+        """
+        Overview:
+            Creates the (SessionId, _id) index and checks it exists, since without it every history query scans the whole collection
+        """
+        await collection.create_index(SESSION_INDEX_KEYS, name=SESSION_INDEX_NAME)
+        indexes = await collection.index_information()
+        if SESSION_INDEX_KEYS not in [index['key'] for index in indexes.values()]:
+            raise Exception(f'Chat history index {SESSION_INDEX_NAME} is missing on {collection.name}, found: {list(indexes)}')
+        logger.info(f'Chat history index {SESSION_INDEX_NAME} is present on {collection.name}')
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        cursor = self.collection.delegate.find({SESSION_ID_KEY: self.session_id}).sort('_id', ASCENDING)
+        return messages_from_dict([json.loads(document[HISTORY_KEY]) for document in cursor])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        if messages:
+            self.collection.delegate.insert_many(self._to_documents(messages))
+
+    def clear(self) -> None:
+        self.collection.delegate.delete_many({SESSION_ID_KEY: self.session_id})
+
+    def get_recent_messages(self, limit: int) -> List[Tuple[ObjectId, BaseMessage]]:
+        cursor = self.collection.delegate.find({SESSION_ID_KEY: self.session_id}).sort('_id', -1).limit(limit)
+        return self._to_messages(reversed(list(cursor)))
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        cursor = self.collection.find({SESSION_ID_KEY: self.session_id}).sort('_id', ASCENDING)
+        items = [json.loads(document[HISTORY_KEY]) async for document in cursor]
+        return messages_from_dict(items)
+
+    async def aget_recent_messages(self, limit: int) -> List[Tuple[ObjectId, BaseMessage]]:
+        """
+        Overview:
+            Loads only the most recent messages of the session (oldest first) together with their ids
+        """
+        cursor = self.collection.find({SESSION_ID_KEY: self.session_id}).sort('_id', -1).limit(limit)
+        documents = [document async for document in cursor]
+        return self._to_messages(reversed(documents))
+
+    async def aget_messages_between(self, after_id: Optional[ObjectId], before_id: ObjectId, limit: int) -> List[Tuple[ObjectId, BaseMessage]]:
+        """
+        Overview:
+            Loads up to limit of the oldest messages with after_id < _id < before_id (oldest first)
+        """
+        id_filter = {'$lt': before_id} if after_id is None else {'$gt': after_id, '$lt': before_id}
+        cursor = self.collection.find({SESSION_ID_KEY: self.session_id, '_id': id_filter}).sort('_id', 1).limit(limit)
+        return self._to_messages([document async for document in cursor])
+
+    def _to_messages(self, documents) -> List[Tuple[ObjectId, BaseMessage]]:
+        documents = list(documents)
+        messages = messages_from_dict([json.loads(document[HISTORY_KEY]) for document in documents])
+        return [(document['_id'], message) for document, message in zip(documents, messages)]
+
+    def _to_documents(self, messages: Sequence[BaseMessage]) -> List[Dict]:
+        return [{SESSION_ID_KEY: self.session_id, HISTORY_KEY: json.dumps(message_to_dict(message))} for message in messages]
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        if messages:
+            await self.collection.insert_many(self._to_documents(messages))
+
+    async def adelete_recent_messages(self, count: int) -> int:
+        """
+        Overview:
+            Deletes the count most recent messages of the session
+        """
+        cursor = self.collection.find({SESSION_ID_KEY: self.session_id}, {'_id': 1}).sort('_id', -1).limit(count)
+        ids_to_delete = [document['_id'] async for document in cursor]
+        if not ids_to_delete:
+            return 0
+        result = await self.collection.delete_many({SESSION_ID_KEY: self.session_id, '_id': {'$in': ids_to_delete}})
+        return result.deleted_count
+
+    async def aclear(self) -> int:
+        result = await self.collection.delete_many({SESSION_ID_KEY: self.session_id})
+        return result.deleted_count
+
+
+class MongodbChatSummaryStore:
+    """
+    Overview:
+        Rolling summaries of the chat history which has dropped out of the prompt window, one document per session
+        summarized_until is the id of the newest chat message folded into the summary
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection):
+        self.collection = collection
+
+    async def get_summary(self, session_id: str) -> Optional[Dict]:
+        return await self.collection.find_one({'_id': session_id})
+
+    def get_summary_sync(self, session_id: str) -> Optional[Dict]:
+        return self.collection.delegate.find_one({'_id': session_id})
+
+    async def update_summary(self, session_id: str, summary: str, summarized_until: ObjectId,
+                             previous_summarized_until: Optional[ObjectId]) -> bool:
+        """
+        Overview:
+            Stores the new summary only if nobody else advanced it in the meantime (optimistic concurrency)
+        Returns:
+            - is_updated: bool
+        """
+        document = {SUMMARY_KEY: summary, SUMMARIZED_UNTIL_KEY: summarized_until, 'updated_at': datetime.now()}
+        if previous_summarized_until is None:
+            try:
+                await self.collection.insert_one({'_id': session_id, **document})
+                return True
+            except DuplicateKeyError:
+                return False
+        result = await self.collection.update_one({'_id': session_id, SUMMARIZED_UNTIL_KEY: previous_summarized_until}, {'$set': document})
+        return result.modified_count > 0
+
+    async def delete_summary(self, session_id: str) -> bool:
+        result = await self.collection.delete_one({'_id': session_id})
+        return result.deleted_count > 0
+
+    def delete_summary_sync(self, session_id: str) -> bool:
+        result = self.collection.delegate.delete_one({'_id': session_id})
+        return result.deleted_count > 0
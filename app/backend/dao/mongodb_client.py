@@ -0,0 +1,35 @@
+from backend.utils.generic import logger
+from backend.utils.settings_accumalator import Settings
+from motor.motor_asyncio import (AsyncIOMotorClient, AsyncIOMotorCollection,
+                                 AsyncIOMotorDatabase)
+
+
+class MongodbClient:
+    """
+    Overview:
+        Owns the single process-wide MongoDB client (and hence its connection pool, monitor threads & auth handshake)
+        DAOs are thin views over the collections exposed here instead of opening their own clients
+    """
+
+    def __init__(self, settings: Settings):
+        configs_app = settings.configs_app
+        logger.info(f'Creating MongoDB client with connection pool of size {configs_app.mongodb_min_pool_size}-{configs_app.mongodb_max_pool_size}..')
+        self.client = AsyncIOMotorClient(host=f'mongodb://{settings.configs_env.mongodb_container_name}',
+                                         port=settings.configs_env.mongodb_port_number,
+                                         username=settings.secrets_mongodb.username,
+                                         password=settings.secrets_mongodb.password,
+                                         authSource=settings.configs_env.mongodb_database_auth,
+                                         maxPoolSize=configs_app.mongodb_max_pool_size,
+                                         minPoolSize=configs_app.mongodb_min_pool_size,
+                                         maxIdleTimeMS=configs_app.mongodb_max_idle_time_ms,
+                                         connectTimeoutMS=configs_app.mongodb_connect_timeout_ms,
+                                         serverSelectionTimeoutMS=configs_app.mongodb_server_selection_timeout_ms,
+                                         waitQueueTimeoutMS=configs_app.mongodb_wait_queue_timeout_ms
+                                         )
+        self.db: AsyncIOMotorDatabase = self.client[f'{settings.configs_env.mongodb_database}']
+
+    def get_collection(self, collection_name: str) -> AsyncIOMotorCollection:
+        return self.db[collection_name]
+
+    def close_connection(self):
+        self.client.close()
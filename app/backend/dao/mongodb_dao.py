@@ -1,130 +1,162 @@
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional
 
+from backend.dao.mongodb_client import MongodbClient
+from backend.dao.mongodb_user_cache import MongodbUserCache
 from backend.dto.user_dto import UserDto
+from backend.utils.city_gazetteer import CityGazetteer
 from backend.utils.exceptions import MongoDbUserNotFoundException
 from backend.utils.generic import logger
 from backend.utils.settings_accumalator import Settings
-from bson import ObjectId
-from pymongo import MongoClient, errors
+from pymongo import ASCENDING, UpdateOne, errors
+
+# serves matching a free helper for a city & ranking the candidates (see MongodbMatchmaker)
+CITY_INDEX_KEYS = [('city_ids', ASCENDING), ('connected_phone_number', ASCENDING), ('helper_missed_count', ASCENDING),
+                   ('last_helped_at', ASCENDING)]
 
 
 class MongodbDao:
-    def __init__(self, settings: Settings):
-        self.client = MongoClient(host=f'mongodb://{settings.configs_env.mongodb_container_name}',
-                                  port=settings.configs_env.mongodb_port_number,
-                                  username=settings.secrets_mongodb.username,
-                                  password=settings.secrets_mongodb.password,
-                                  authSource=settings.configs_env.mongodb_database_auth
-                                  )
-        self.db = self.client[f'{settings.configs_env.mongodb_database}']
-        self.collection_users = self.db[settings.configs_app.mongodb_collection_users]
-
-    def insert_user(self, user: UserDto) -> Optional[str]:
+    def __init__(self, settings: Settings, mongodb_client: MongodbClient):
+        self.mongodb_client = mongodb_client
+        self.collection_users = mongodb_client.get_collection(settings.configs_app.mongodb_collection_users)
+        self.city_gazetteer = CityGazetteer(settings.configs_app.city_gazetteer_file)
+        self.user_cache: Optional[MongodbUserCache] = None
+        if settings.configs_app.user_cache_enabled:
+            self.user_cache = MongodbUserCache(self.collection_users, settings.configs_app.user_cache_ttl_seconds,
+                                               settings.configs_app.user_cache_max_entries)
+
+    async def create_indexes(self):
+        await self.collection_users.create_index(CITY_INDEX_KEYS)
+        await self.collection_users.create_index('connected_at')  # finds expired connections by range
+
+    async def insert_user(self, user: UserDto) -> Optional[str]:
         """
         Inserts a user into the database if they do not already exist.
         :param user: UserDto containing user information.
         :return: The MongoDB ID of the inserted user or None if the user already exists.
         """
-        inserted_id, user_dict = None, vars(user)
-        user_dict.pop('_id', None)
-        if self.collection_users.count_documents({'phone_number': user.phone_number}) == 0:
-            try:
-                result = self.collection_users.insert_one(user_dict)
-                inserted_id = result.inserted_id
-            except errors.PyMongoError as e:
-                logger.error(f"Failed to insert user with phone number {user.phone_number}: {e}")
-        else:
-            logger.info(f"User with phone number {user.phone_number} already exists")
+        inserted_id = None
+        try:
+            result = await self.collection_users.update_one({'phone_number': user.phone_number}, {'$setOnInsert': user.to_document()},
+                                                            upsert=True)
+            inserted_id = result.upserted_id
+            if inserted_id is None:
+                logger.info(f"User with phone number {user.phone_number} already exists")
+        except errors.PyMongoError as e:
+            logger.error(f"Failed to insert user with phone number {user.phone_number}: {e}")
         return inserted_id
 
-    def delete_user(self, user: UserDto) -> int:
+    async def delete_user(self, user: UserDto) -> int:
         tomorrow = datetime.now() + timedelta(days=1)
-        result = self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'deletion_date': tomorrow}})
+        result = await self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'deletion_date': tomorrow}})
         if result.matched_count == 0:
             raise Exception('User not found or already deleted.')
+        self.invalidate_cached_users(user.phone_number)
         return result.matched_count
 
-    def is_user_rate_limited(self, user: UserDto, rate_limit: int) -> bool:
-        logger.info(f'Checking if user {user.phone_number} is rate limited..')
-        user_rate_limited, now = False, datetime.now()
-        day_after_tomorrow = now + timedelta(days=2)
-        if user.deletion_date < day_after_tomorrow:
-            logger.info(f'User {user.phone_number} recently off-boarded from the system..')
-            user_rate_limited = True
+    async def get_user_by_phone_number(self, phone_number, fields: Optional[Iterable[str]] = None) -> UserDto:
+        """
+        Overview:
+            Reads a user; with fields only those fields are set on the DTO
+            Without the user cache only those fields are fetched; with it whole users are read (so that they can be cached)
+            & the fields are projected from the cached document, so a DTO has the same fields whether the cache is enabled or not
+        """
+        if self.user_cache:
+            user = self.user_cache.get(phone_number)
+            if user is None:
+                cache_version = self.user_cache.version
+                user = await self.collection_users.find_one({'phone_number': phone_number})
+                if user is not None:
+                    self.user_cache.put(user, cache_version)
+            if user is not None and fields is not None:
+                fields = set(fields)
+                user = {field: value for field, value in user.items() if field in fields}
         else:
-            if user.time_last_sms is not None and now.date() > user.time_last_sms.date():
-                self._update_sms_counter(user, 0)  # reset counter for user every new day
-            else:
-                if user.sms_counter <= rate_limit:
-                    self._update_sms_counter(user, user.sms_counter + 1)
-                else:
-                    logger.info(f'User {user.phone_number} rate limit reached ({user.sms_counter} / {rate_limit})')
-                    user_rate_limited = True
-            self.update_time_last_sms(user, now)
-        return user_rate_limited
-
-    def _update_sms_counter(self, user: UserDto, sms_counter: int) -> int:
-        result = self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'sms_counter': sms_counter}})
-        if result.matched_count == 0:
-            raise MongoDbUserNotFoundException('User not found for the provided phone number.')
-        return result.modified_count
-
-    def get_user_by_phone_number(self, phone_number) -> UserDto:
-        user = self.collection_users.find_one({'phone_number': phone_number})
+            user = await self.collection_users.find_one({'phone_number': phone_number}, UserDto.projection(fields) if fields else None)
         if user is None:
             raise MongoDbUserNotFoundException('User not found for the provided phone number.')
-        return UserDto(**user)
+        return UserDto.from_document(user, projected=fields is not None)
 
-    def update_time_last_sms(self, user: UserDto, time_last_sms: datetime) -> int:
-        result = self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'time_last_sms': time_last_sms}})
+    def invalidate_cached_users(self, *phone_numbers: str):
+        """
+        Overview:
+            Must be called after every write to users (other than the rate limit counters) made outside of this DAO
+        """
+        if self.user_cache:
+            self.user_cache.invalidate(*phone_numbers)
+
+    async def update_time_last_sms(self, user: UserDto, time_last_sms: datetime) -> int:
+        result = await self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'time_last_sms': time_last_sms}})
         if result.matched_count == 0:
             raise MongoDbUserNotFoundException('User not found for the provided phone number.')
+        self.invalidate_cached_users(user.phone_number)
         return result.modified_count
 
-    def update_user_name(self, user: UserDto, name: str) -> int:
-        result = self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'name': name}})
+    async def update_user_name(self, user: UserDto, name: str) -> int:
+        result = await self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'name': name}})
         if result.matched_count == 0:
             raise MongoDbUserNotFoundException('User not found for the provided phone number.')
+        self.invalidate_cached_users(user.phone_number)
         return result.modified_count
 
-    def update_user_cities(self, user: UserDto, cities: List[str]) -> int:
-        result = self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'cities_ca': cities}})
+    async def update_user_cities(self, user: UserDto, cities: List[str]) -> int:
+        fields = self.get_cities_fields(cities)
+        result = await self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': fields})
         if result.matched_count == 0:
             raise MongoDbUserNotFoundException('User not found for the provided phone number.')
+        self.invalidate_cached_users(user.phone_number)
+        user.cities_ca, user.city_ids = fields['cities_ca'], fields['city_ids']
         return result.modified_count
 
-    def update_connection_details(self, user: UserDto, connected_phone_number: str, connected_name: str) -> int:
-        result = self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'connected_phone_number': connected_phone_number}})
+    def get_cities_fields(self, cities: List[str]) -> Dict:
+        cities = [city.strip() for city in cities]
+        return {'cities_ca': cities, 'city_ids': self.city_gazetteer.get_city_ids(cities)}
+
+    async def update_connection_details(self, user: UserDto, connected_phone_number: str, connected_name: str) -> int:
+        connected_at = datetime.now() if connected_phone_number else None
+        result = await self.collection_users.update_one(
+            {'phone_number': user.phone_number},
+            {'$set': {'connected_phone_number': connected_phone_number, 'connected_name': connected_name, 'connected_at': connected_at}}
+        )
         if result.matched_count == 0:
             raise MongoDbUserNotFoundException('User not found for the provided phone number.')
-        else:
-            self.collection_users.update_one({'phone_number': user.phone_number}, {'$set': {'connected_name': connected_name}})
+        self.invalidate_cached_users(user.phone_number)
         return result.modified_count
 
-    def find_user_by_city(self, user: UserDto, city: str) -> UserDto:
+    async def backfill_city_ids(self, batch_size: int = 1000, overwrite: bool = False) -> int:
         """
-        Finds the first user who is familiar with given city and is not connected to any other user
-        :param city: The city to search within the user data.
-        :param exclude_user_id: The MongoDB ID of the user to be excluded from the search.
-        :return: The first matching user document or None if no match is found.
+        Overview:
+            Canonicalizes cities_ca of existing users into city_ids, in batches of bulk writes
+        Arguments:
+            - batch_size: int
+            - overwrite: bool (recompute city_ids of users which already have them, e.g. after the gazetteer changed)
+        Returns:
+            - updated_count: int
         """
-        connected_user = None
-        try:
-            query = {
-                'cities_ca': {'$elemMatch': {'$regex': f'^\\s*{city}\\s*$', '$options': 'i'}},  # Regex to handle spaces & case-insensitivity
-                'connected_phone_number': None,
-                '_id': {'$ne': ObjectId(user._id)}  # Exclude current user's ID from the search
-            }
-            matched_user = self.collection_users.find_one(query)
-            if matched_user is None:
-                logger.info(f'Could not find any user to connect for {user.phone_number} and city {city}')
-            else:
-                connected_user = UserDto(**matched_user)
-        except Exception as e:
-            logger.error(f'Error finding user by city: {str(e)}')
-        finally:
-            return connected_user
-
-    def close_connection(self):
-        self.client.close()
+        query = {'cities_ca': {'$type': 'array'}}
+        if not overwrite:
+            query['city_ids'] = None
+        updated_count, operations = 0, []
+        async for user in self.collection_users.find(query, {'cities_ca': 1}):
+            operations.append(UpdateOne({'_id': user['_id']}, {'$set': {'city_ids': self.city_gazetteer.get_city_ids(user['cities_ca'])}}))
+            if len(operations) == batch_size:
+                updated_count += (await self.collection_users.bulk_write(operations, ordered=False)).modified_count
+                operations = []
+        if operations:
+            updated_count += (await self.collection_users.bulk_write(operations, ordered=False)).modified_count
+        if self.user_cache:
+            self.user_cache.clear()
+        return updated_count
+
+    async def backfill_connected_at(self) -> int:
+        """
+        Overview:
+            Starts the expiry clock now for connections made before connected_at was recorded, which would otherwise never expire
+        Returns:
+            - updated_count: int
+        """
+        result = await self.collection_users.update_many({'connected_phone_number': {'$ne': None}, 'connected_at': None},
+                                                         {'$set': {'connected_at': datetime.now()}})
+        if self.user_cache:
+            self.user_cache.clear()
+        return result.modified_count
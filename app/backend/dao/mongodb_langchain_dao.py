@@ -1,35 +1,50 @@
+from typing import Callable
+
+from backend.dao.mongodb_chat_history import (MongodbChatMessageHistory,
+                                              MongodbChatSummaryStore)
+from backend.dao.mongodb_client import MongodbClient
 from backend.utils.generic import logger
 from backend.utils.settings_accumalator import Settings
-from langchain_mongodb.chat_message_histories import MongoDBChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
 
 
 class MongodbLangchainDao:
-    def __init__(self, settings: Settings, user_phone_number):
-        self.chat_history = MongoDBChatMessageHistory(
-            session_id=user_phone_number,
-            connection_string=f'mongodb://{settings.secrets_mongodb.username}:{settings.secrets_mongodb.password}@' +
-            f'{settings.configs_env.mongodb_container_name}:{settings.configs_env.mongodb_port_number}/?authSource={settings.configs_env.mongodb_database_auth}',
-            database_name=settings.configs_env.mongodb_database,
-            collection_name=settings.configs_app.mongodb_collection_chats,
+    def __init__(self, settings: Settings, mongodb_client: MongodbClient, user_phone_number):
+        self.chat_history = MongodbChatMessageHistory(
+            collection=mongodb_client.get_collection(settings.configs_app.mongodb_collection_chats),
+            session_id=user_phone_number
         )
+        self.chat_summary_store = MongodbChatSummaryStore(mongodb_client.get_collection(settings.configs_app.mongodb_collection_chat_summaries))
+
+    @staticmethod
+    def get_session_history_factory(settings: Settings, mongodb_client: MongodbClient) -> Callable[[str], BaseChatMessageHistory]:
+        """
+        Overview:
+            Returns the factory used by the (prebuilt) LangChain chains to resolve the chat history of a session
+        """
+        collection = mongodb_client.get_collection(settings.configs_app.mongodb_collection_chats)
+        return lambda session_id: MongodbChatMessageHistory(collection=collection, session_id=session_id)
+
+    @staticmethod
+    async def create_indexes(settings: Settings, mongodb_client: MongodbClient):
+        await MongodbChatMessageHistory.create_indexes(mongodb_client.get_collection(settings.configs_app.mongodb_collection_chats))
 
-    def delete_chat_history(self) -> bool:
+    async def delete_chat_history(self) -> bool:
         is_deleted = False
         try:
-            result = self.chat_history.collection.delete_many({'SessionId': self.chat_history.session_id})
-            is_deleted = result.deleted_count > 0
+            is_deleted = await self.chat_history.aclear() > 0
+            await self.chat_summary_store.delete_summary(self.chat_history.session_id)
         except Exception as e:
             raise Exception(f'Chat history could not be deleted because of error {e}')
         finally:
             return is_deleted
 
-    def update_user_message(self, query: str):
-        self.chat_history.add_user_message(query)
+    async def update_user_message(self, query: str):
+        await self.chat_history.aadd_messages([HumanMessage(content=query)])
 
-    def update_ai_message(self, answer: str):
-        self.chat_history.add_ai_message(answer)
+    async def update_ai_message(self, answer: str):
+        await self.chat_history.aadd_messages([AIMessage(content=answer)])
 
-    def delete_most_recent_messages(self, count: int):
-        prev_messages = self.chat_history.collection.find().sort('_id', -1).limit(count)
-        ids_to_delete = [message['_id'] for message in prev_messages]
-        self.chat_history.collection.delete_many({'_id': {'$in': ids_to_delete}})
+    async def delete_most_recent_messages(self, count: int):
+        await self.chat_history.adelete_recent_messages(count)
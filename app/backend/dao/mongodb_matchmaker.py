@@ -0,0 +1,226 @@
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from backend.dao.mongodb_dao import CITY_INDEX_KEYS
+from backend.dao.mongodb_user_cache import MongodbUserCache
+from backend.dto.user_dto import RATE_LIMITED_USER_FIELDS, UserDto
+from backend.utils.city_gazetteer import CityGazetteer
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+from backend.utils.settings_accumalator import Settings
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+HELPER_RANKING = CITY_INDEX_KEYS[2:]  # most responsive first, then the one who helped least recently
+OFFBOARDING_GRACE_DAYS = 2  # off-boarded users keep a deletion date of tomorrow (see RateLimiter._is_recently_offboarded)
+CONNECTION_CLEARED = {'$set': {'connected_phone_number': None, 'connected_name': None, 'connected_at': None},
+                      '$unset': {'connection_replied': ''}}
+
+
+class MongodbMatchmaker:
+    """
+    Overview:
+        Connects users asking for help with a city to a free helper familiar with it
+        Both sides of a connection are claimed with conditional updates on connected_phone_number: null so concurrent requests
+        (from any number of workers) can never claim the same helper twice; a failed second claim rolls the first one back
+        Helpers are ranked by responsiveness (connections they never replied in) & by when they last helped, which spreads the load
+        Requesters for whom nobody is free are put on a per-city waitlist & connected as soon as a matching helper frees up
+    """
+
+    def __init__(self, settings: Settings, collection_users: AsyncIOMotorCollection, collection_waitlist: AsyncIOMotorCollection,
+                 city_gazetteer: CityGazetteer, user_cache: Optional[MongodbUserCache] = None):
+        self.collection_users = collection_users
+        self.user_cache = user_cache
+        self.collection_waitlist = collection_waitlist
+        self.city_gazetteer = city_gazetteer
+        self.waitlist_ttl = timedelta(hours=settings.configs_app.helper_waitlist_ttl_hours)
+
+    async def create_indexes(self):
+        await self.collection_waitlist.create_index([('city_id', ASCENDING), ('created_at', ASCENDING)])
+        await self.collection_waitlist.create_index('expire_at', expireAfterSeconds=0)
+
+    async def connect(self, requestor: UserDto, city_id: str) -> Optional[UserDto]:
+        """
+        Overview:
+            Claims the best ranked free helper for the city & connects the requestor to them
+        Returns:
+            - helper: Optional[UserDto] (None if no helper is free or the requestor got connected concurrently)
+        """
+        helper_filter = {
+            'city_ids': city_id,
+            'connected_phone_number': None,
+            'phone_number': {'$ne': requestor.phone_number},
+            'deletion_date': {'$gt': datetime.now() + timedelta(days=OFFBOARDING_GRACE_DAYS)}
+        }
+        helper = await self._claim_pair(helper_filter, requestor, city_id)
+        metrics.counter('helper_match_requests_total', 'Requests to connect to a human helper', result='matched' if helper else 'unmatched').inc()
+        return helper
+
+    async def add_to_waitlist(self, requestor: UserDto, city_id: str) -> bool:
+        now = datetime.now()
+        try:
+            await self.collection_waitlist.update_one(
+                {'_id': requestor.phone_number},
+                {'$set': {'city_id': city_id, 'created_at': now, 'expire_at': now + self.waitlist_ttl}},
+                upsert=True
+            )
+            return True
+        except Exception as e:
+            logger.error(f'Could not add {requestor.phone_number} to the waitlist for {city_id}: {e}')
+            return False
+
+    async def connect_waitlisted(self, helper: UserDto) -> Optional[Tuple[UserDto, str]]:
+        """
+        Overview:
+            Connects a helper who just became available to the longest waiting requester for one of their cities
+        Returns:
+            - (requestor, city_id): Optional[Tuple[UserDto, str]]
+        """
+        while helper.city_ids:
+            entry = await self.collection_waitlist.find_one_and_delete(
+                {'city_id': {'$in': helper.city_ids}, '_id': {'$ne': helper.phone_number}},
+                sort=[('created_at', ASCENDING)]
+            )
+            if entry is None:
+                return None
+            requestor = await self.collection_users.find_one({'phone_number': entry['_id'], 'connected_phone_number': None},
+                                                             UserDto.projection(RATE_LIMITED_USER_FIELDS))  # only claimed & notified
+            if requestor is None:
+                continue  # requester got connected some other way (or left) in the meantime
+            requestor = UserDto.from_document(requestor, projected=True)
+            if await self._claim_pair({'phone_number': helper.phone_number, 'connected_phone_number': None}, requestor, entry['city_id']):
+                metrics.counter('helper_match_requests_total', 'Requests to connect to a human helper', result='waitlist_matched').inc()
+                return requestor, entry['city_id']
+            await self._put_back(entry)
+            return None  # the helper is no longer free
+        return None
+
+    async def disconnect(self, user: UserDto) -> Optional[UserDto]:
+        """
+        Overview:
+            Ends the connection of the user (if any) on both sides & removes the user from the waitlist
+        Returns:
+            - connected_user: Optional[UserDto] (the other side of the ended connection)
+        """
+        await self.collection_waitlist.delete_one({'_id': user.phone_number})
+        connection = await self._end_connection({'phone_number': user.phone_number})
+        return connection[1] if connection else None
+
+    async def expire_connection(self, phone_number: str, connected_before: datetime) -> Optional[Tuple[UserDto, Optional[UserDto]]]:
+        """
+        Overview:
+            Ends the connection of the user if it started before connected_before; a connection which was ended
+            (or ended & re-established) in the meantime is left alone, so concurrent schedulers expire a connection only once
+        Returns:
+            - (user, connected_user): Optional[Tuple[UserDto, Optional[UserDto]]]
+        """
+        return await self._end_connection({'phone_number': phone_number, 'connected_at': {'$lt': connected_before}})
+
+    async def _end_connection(self, user_filter: Dict) -> Optional[Tuple[UserDto, Optional[UserDto]]]:
+        """
+        Overview:
+            Clears both sides of the connection of the user matching user_filter in one update_many, with each side cross-checked
+            against the other, so a connection is never left half torn down; whoever clears a side notifies both users
+        Returns:
+            - (user, connected_user): Optional[Tuple[UserDto, Optional[UserDto]]] (connected_user is None if the other side
+              was no longer connected to the user)
+        """
+        before = await self.collection_users.find_one({**user_filter, 'connected_phone_number': {'$ne': None}})
+        if before is None:
+            return None
+        phone_number, connected_phone_number = before['phone_number'], before['connected_phone_number']
+        connected_before = await self.collection_users.find_one({'phone_number': connected_phone_number, 'connected_phone_number': phone_number})
+        result = await self.collection_users.update_many(
+            {'$or': [{**user_filter, 'connected_phone_number': connected_phone_number},
+                     {'phone_number': connected_phone_number, 'connected_phone_number': phone_number}]},
+            CONNECTION_CLEARED
+        )
+        if result.modified_count == 0:
+            return None  # ended concurrently
+        disconnected_users = []
+        for user_document in (before, connected_before):
+            if user_document is None:
+                disconnected_users.append(None)
+                continue
+            self._invalidate(user_document['phone_number'])
+            await self._record_missed_connection(user_document)
+            disconnected_user = UserDto.from_document(user_document)
+            disconnected_user.connected_phone_number, disconnected_user.connected_name = None, None
+            disconnected_user.connected_at, disconnected_user.connection_replied = None, None
+            disconnected_users.append(disconnected_user)
+        return disconnected_users[0], disconnected_users[1]
+
+    async def record_reply(self, user: UserDto):
+        """
+        Overview:
+            Marks that a helper answered in their current connection, which restores their responsiveness ranking
+        """
+        if user.connection_replied is False:
+            await self.collection_users.update_one({'phone_number': user.phone_number, 'connection_replied': False},
+                                                   {'$set': {'connection_replied': True, 'helper_missed_count': 0}})
+            self._invalidate(user.phone_number)
+            user.connection_replied = True
+
+    def get_connection_names(self, city_id: str) -> Tuple[str, str]:
+        """
+        Overview:
+            Returns the (helper, requester) labels; connected_name holds the label the other side sees before forwarded messages
+        """
+        city_name = self.city_gazetteer.get_name(city_id).upper()
+        return f'{city_name} HELPER', f'{city_name} HELP REQUESTOR'
+
+    async def _claim_pair(self, helper_filter: Dict, requestor: UserDto, city_id: str) -> Optional[UserDto]:
+        helper_name, requestor_name = self.get_connection_names(city_id)
+        now = datetime.now()
+        claim = {'connected_phone_number': requestor.phone_number, 'connected_name': helper_name, 'connected_at': now,
+                 'last_helped_at': now, 'connection_replied': False}
+        helper = await self.collection_users.find_one_and_update(  # pre-image, so a rollback can restore last_helped_at
+            helper_filter,
+            {'$set': claim},
+            sort=HELPER_RANKING,
+            return_document=ReturnDocument.BEFORE
+        )
+        if helper is None:
+            return None
+        self._invalidate(helper['phone_number'])
+        result = await self.collection_users.update_one(
+            {'phone_number': requestor.phone_number, 'connected_phone_number': None},
+            {'$set': {'connected_phone_number': helper['phone_number'], 'connected_name': requestor_name, 'connected_at': now}}
+        )
+        if result.matched_count == 0:
+            logger.warning(f'{requestor.phone_number} got connected concurrently - releasing helper {helper["phone_number"]}')
+            await self.collection_users.update_one({'phone_number': helper['phone_number'], 'connected_phone_number': requestor.phone_number},
+                                                   self._get_release_update(helper))
+            self._invalidate(helper['phone_number'])
+            return None
+        self._invalidate(requestor.phone_number)
+        await self.collection_waitlist.delete_one({'_id': requestor.phone_number})
+        return UserDto.from_document({**helper, **claim})
+
+    def _get_release_update(self, helper: Dict) -> Dict:
+        """
+        Overview:
+            Update undoing a claim of the helper (given its pre-image), so a released helper keeps their place in the ranking
+        """
+        release = {'$set': dict(CONNECTION_CLEARED['$set']), '$unset': dict(CONNECTION_CLEARED['$unset'])}
+        if helper.get('last_helped_at') is None:
+            release['$unset']['last_helped_at'] = ''
+        else:
+            release['$set']['last_helped_at'] = helper['last_helped_at']
+        return release
+
+    async def _record_missed_connection(self, user_document: Dict):
+        if user_document.get('connection_replied') is False:  # only set on the helper's side of a connection
+            await self.collection_users.update_one({'phone_number': user_document['phone_number']}, {'$inc': {'helper_missed_count': 1}})
+            self._invalidate(user_document['phone_number'])
+
+    def _invalidate(self, phone_number: str):
+        if self.user_cache:
+            self.user_cache.invalidate(phone_number)
+
+    async def _put_back(self, entry: Dict):
+        try:
+            await self.collection_waitlist.insert_one(entry)
+        except DuplicateKeyError:
+            pass  # the requester joined the waitlist again in the meantime
@@ -0,0 +1,66 @@
+from datetime import datetime, time
+
+from backend.dao.mongodb_service_quota import MongodbServiceQuota
+from backend.dto.user_dto import RATE_LIMIT_FIELDS, UserDto
+from backend.utils.generic import logger
+from backend.utils.rate_limiter import RateLimiter, RateLimitPolicy
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ReturnDocument
+
+# _id costs a few bytes but is needed by mongomock (the tests), which re-applies the filter to the post-image unless _id is projected
+RATE_LIMIT_PROJECTION = {**UserDto.projection(RATE_LIMIT_FIELDS), '_id': 1}
+
+
+class MongodbRateLimiter(RateLimiter):
+    """
+    Overview:
+        Rate limiter backed by the counters on the user documents
+        The check, the increment & the daily rollover are done by a conditional find_one_and_update so concurrent sms can't lose increments
+        A same day sms costs a single round trip; the first sms of a day (or a rejected one) costs a second one for the rollover
+        (a single pipeline update would need MongoDB 4.2+)
+        The service wide limit is delegated to the sharded service quota so that it is not a single hot document
+    """
+
+    def __init__(self, policy_user: RateLimitPolicy, policy_service: RateLimitPolicy, collection_users: AsyncIOMotorCollection,
+                 service_quota: MongodbServiceQuota):
+        super().__init__(policy_user, policy_service)
+        self.collection_users = collection_users
+        self.service_quota = service_quota
+
+    async def is_rate_limited(self, user: UserDto, policy: RateLimitPolicy) -> bool:
+        logger.info(f'Checking if user {user.phone_number} is rate limited..')
+        now = datetime.now()
+        start_of_day = datetime.combine(now.date(), time.min)
+        if self._is_recently_offboarded(user, now):
+            logger.info(f'User {user.phone_number} recently off-boarded from the system..')
+            self._record_rejection(policy, 'offboarded')
+            return True
+
+        counters = await self.collection_users.find_one_and_update(
+            {'phone_number': user.phone_number, 'time_last_sms': {'$gte': start_of_day}, 'sms_counter': {'$lt': policy.sms_allowed_per_day}},
+            {'$inc': {'sms_counter': 1}, '$set': {'time_last_sms': now}},
+            projection=RATE_LIMIT_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        if counters is None:
+            counters = await self.collection_users.find_one_and_update(  # first sms of the day resets the counter
+                {'phone_number': user.phone_number, '$or': [{'time_last_sms': {'$lt': start_of_day}}, {'time_last_sms': None}]},
+                {'$set': {'sms_counter': 1, 'time_last_sms': now}},
+                projection=RATE_LIMIT_PROJECTION,
+                return_document=ReturnDocument.AFTER
+            )
+
+        user_rate_limited = counters is None
+        if user_rate_limited:
+            logger.info(f'User {user.phone_number} rate limit reached for policy {policy}')
+            self._record_rejection(policy, 'limit_reached')
+            user.sms_counter = max(user.sms_counter, policy.sms_allowed_per_day)  # the user used up the limit for today
+        else:
+            user.sms_counter, user.time_last_sms = counters['sms_counter'], counters['time_last_sms']
+        return user_rate_limited
+
+    async def is_service_rate_limited(self) -> bool:
+        service_rate_limited = not await self.service_quota.try_consume()
+        if service_rate_limited:
+            self._record_rejection(self.policy_service, 'limit_reached')
+        return service_rate_limited
@@ -0,0 +1,73 @@
+import random
+import time
+from datetime import datetime, timedelta
+from math import ceil
+
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import errors
+
+
+class MongodbServiceQuota:
+    """
+    Overview:
+        Daily sms quota of the whole service spread over N shard documents (one document per shard per day)
+        Every shard may only be incremented up to its share of the quota so the global count overshoots by at most N-1 sms,
+        and a full shard just makes the caller move on to the next one
+        Concurrent sms land on random shards instead of serializing on the lock of a single document
+    """
+
+    def __init__(self, collection_service_counters: AsyncIOMotorCollection, sms_allowed_per_day: int, shards: int, count_cache_seconds: float):
+        self.collection_service_counters = collection_service_counters
+        self.sms_allowed_per_day = sms_allowed_per_day
+        self.shards = shards
+        self.shard_quota = ceil(sms_allowed_per_day / shards)
+        self.count_cache_seconds = count_cache_seconds
+        self._cached_count, self._time_cached_count = 0, float('-inf')
+        self._count_gauge = metrics.gauge('service_quota_sms_consumed', 'Sms consumed today from the daily service quota (all workers)')
+        metrics.gauge('service_quota_sms_allowed', 'Daily sms quota of the whole service').set(sms_allowed_per_day)
+        metrics.set_collector('service_quota', self._collect_count)
+
+    async def create_indexes(self):
+        await self.collection_service_counters.create_index('expire_at', expireAfterSeconds=0)
+
+    async def try_consume(self) -> bool:
+        """
+        Overview:
+            Consumes one sms from the quota of the day
+        Returns:
+            - is_consumed: bool (False once every shard has used up its share of the quota)
+        """
+        now = datetime.now()
+        day = now.date().isoformat()
+        first_shard = random.randrange(self.shards)
+        for i in range(self.shards):
+            shard = (first_shard + i) % self.shards
+            try:
+                await self.collection_service_counters.find_one_and_update(
+                    {'_id': f'{day}:{shard}', 'count': {'$lt': self.shard_quota}},
+                    {'$inc': {'count': 1}, '$setOnInsert': {'day': day, 'shard': shard, 'expire_at': now + timedelta(days=2)}},
+                    projection={'_id': 1},
+                    upsert=True
+                )
+                return True
+            except errors.DuplicateKeyError:
+                continue  # the shard exists but is full, so the upsert tried to insert it again
+        logger.info(f'Service quota of {self.sms_allowed_per_day} sms reached for {day}')
+        return False
+
+    async def get_current_count(self) -> int:
+        """
+        Overview:
+            Aggregate count of sms consumed today across all shards; cached for a few seconds since it is only used for reporting
+        """
+        if time.monotonic() - self._time_cached_count > self.count_cache_seconds:
+            pipeline = [{'$match': {'day': datetime.now().date().isoformat()}}, {'$group': {'_id': None, 'count': {'$sum': '$count'}}}]
+            result = await self.collection_service_counters.aggregate(pipeline).to_list(length=1)
+            self._cached_count = result[0]['count'] if result else 0
+            self._time_cached_count = time.monotonic()
+        return self._cached_count
+
+    async def _collect_count(self):
+        self._count_gauge.set(await self.get_current_count())
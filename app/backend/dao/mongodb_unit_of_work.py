@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from backend.dao.mongodb_dao import MongodbDao
+from backend.dto.user_dto import UserDto
+from backend.utils.exceptions import MongoDbUserNotFoundException
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+from pymongo import UpdateOne
+
+
+class MongodbUnitOfWork:
+    """
+    Overview:
+        Collects the plain field updates made to users while one sms is processed & writes them in a single bulk_write at the end
+        Updates are applied to the UserDto right away, so the rest of the request sees them; updates of the same user are merged
+        Writes which must be atomic & immediate (rate limit counters, matchmaking claims) don't go through here
+    """
+
+    def __init__(self, mongodb_dao: MongodbDao):
+        self.mongodb_dao = mongodb_dao
+        self.collection_users = mongodb_dao.collection_users
+        self.updates: Dict[str, Dict] = {}  # phone_number -> fields to $set
+
+    def stage(self, user: UserDto, fields: Dict):
+        self.updates.setdefault(user.phone_number, {}).update(fields)
+        for field, value in fields.items():
+            setattr(user, field, value)
+
+    def update_user_name(self, user: UserDto, name: str):
+        self.stage(user, {'name': name})
+
+    def update_user_cities(self, user: UserDto, cities: List[str]):
+        self.stage(user, self.mongodb_dao.get_cities_fields(cities))
+
+    def update_time_last_sms(self, user: UserDto, time_last_sms: datetime):
+        self.stage(user, {'time_last_sms': time_last_sms})
+
+    def delete_user(self, user: UserDto):
+        self.stage(user, {'deletion_date': datetime.now() + timedelta(days=1)})
+
+    async def flush(self) -> int:
+        """
+        Overview:
+            Writes all staged updates in one round trip; raises MongoDbUserNotFoundException (after the other users were
+            updated, like separate update_one calls would have) if any of the users does not exist
+        Returns:
+            - modified_count: int
+        """
+        if not self.updates:
+            return 0
+        updates, self.updates = self.updates, {}
+        operations = [UpdateOne({'phone_number': phone_number}, {'$set': fields}) for phone_number, fields in updates.items()]
+        result = await self.collection_users.bulk_write(operations, ordered=False)
+        self.mongodb_dao.invalidate_cached_users(*updates)
+        metrics.counter('user_updates_flushed_total', 'User updates written by the unit of work').inc(len(operations))
+        if result.matched_count < len(operations):
+            cursor = self.collection_users.find({'phone_number': {'$in': list(updates)}}, {'_id': 0, 'phone_number': 1})
+            found = {user['phone_number'] async for user in cursor}
+            missing = [phone_number for phone_number in updates if phone_number not in found]
+            logger.error(f'Could not update users which do not exist: {missing}')
+            raise MongoDbUserNotFoundException('User not found for the provided phone number.')
+        return result.modified_count
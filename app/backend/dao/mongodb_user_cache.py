@@ -0,0 +1,147 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from backend.dto.user_dto import RATE_LIMIT_FIELDS
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import OperationFailure, PyMongoError
+
+CHANGE_STREAMS_UNSUPPORTED_CODES = (40573, 40324)  # standalone server / pre 3.6 server (change streams need a replica set)
+WATCH_RETRY_SECONDS = 5
+
+
+class UserCacheEntry:
+    def __init__(self, document: Dict, expires_at: float):
+        self.document = document
+        self.expires_at = expires_at
+
+
+class MongodbUserCache:
+    """
+    Overview:
+        Process-level read-through LRU + TTL cache of user documents (keyed by phone number) in front of MongodbDao
+        Writes made by this process invalidate the written users right away; writes made by other workers are picked up
+        from a change stream on the users collection
+        Without change streams (standalone server) other workers' writes - e.g. a connection claimed or torn down by another worker -
+        would only be seen once the entry expired, so the cache disables itself & every read goes to MongoDB
+        Updates which touch only the rate limit counters are ignored, since the rate limiter refreshes those on the DTO on every check
+        Documents are returned as shallow copies so callers never share a mutable DTO
+    """
+
+    def __init__(self, collection_users: AsyncIOMotorCollection, ttl_seconds: float, max_entries: int):
+        self.collection_users = collection_users
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.version = 0  # bumped by every invalidation; a read started before one doesn't get cached
+        self.is_enabled = True  # false once change streams turned out to be unsupported
+        self._entries: OrderedDict[str, UserCacheEntry] = OrderedDict()  # least recently used first
+        self._phone_numbers: Dict[object, str] = {}  # _id -> phone number, change events only carry the _id
+        self._task: asyncio.Task = None
+        self._hits = metrics.counter('user_cache_requests_total', 'Lookups in the user cache', result='hit')
+        self._misses = metrics.counter('user_cache_requests_total', 'Lookups in the user cache', result='miss')
+
+    async def start(self):
+        """
+        Overview:
+            Checks that the deployment supports change streams before any user is served from the cache,
+            then keeps invalidating cached users from the change stream in the background
+        """
+        logger.info('Starting user cache invalidation from the users change stream..')
+        try:
+            async with self.collection_users.watch():
+                pass
+        except OperationFailure as e:
+            if e.code in CHANGE_STREAMS_UNSUPPORTED_CODES:
+                self._disable(e)
+                return
+        except PyMongoError:
+            pass  # _watch retries
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def get(self, phone_number: str) -> Optional[Dict]:
+        if not self.is_enabled:
+            return None
+        entry = self._entries.get(phone_number)
+        if entry is not None and entry.expires_at < time.monotonic():
+            self._remove(phone_number)
+            entry = None
+        if entry is None:
+            self._misses.inc()
+            return None
+        self._entries.move_to_end(phone_number)
+        self._hits.inc()
+        return dict(entry.document)
+
+    def put(self, document: Dict, version: int):
+        if not self.is_enabled or version != self.version:
+            return  # the user may have been written while it was being read
+        phone_number = document['phone_number']
+        self._entries[phone_number] = UserCacheEntry(dict(document), time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(phone_number)
+        self._phone_numbers[document['_id']] = phone_number
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, *phone_numbers: str):
+        self.version += 1
+        for phone_number in phone_numbers:
+            self._remove(phone_number)
+
+    def clear(self):
+        self.version += 1
+        self._entries.clear()
+        self._phone_numbers.clear()
+
+    def _remove(self, phone_number: str):
+        entry = self._entries.pop(phone_number, None)
+        if entry is not None:
+            self._phone_numbers.pop(entry.document['_id'], None)
+
+    async def _watch(self):
+        while True:
+            try:
+                async with self.collection_users.watch() as stream:
+                    self.clear()  # anything written before the stream was (re)opened may have been missed
+                    async for change in stream:
+                        self._on_change(change)
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED_CODES:
+                    self._disable(e)
+                    return
+                logger.error(f'User cache change stream failed, retrying: {e}')
+            except PyMongoError as e:
+                logger.error(f'User cache change stream failed, retrying: {e}')
+            self.clear()
+            await asyncio.sleep(WATCH_RETRY_SECONDS)
+
+    def _disable(self, error: OperationFailure):
+        logger.warning(f'Change streams are not supported by this deployment - disabling the user cache so that writes of other '
+                       f'workers are never missed: {error}')
+        self.is_enabled = False
+        self.clear()
+
+    def _on_change(self, change: Dict):
+        if change['operationType'] == 'update':
+            update = change['updateDescription']
+            if not update['removedFields'] and set(update['updatedFields']) <= set(RATE_LIMIT_FIELDS):
+                return
+        elif change['operationType'] == 'insert':
+            return  # the user can't be cached yet
+        elif change['operationType'] not in ('replace', 'delete'):
+            self.clear()  # drop / rename / invalidate
+            return
+        phone_number = self._phone_numbers.get(change['documentKey']['_id'])
+        if phone_number:
+            self.invalidate(phone_number)
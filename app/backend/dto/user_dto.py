@@ -1,19 +1,74 @@
 from datetime import datetime
+from typing import Dict, Iterable
+
+NOT_DELETED = datetime(2099, 12, 31, 23, 59, 59)  # deletion date of users who never off-boarded
+RATE_LIMIT_FIELDS = ('sms_counter', 'time_last_sms')  # the counters the rate limiter keeps on the user
+RATE_LIMITED_USER_FIELDS = ('phone_number', 'deletion_date') + RATE_LIMIT_FIELDS  # all a rate limit check needs of a user
 
 
 class UserDto:
-    def __init__(self, phone_number, name=None, cities_ca=None, time_last_sms=datetime.now(),
-                 sms_counter=0, deletion_date=datetime(2099, 12, 31, 23, 59, 59),
-                 connected_phone_number=None, connected_name=None, _id=None):
+    """
+    Overview:
+        A user document; slotted since one is built for every user read & cached / batched in bulk
+        from_document & to_document are the codec between the DTO and the BSON documents of the users collection; it is not a
+        registered pymongo TypeCodec since type codecs only convert values inside documents (a TypeDecoder can't decode a whole
+        document into a DTO) and mongomock, which the tests run the DAOs against, does not support custom type registries
+        DTOs read with a projection only have the projected fields set; reading any other field raises AttributeError
+    """
+
+    __slots__ = ('phone_number', 'name', 'cities_ca', 'city_ids', 'time_last_sms', 'sms_counter', 'deletion_date',
+                 'connected_phone_number', 'connected_name', 'connected_at', 'last_helped_at', 'helper_missed_count',
+                 'connection_replied', '_id')
+
+    def __init__(self, phone_number, name=None, cities_ca=None, city_ids=None, time_last_sms=None,
+                 sms_counter=0, deletion_date=NOT_DELETED,
+                 connected_phone_number=None, connected_name=None, connected_at=None, last_helped_at=None, helper_missed_count=0,
+                 connection_replied=None, _id=None):
         self.phone_number = phone_number
         self.name = name
         self.cities_ca = cities_ca
-        self.time_last_sms = time_last_sms
+        self.city_ids = city_ids  # canonical ids of cities_ca (see CityGazetteer), used for matching helpers
+        self.time_last_sms = time_last_sms if time_last_sms is not None else datetime.now()
         self.sms_counter = sms_counter
         self.deletion_date = deletion_date
         self.connected_phone_number = connected_phone_number
         self.connected_name = connected_name
+        self.connected_at = connected_at  # start of the current connection; connections expire after connection_expiry_hours
+        self.last_helped_at = last_helped_at
+        self.helper_missed_count = helper_missed_count  # connections in a row the user (as a helper) never replied in
+        self.connection_replied = connection_replied  # only set on the helper's side of a connection
         self._id = _id
 
+    @classmethod
+    def from_document(cls, document: Dict, projected: bool = False) -> 'UserDto':
+        """
+        Overview:
+            Decodes a user document; fields missing from a full document (e.g. older users) get their defaults,
+            while a document read with a projection only sets the fields it has
+        """
+        if not projected:
+            return cls(**{field: value for field, value in document.items() if field in cls.__slots__})
+        user = cls.__new__(cls)
+        for field, value in document.items():
+            if field in cls.__slots__:
+                setattr(user, field, value)
+        return user
+
+    def to_document(self) -> Dict:
+        """
+        Overview:
+            Encodes the (set) fields into a new document; _id is left out until MongoDB assigned one
+        """
+        document = {field: getattr(self, field) for field in self.__slots__ if hasattr(self, field)}
+        if document.get('_id') is None:
+            document.pop('_id', None)
+        return document
+
+    @staticmethod
+    def projection(fields: Iterable[str]) -> Dict:
+        projection = {field: 1 for field in fields}
+        projection.setdefault('_id', 0)
+        return projection
+
     def __str__(self):
-        return str(vars(self))
+        return str(self.to_document())
@@ -0,0 +1,171 @@
+from typing import (Awaitable, Callable, Dict, List, Optional, Sequence, Set,
+                    Tuple)
+
+import tiktoken
+from backend.dao.mongodb_chat_history import (SUMMARIZED_UNTIL_KEY,
+                                              SUMMARY_KEY,
+                                              MongodbChatMessageHistory,
+                                              MongodbChatSummaryStore)
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+from backend.utils.settings_accumalator import Settings
+from backend.utils.task_pool import BackgroundTaskPool
+from bson import ObjectId
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, SystemMessage
+
+TOKENS_PER_MESSAGE = 4  # role & separators added by the chat completion format
+CHARS_PER_TOKEN = 4  # rough estimate used if the tokenizer can't be loaded
+DEFAULT_ENCODING = 'cl100k_base'
+
+
+class ChatHistoryWindow:
+    """
+    Overview:
+        Resolves the chat history of a session as a bounded window: the most recent messages which fit in a token budget,
+        preceded by a rolling summary of everything older
+        Summaries are stored in MongoDB and folded forward in the background once messages drop out of the window,
+        so the prompt size stays bounded no matter how long a user has been chatting
+    """
+
+    def __init__(self, settings: Settings, get_session_history: Callable[[str], BaseChatMessageHistory],
+                 summarize: Callable[[str, List[BaseMessage]], Awaitable[str]], summary_store: Optional[MongodbChatSummaryStore] = None,
+                 task_pool: Optional[BackgroundTaskPool] = None):
+        self.get_base_session_history = get_session_history
+        self.summarize = summarize  # (previous summary, messages to fold in) -> new summary
+        self.summary_store = summary_store
+        self.task_pool = task_pool
+        self.max_messages = settings.configs_app.chat_history_max_messages
+        self.max_tokens = settings.configs_app.chat_history_max_tokens
+        self.summary_batch_messages = settings.configs_app.chat_summary_batch_messages
+        self.encoding = self._get_encoding(settings.configs_app.openai_model)
+        self._sessions_summarizing: Set[str] = set()
+
+    def get_session_history(self, session_id: str) -> BaseChatMessageHistory:
+        return WindowedChatMessageHistory(self, self.get_base_session_history(session_id), session_id)
+
+    def count_tokens(self, message: BaseMessage) -> int:
+        content = str(message.content)
+        if self.encoding is None:
+            return TOKENS_PER_MESSAGE + len(content) // CHARS_PER_TOKEN
+        return TOKENS_PER_MESSAGE + len(self.encoding.encode(content))
+
+    def schedule_summary(self, history: MongodbChatMessageHistory, session_id: str, before_id: ObjectId):
+        if self.summary_store is None or self.task_pool is None or session_id in self._sessions_summarizing:
+            return
+        self._sessions_summarizing.add(session_id)
+        if not self.task_pool.submit(self._update_summary, history, session_id, before_id):
+            self._sessions_summarizing.discard(session_id)
+
+    async def _update_summary(self, history: MongodbChatMessageHistory, session_id: str, before_id: ObjectId):
+        """
+        Overview:
+            Folds the messages older than before_id (i.e. no longer in the window) into the stored summary, one batch at a time
+        """
+        try:
+            while True:
+                summary_document = await self.summary_store.get_summary(session_id) or {}
+                summarized_until = summary_document.get(SUMMARIZED_UNTIL_KEY)
+                messages = await history.aget_messages_between(summarized_until, before_id, self.summary_batch_messages)
+                if not messages:
+                    return
+                summary = await self.summarize(summary_document.get(SUMMARY_KEY, ''), [message for _, message in messages])
+                if not await self.summary_store.update_summary(session_id, summary, messages[-1][0], summarized_until):
+                    return  # another worker advanced the summary
+                metrics.counter('chat_summary_updates_total', 'Rolling chat summaries updated in the background').inc()
+                logger.info(f'Folded {len(messages)} messages into the chat summary of {session_id}')
+        finally:
+            self._sessions_summarizing.discard(session_id)
+
+    def _get_encoding(self, model: str):
+        try:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                return tiktoken.get_encoding(DEFAULT_ENCODING)
+        except Exception as e:  # the encoding files are downloaded on first use
+            logger.warning(f'Could not load tokenizer for {model}, estimating tokens from characters instead: {e}')
+            return None
+
+
+class WindowedChatMessageHistory(BaseChatMessageHistory):
+    """
+    Overview:
+        Chat history handed to the LangChain chains; reads are windowed & summarized, writes go to the underlying history
+    """
+
+    def __init__(self, window: ChatHistoryWindow, history: BaseChatMessageHistory, session_id: str):
+        self.window = window
+        self.history = history
+        self.session_id = session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """
+        Overview:
+            Blocking counterpart of aget_messages for callers outside the event loop; it does not schedule summary updates
+        """
+        if not isinstance(self.history, MongodbChatMessageHistory):
+            return self._trim(self.history.messages)
+        summary_document = None
+        if self.window.summary_store is not None:
+            summary_document = self.window.summary_store.get_summary_sync(self.session_id)
+        return self._get_window(self.history.get_recent_messages(self.window.max_messages), summary_document, schedule_summary=False)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.history.add_messages(messages)
+
+    def clear(self) -> None:
+        self.history.clear()
+        if self.window.summary_store is not None:
+            self.window.summary_store.delete_summary_sync(self.session_id)
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        with metrics.time_stage('chat_history_load'):
+            return await self._aget_messages()
+
+    async def _aget_messages(self) -> List[BaseMessage]:
+        if not isinstance(self.history, MongodbChatMessageHistory):
+            return self._trim(await self.history.aget_messages())
+        recent_messages = await self.history.aget_recent_messages(self.window.max_messages)
+        summary_document = None
+        if self.window.summary_store is not None:
+            summary_document = await self.window.summary_store.get_summary(self.session_id)
+        return self._get_window(recent_messages, summary_document, schedule_summary=True)
+
+    def _get_window(self, recent_messages: List[Tuple[ObjectId, BaseMessage]], summary_document: Optional[Dict],
+                    schedule_summary: bool) -> List[BaseMessage]:
+        messages = self._trim([message for _, message in recent_messages])
+        has_older_messages = len(messages) < len(recent_messages) or len(recent_messages) == self.window.max_messages
+        if schedule_summary and has_older_messages and messages:
+            index = len(recent_messages) - len(messages)
+            oldest_id = recent_messages[index][0]
+            newest_older_id = recent_messages[index - 1][0] if index else None  # unknown if the whole window fits the budget
+            if summary_document is None or newest_older_id is None or summary_document[SUMMARIZED_UNTIL_KEY] < newest_older_id:
+                self.window.schedule_summary(self.history, self.session_id, oldest_id)
+        metrics.counter('chat_history_messages_total', 'Chat history messages sent to the llm').inc(len(messages))
+        if summary_document:
+            messages = [SystemMessage(content=f'Summary of the earlier conversation: {summary_document[SUMMARY_KEY]}')] + messages
+        return messages
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with metrics.time_stage('chat_history_write'):
+            await self.history.aadd_messages(messages)
+
+    async def aclear(self) -> None:
+        await self.history.aclear()
+        if self.window.summary_store is not None:
+            await self.window.summary_store.delete_summary(self.session_id)
+
+    def _trim(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Overview:
+            Keeps the newest messages (at most max_messages) whose tokens add up to at most max_tokens
+        """
+        kept, tokens = [], 0
+        for message in reversed(messages[-self.window.max_messages:]):
+            tokens += self.window.count_tokens(message)
+            if tokens > self.window.max_tokens:
+                break
+            kept.append(message)
+        return kept[::-1]
@@ -1,53 +1,118 @@
 import sys
-from typing import Dict
+from typing import Callable, Dict, List
 
+from backend.dao.mongodb_chat_history import MongodbChatSummaryStore
+from backend.langchain.chat_history_window import ChatHistoryWindow
+from backend.langchain.question_condenser import QuestionCondenser
+from backend.langchain.retrieval_index import RetrievalIndex
+from backend.langchain.semantic_cache import SemanticAnswerCache
+from backend.langchain.token_usage import TokenUsageCallbackHandler
 from backend.utils.generic import logger
+from backend.utils.metrics import metrics
 from backend.utils.settings_accumalator import Settings
-from langchain_community.document_loaders import DirectoryLoader
-from langchain_community.vectorstores import Chroma
+from backend.utils.task_pool import BackgroundTaskPool
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import BaseMessage, get_buffer_string
 from langchain_core.messages.ai import AIMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_mongodb.chat_message_histories import MongoDBChatMessageHistory
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 __import__('pysqlite3')
 
+RETRIEVER_K = 4  # number of chunks to retrieve
+ANSWER_SYSTEM_PROMPT = "You are a text message bot called pidge. You will help you plan their next trip to any city in California." + \
+    "Always be concise in your answers. Always reply in 50 words or less. Only answer questions related to travel and nothing else." + \
+    "You will first try to answer the user's questions based on the below context:\n\n{context}"
+
+
+def create_embeddings(settings: Settings) -> Embeddings:
+    return OpenAIEmbeddings(openai_api_key=settings.secrets_openai.api_key, model=settings.configs_app.openai_embedding_model)
+
+
+def _use_pysqlite3():
+    if 'pysqlite3' in sys.modules:
+        sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')  # https://docs.trychroma.com/troubleshooting#sqlite
+
 
 class LangchainClient:
 
-    def __init__(self, settings: Settings):
+    def __init__(self, settings: Settings, get_session_history: Callable[[str], BaseChatMessageHistory],
+                 chat_summary_store: MongodbChatSummaryStore = None, task_pool: BackgroundTaskPool = None,
+                 is_retrieval_index_shared: bool = False):
         self.settings = settings
+        self.is_retrieval_index_shared = is_retrieval_index_shared  # synced by the parent process (see sync_shared_retrieval_index)
+        # resolves the (token budgeted & summarized) chat history of a session (user phone number)
+        self.history_window = ChatHistoryWindow(settings, get_session_history, self._summarize_history, chat_summary_store, task_pool)
+        self.get_session_history = self.history_window.get_session_history
+        self.retrieval_index: RetrievalIndex = None
+        self.semantic_cache = self._init_semantic_cache()
         self.chat = self._init_llm_chat()
+        self.embeddings = self._init_embeddings()
         self.retriever = self._init_retriever()
         self.prompt_get_updated_user_question = self._create_prompt_get_updated_user_question()
         self.prompt_answer_user_question = self._create_prompt_answer_user_question()
+        self.prompt_answer_standalone_question = self._create_prompt_answer_standalone_question()
         self.prompt_admin = self._create_prompt_admin()
+        self.chain_summary = self._create_prompt_summary() | self.chat | StrOutputParser()
+        self.chain_user = self._create_chain_user()
+        self.chain_admin = self._create_chain_admin()
 
     def _init_llm_chat(self):
         logger.info('Initializing OpenAI chat..')
         chat = ChatOpenAI(
             openai_api_key=self.settings.secrets_openai.api_key,
             model=self.settings.configs_app.openai_model,
-            temperature=self.settings.configs_app.openai_temperature
+            temperature=self.settings.configs_app.openai_temperature,
+            callbacks=[TokenUsageCallbackHandler()]
         )
         return chat
 
+    def _init_semantic_cache(self) -> SemanticAnswerCache:
+        if not self.settings.configs_app.semantic_cache_enabled:
+            return None
+        logger.info('Initializing semantic answer cache..')
+        return SemanticAnswerCache(
+            similarity_threshold=self.settings.configs_app.semantic_cache_similarity_threshold,
+            ttl_seconds=self.settings.configs_app.semantic_cache_ttl_seconds,
+            max_entries=self.settings.configs_app.semantic_cache_max_entries
+        )
+
+    def _init_embeddings(self) -> Embeddings:
+        return create_embeddings(self.settings)
+
     def _init_retriever(self):
         logger.info('Initializing retriever for RAG..')
-        sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')  # https://docs.trychroma.com/troubleshooting#sqlite
-        loader = DirectoryLoader(f'{self.settings.configs_app.langchain_retrieval_docs_dir}')
-        data = loader.load()
-        logger.info(f'Loaded {len(data)} retrieval documents for LangChain')
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=0)
-        all_splits = text_splitter.split_documents(data)
-        # FIXME: consider hardcoding embedding model
-        vectorstore = Chroma.from_documents(documents=all_splits, embedding=OpenAIEmbeddings(openai_api_key=self.settings.secrets_openai.api_key))
-        retriever = vectorstore.as_retriever(k=4)  # k is the number of chunks to retrieve
-        return retriever
+        _use_pysqlite3()
+        self.retrieval_index = RetrievalIndex(self.settings, self.embeddings, self.settings.configs_app.openai_embedding_model)
+        self.sync_retrieval_index()
+        return self.retrieval_index.as_retriever(k=RETRIEVER_K)
+
+    def sync_retrieval_index(self):
+        """
+        Overview:
+            Syncs the retrieval index with the docs (or only opens it if it is shared); cached answers are dropped
+            if the docs changed since they were generated
+        """
+        manifest = self.retrieval_index.load_manifest() if self.is_retrieval_index_shared else self.retrieval_index.sync()
+        if self.semantic_cache:
+            self.semantic_cache.invalidate(manifest['fingerprint'])
+
+    @staticmethod
+    def sync_shared_retrieval_index(settings: Settings) -> Dict:
+        """
+        Overview:
+            Syncs the retrieval index once before the worker processes start, so they don't all embed & write the same index;
+            the workers then open it read-only (is_retrieval_index_shared) and share the persisted files through the page cache
+        Returns:
+            - manifest: Dict
+        """
+        _use_pysqlite3()
+        return RetrievalIndex(settings, create_embeddings(settings), settings.configs_app.openai_embedding_model).sync()
 
     def _create_prompt_get_updated_user_question(self):
         logger.info('Creating prompt to update user question based on chat history..')
@@ -68,15 +133,26 @@ class LangchainClient:
         logger.info('Creating prompt to answer user question based on chat history & context..')
         return ChatPromptTemplate.from_messages(
             [
-                ("system",
-                 "You are a text message bot called pidge. You will help you plan their next trip to any city in California." +
-                 "Always be concise in your answers. Always reply in 50 words or less. Only answer questions related to travel and nothing else." +
-                 "You will first try to answer the user's questions based on the below context:\n\n{context}"),
+                ("system", ANSWER_SYSTEM_PROMPT),
                 MessagesPlaceholder(variable_name="history"),
                 ("human", "{question}"),
             ]
         )
 
+    def _create_prompt_answer_standalone_question(self):
+        """
+        Overview:
+            Answers the standalone question from the context only; the answers are shared across users through the semantic cache,
+            so they must not depend on (and leak) the chat history of the user who asked first
+        """
+        logger.info('Creating prompt to answer standalone question based on context..')
+        return ChatPromptTemplate.from_messages(
+            [
+                ("system", ANSWER_SYSTEM_PROMPT),
+                ("human", "{standalone_question}"),
+            ]
+        )
+
     def _create_prompt_admin(self):
         logger.info('Creating admin prompt to fetch the name of the user')
         return ChatPromptTemplate.from_messages(
@@ -87,49 +163,123 @@ class LangchainClient:
             ]
         )
 
+    def _create_prompt_summary(self):
+        logger.info('Creating prompt to summarize older chat history..')
+        return ChatPromptTemplate.from_messages(
+            [
+                ("system",
+                 "Progressively summarize the conversation between a user and a travel assistant bot. " +
+                 "Extend the current summary with the new lines and return only the new summary in 100 words or less. " +
+                 "Always keep the user's name, the cities they can help with & the trips they are planning."),
+                ("human", "Current summary:\n{summary}\n\nNew lines of conversation:\n{new_lines}"),
+            ]
+        )
+
     def _parse_retriever_input(self, params: Dict):
         return params["question"]
 
+    def _format_docs(self, docs: List[Document]) -> str:
+        return "\n\n".join([d.page_content for d in docs])
+
     """
-    This method tries to answer the user question via following steps:
-        1. passes user question, chat history & prompt to chat agent which will generate an updated user question
-        2. passes updated user question to a vector store containing ALL docs to fetch only relevant (similar) docs (forming context for question)
-        3. passes context (retrieved doc chunks), user question, chat history & prompt to chat agent which will generate answer
+    This chain tries to answer the user question via following steps:
+        1. passes user question, chat history & prompt to chat agent which will generate an updated (standalone) user question
+           (skipped if the question does not refer back to the chat history & memoized by recent history + question)
+        2. looks up the embedding of the standalone question in the semantic cache & returns the cached answer of a near-identical question
+        3. passes updated user question to a vector store containing ALL docs to fetch only relevant (similar) docs (forming context for question)
+        4. passes context (retrieved doc chunks), user question, chat history & prompt to chat agent which will generate answer
+           (answers going into the semantic cache get only the context & standalone question so that they are not personal;
+           hence only questions which were condensed against the history - or asked without any history - are cacheable)
     """
 
-    def get_user_chat_response(self, chat_history: MongoDBChatMessageHistory, phone_number: str, query: str) -> AIMessage:
+    def _create_chain_user(self) -> RunnableWithMessageHistory:
+        logger.info('Creating RAG chain to answer user questions..')
 
-        # binds the doc retrieval prompt for retrieving relevant docs to a chat agent
+        # binds the doc retrieval prompt for retrieving relevant docs to a chat agent (skipped / memoized where possible)
         chain_updated_user_question = self.prompt_get_updated_user_question | self.chat | StrOutputParser()
-
-        # generates context by passing doc retrieval prompt & all docs to chat agent to fetch only relevant docs (based on question & chat history)
-        chain_doc_retriever = RunnablePassthrough.assign(context=chain_updated_user_question | self.retriever |
-                                                         (lambda docs: "\n\n".join([d.page_content for d in docs])))
+        self.question_condenser = QuestionCondenser(
+            chain_updated_user_question,
+            skip_enabled=self.settings.configs_app.condense_question_skip_enabled,
+            min_history_messages=self.settings.configs_app.condense_question_min_history_messages,
+            history_tail_messages=self.settings.configs_app.condense_question_history_tail_messages,
+            memo_max_entries=self.settings.configs_app.condense_question_memo_max_entries
+        )
 
         # binds the retrieved relevant docs (context) & the user q&a prompt to a chat agent
-        chain_rag = (chain_doc_retriever | self.prompt_answer_user_question | self.chat | StrOutputParser())
+        self.chain_answer_user_question = self.prompt_answer_user_question | self.chat | StrOutputParser()
+        self.chain_answer_standalone_question = self.prompt_answer_standalone_question | self.chat | StrOutputParser()
+
+        # answers the standalone question from the semantic cache or via retrieval & the q&a chain
+        chain_rag = RunnableLambda(self._condense_user_question) | RunnableLambda(self._answer_user_question)
 
-        chain_rag_with_history = RunnableWithMessageHistory(
+        return RunnableWithMessageHistory(
             chain_rag,
-            lambda session_id: chat_history,
+            self.get_session_history,
             input_messages_key="question",
             history_messages_key="history",
         )
 
-        config = {"configurable": {"session_id": phone_number}}
-        response = chain_rag_with_history.invoke({"question": query}, config=config)
-        logger.info(f'query: {query}; langchain_answer: {response}')
-        return response
-
-    def get_admin_chat_response(self, chat_history: MongoDBChatMessageHistory, phone_number: str, query: str):
+    def _create_chain_admin(self) -> RunnableWithMessageHistory:
+        logger.info('Creating admin chain..')
         chain_admin_chat = self.prompt_admin | self.chat | StrOutputParser()
-        chain_chat_with_history = RunnableWithMessageHistory(
+        return RunnableWithMessageHistory(
             chain_admin_chat,
-            lambda session_id: chat_history,
+            self.get_session_history,
             input_messages_key="question",
             history_messages_key="history"
         )
+
+    async def _condense_user_question(self, params: Dict, config: RunnableConfig) -> Dict:
+        with metrics.time_stage('condense_question'):
+            standalone_question, is_condensed = await self.question_condenser.condense(params["question"], params["history"], config=config)
+        return {**params, "standalone_question": standalone_question, "is_condensed": is_condensed}
+
+    async def _answer_user_question(self, params: Dict, config: RunnableConfig) -> str:
+        standalone_question = params["standalone_question"]
+        # a question passed through as is (e.g. "Where should I stay overnight?") may still rely on the history it is answered with
+        is_cacheable = params["is_condensed"] or not params["history"]
+        use_cache = self.semantic_cache is not None and params.get("use_cache", True) and is_cacheable
+        if not use_cache:
+            with metrics.time_stage('retrieval'):
+                docs = await self.retriever.ainvoke(standalone_question, config=config)
+            with metrics.time_stage('answer_llm'):
+                return await self.chain_answer_user_question.ainvoke({**params, "context": self._format_docs(docs)}, config=config)
+
+        with metrics.time_stage('embed_question'):
+            embedding = await self.embeddings.aembed_query(standalone_question)
+        with metrics.time_stage('semantic_cache_lookup'):
+            answer = self.semantic_cache.get(embedding)
+        if answer is None:
+            with metrics.time_stage('retrieval'):
+                docs = await self._retrieve_by_vector(standalone_question, embedding, config)
+            with metrics.time_stage('answer_llm'):
+                answer = await self.chain_answer_standalone_question.ainvoke(
+                    {"standalone_question": standalone_question, "context": self._format_docs(docs)}, config=config)
+            self.semantic_cache.put(embedding, standalone_question, answer)
+        return answer
+
+    async def _retrieve_by_vector(self, question: str, embedding: List[float], config: RunnableConfig) -> List[Document]:
+        if self.retrieval_index is None:
+            return await self.retriever.ainvoke(question, config=config)
+        # reuses the embedding computed for the cache lookup instead of embedding the question a second time
+        return await self.retrieval_index.vectorstore.asimilarity_search_by_vector(embedding, k=RETRIEVER_K)
+
+    async def _summarize_history(self, summary: str, messages: List[BaseMessage]) -> str:
+        return await self.chain_summary.ainvoke({"summary": summary or 'None', "new_lines": get_buffer_string(messages)})
+
+    async def get_user_chat_response(self, phone_number: str, query: str, use_cache: bool = True) -> AIMessage:
+        """
+        Overview:
+            Answers the user query; use_cache=False bypasses the semantic cache for queries carrying personal details
+        """
+        config = {"configurable": {"session_id": phone_number}}
+        response = await self.chain_user.ainvoke({"question": query, "use_cache": use_cache}, config=config)
+        logger.info(f'query: {query}; langchain_answer: {response}')
+        return response
+
+    async def get_admin_chat_response(self, phone_number: str, query: str):
         config = {"configurable": {"session_id": phone_number}}
-        response = chain_chat_with_history.invoke({"question": query}, config=config)
+        with metrics.time_stage('admin_llm'):
+            response = await self.chain_admin.ainvoke({"question": query}, config=config)
         logger.info(f'query: {query}; langchain_answer: {response}')
         return response
@@ -0,0 +1,71 @@
+import re
+from collections import OrderedDict
+from typing import List, Tuple
+
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+# words which (usually) refer back to something said earlier in the conversation
+REFERENCE_WORDS = {
+    'it', 'its', 'they', 'them', 'their', 'theirs', 'there', 'that', 'those', 'this', 'these', 'he', 'him', 'his',
+    'she', 'her', 'hers', 'one', 'ones', 'same', 'also', 'too', 'else', 'another', 'other', 'again', 'more', 'then', 'former', 'latter'
+}
+MIN_SELF_CONTAINED_WORDS = 4  # very short follow-ups ("and parking?") are usually elliptical
+CONDENSED_RESULTS = ('llm', 'memo_hit')  # results where the question was rephrased against the history
+WORD_PATTERN = re.compile(r"[a-z']+")
+
+
+class QuestionCondenser:
+    """
+    Overview:
+        Turns a follow-up user question into a standalone question using the condense (rephrase) chain
+        The llm round-trip is skipped when there is (almost) no history or the question does not refer back to it,
+        and rephrased questions are memoized by (history tail, question)
+    """
+
+    def __init__(self, chain_condense: Runnable, skip_enabled: bool, min_history_messages: int, history_tail_messages: int, memo_max_entries: int):
+        self.chain_condense = chain_condense
+        self.skip_enabled = skip_enabled
+        self.min_history_messages = min_history_messages
+        self.history_tail_messages = history_tail_messages
+        self.memo_max_entries = memo_max_entries
+        self._memo: OrderedDict[Tuple, str] = OrderedDict()
+
+    async def condense(self, question: str, history: List[BaseMessage], config: RunnableConfig = None) -> Tuple[str, bool]:
+        """
+        Returns:
+            - standalone_question: str
+            - is_condensed: bool (False if the question was passed through without looking at the history)
+        """
+        if self.skip_enabled:
+            if len(history) < self.min_history_messages:
+                return self._observe('skipped_short_history', question)
+            if self._is_self_contained(question):
+                return self._observe('skipped_self_contained', question)
+
+        key = self._get_memo_key(question, history)
+        standalone_question = self._memo.get(key)
+        if standalone_question is not None:
+            self._memo.move_to_end(key)
+            return self._observe('memo_hit', standalone_question)
+
+        standalone_question = await self.chain_condense.ainvoke({'question': question, 'history': history}, config=config)
+        self._memo[key] = standalone_question
+        if len(self._memo) > self.memo_max_entries:
+            self._memo.popitem(last=False)
+        logger.info(f'Condensed question: {question} -> {standalone_question}')
+        return self._observe('llm', standalone_question)
+
+    def _is_self_contained(self, question: str) -> bool:
+        words = WORD_PATTERN.findall(question.lower())
+        return len(words) >= MIN_SELF_CONTAINED_WORDS and REFERENCE_WORDS.isdisjoint(words)
+
+    def _get_memo_key(self, question: str, history: List[BaseMessage]) -> Tuple:
+        history_tail = history[-self.history_tail_messages:] if self.history_tail_messages else []
+        return tuple((message.type, message.content) for message in history_tail), question.strip().lower()
+
+    def _observe(self, result: str, standalone_question: str) -> Tuple[str, bool]:
+        metrics.counter('condense_question_total', 'Condense-question stage outcomes; anything but llm is an avoided llm call', result=result).inc()
+        return standalone_question, result in CONDENSED_RESULTS
@@ -0,0 +1,99 @@
+from datetime import datetime
+from hashlib import sha256
+from os import makedirs, path
+from typing import Dict, List
+
+from backend.utils.generic import create_json, logger, read_json
+from backend.utils.settings_accumalator import Settings
+from langchain_community.document_loaders import DirectoryLoader
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 0
+EMBEDDING_BATCH_SIZE = 500
+MANIFEST_FILE_NAME = 'manifest.json'
+
+
+class RetrievalIndex:
+    """
+    Overview:
+        Persistent (on-disk) Chroma index over the retrieval docs where every chunk is keyed by the hash of its content
+        On startup only new / changed chunks are embedded & chunks which no longer exist in the docs are removed
+        With several worker processes the index is synced once before they start and the workers only open it (load_manifest)
+        The collection name is derived from the embedding model & splitter params so changing either builds a fresh index
+    """
+
+    def __init__(self, settings: Settings, embeddings: Embeddings, embedding_model: str):
+        self.docs_dir = settings.configs_app.langchain_retrieval_docs_dir
+        self.persist_dir = settings.configs_app.langchain_vectorstore_dir
+        self.manifest_file = path.join(self.persist_dir, MANIFEST_FILE_NAME)
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        self.collection_name = self._get_collection_name(embedding_model)
+        makedirs(self.persist_dir, exist_ok=True)
+        self.vectorstore = Chroma(collection_name=self.collection_name, embedding_function=embeddings, persist_directory=self.persist_dir)
+        self.manifest: Dict = {}
+
+    def sync(self) -> Dict:
+        """
+        Overview:
+            Brings the persisted index in line with the retrieval docs and writes a manifest of what was reused vs. embedded
+        Returns:
+            - manifest: Dict
+        """
+        chunks = self._load_chunks()
+        existing_ids = set(self.vectorstore.get(include=[])['ids'])
+        new_ids = [chunk_id for chunk_id in chunks if chunk_id not in existing_ids]
+        stale_ids = list(existing_ids - chunks.keys())
+
+        for i in range(0, len(new_ids), EMBEDDING_BATCH_SIZE):
+            batch_ids = new_ids[i:i + EMBEDDING_BATCH_SIZE]
+            self.vectorstore.add_documents([chunks[chunk_id] for chunk_id in batch_ids], ids=batch_ids)
+        if stale_ids:
+            self.vectorstore.delete(ids=stale_ids)
+
+        self.manifest = {
+            'collection': self.collection_name,
+            'fingerprint': sha256('\n'.join(sorted(chunks)).encode()).hexdigest(),
+            'chunks': len(chunks),
+            'reused': len(chunks) - len(new_ids),
+            'embedded': len(new_ids),
+            'deleted': len(stale_ids),
+            'synced_at': datetime.now().isoformat()
+        }
+        create_json(self.manifest_file, self.manifest)
+        logger.info(f'Retrieval index synced: {self.manifest}')
+        return self.manifest
+
+    def load_manifest(self) -> Dict:
+        """
+        Overview:
+            Reads the manifest written by the last sync, for processes sharing an index synced by another process
+        Returns:
+            - manifest: Dict
+        """
+        self.manifest = read_json(self.manifest_file)
+        logger.info(f'Opened shared retrieval index: {self.manifest}')
+        return self.manifest
+
+    def as_retriever(self, k: int = 4):
+        return self.vectorstore.as_retriever(search_kwargs={'k': k})  # k is the number of chunks to retrieve
+
+    def _load_documents(self) -> List[Document]:
+        loader = DirectoryLoader(f'{self.docs_dir}')
+        data = loader.load()
+        logger.info(f'Loaded {len(data)} retrieval documents for LangChain')
+        return data
+
+    def _load_chunks(self) -> Dict[str, Document]:
+        all_splits: List[Document] = self.text_splitter.split_documents(self._load_documents())
+        return {self._hash_chunk(chunk): chunk for chunk in all_splits}  # identical chunks collapse to a single embedding
+
+    def _hash_chunk(self, chunk: Document) -> str:
+        return sha256(chunk.page_content.encode()).hexdigest()
+
+    def _get_collection_name(self, embedding_model: str) -> str:
+        index_params = f'{embedding_model}:{CHUNK_SIZE}:{CHUNK_OVERLAP}'
+        return f'retrieval_docs_{sha256(index_params.encode()).hexdigest()[:16]}'
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import List, Optional
+
+import numpy as np
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+
+
+class SemanticCacheEntry:
+    def __init__(self, question: str, answer: str, expires_at: float):
+        self.question = question
+        self.answer = answer
+        self.expires_at = expires_at
+
+
+class SemanticAnswerCache:
+    """
+    Overview:
+        In-process cache of answers keyed by the embedding of the standalone (rephrased) question
+        A lookup returns the answer of the nearest cached question if its cosine similarity is above the threshold
+        Entries expire after a TTL, the least recently used entry is evicted once the cache is full
+        and the whole cache is invalidated when the fingerprint of the retrieval docs changes
+        Answers are shared by all users, so only answers generated without any chat history may be put in the cache
+    """
+
+    def __init__(self, similarity_threshold: float, ttl_seconds: float, max_entries: int):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.fingerprint: Optional[str] = None
+        self._entries: OrderedDict[int, SemanticCacheEntry] = OrderedDict()  # least recently used first
+        self._vectors = {}  # entry id -> normalized embedding
+        self._matrix, self._matrix_ids = None, []  # stacked vectors, rebuilt lazily after writes
+        self._ids = count()
+        self._hits = metrics.counter('semantic_cache_requests_total', 'Lookups in the semantic answer cache', result='hit')
+        self._misses = metrics.counter('semantic_cache_requests_total', 'Lookups in the semantic answer cache', result='miss')
+
+    def get(self, embedding: List[float]) -> Optional[str]:
+        self._evict_expired()
+        answer = None
+        if self._entries:
+            if self._matrix is None:
+                self._matrix_ids = list(self._vectors)
+                self._matrix = np.stack([self._vectors[entry_id] for entry_id in self._matrix_ids])
+            similarities = self._matrix @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity_threshold:
+                entry_id = self._matrix_ids[best]
+                self._entries.move_to_end(entry_id)
+                answer = self._entries[entry_id].answer
+                logger.info(f'Semantic cache hit ({similarities[best]:0.3f}) for question: {self._entries[entry_id].question}')
+        (self._hits if answer is not None else self._misses).inc()
+        return answer
+
+    def put(self, embedding: List[float], question: str, answer: str):
+        entry_id = next(self._ids)
+        self._entries[entry_id] = SemanticCacheEntry(question, answer, time.monotonic() + self.ttl_seconds)
+        self._vectors[entry_id] = self._normalize(embedding)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        self._matrix = None
+
+    def invalidate(self, fingerprint: Optional[str] = None):
+        """
+        Overview:
+            Clears the cache if the retrieval docs changed (or unconditionally if no fingerprint is given)
+        """
+        if fingerprint is None or fingerprint != self.fingerprint:
+            logger.info(f'Invalidating semantic cache with {len(self._entries)} entries')
+            self._entries.clear()
+            self._vectors.clear()
+            self._matrix = None
+            self.fingerprint = fingerprint
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired_ids = [entry_id for entry_id, entry in self._entries.items() if entry.expires_at <= now]
+        for entry_id in expired_ids:
+            self._remove(entry_id)
+        if expired_ids:
+            self._matrix = None
+
+    def _remove(self, entry_id: int):
+        del self._entries[entry_id]
+        del self._vectors[entry_id]
+
+    def _normalize(self, embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,25 @@
+from typing import Any
+
+from backend.utils.metrics import metrics
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+TOKEN_TYPES = {'prompt_tokens': 'prompt', 'completion_tokens': 'completion'}
+
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+    """
+    Overview:
+        Counts the tokens reported by every chat completion into llm_tokens_total; run inline on the event loop thread
+    """
+
+    run_inline = True
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        llm_output = response.llm_output or {}
+        model = llm_output.get('model_name', 'unknown')
+        metrics.counter('llm_requests_total', 'Chat completion requests', model=model).inc()
+        token_usage = llm_output.get('token_usage') or {}
+        for usage_key, token_type in TOKEN_TYPES.items():
+            if token_usage.get(usage_key):
+                metrics.counter('llm_tokens_total', 'Tokens used by chat completions', model=model, type=token_type).inc(token_usage[usage_key])
@@ -1,159 +1,131 @@
-import json
 import logging
+import random
 import time
-from typing import Callable
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl
 from uuid import uuid4
 
-from fastapi import FastAPI, Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import Message
+from backend.utils.diagnostics import SlowRequestLog
+from backend.utils.metrics import metrics
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+REQUEST_ID_HEADER = b'x-api-request-id'  # maps each request-response to a unique ID
+REDACTED = '[REDACTED]'
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
 
-class RouterLoggingMiddleware(BaseHTTPMiddleware):
+
+class RouterLoggingMiddleware:
     """
     Overview:
-        The BaseHTTPMiddleware class provides a basic structure for creating middleware in FastAPI
-        It has a dispatch method which responsible for handling the flow of incoming requests and outgoing responses
-        The dispatch method takes in two arguments: request and call_next
-            request contains information about the incoming request such as the headers, query parameters, and the body
-            call_next is a callable that will pass the request on to the next middleware in the stack or to the final endpoint handler
-    Reference: https://medium.com/@dhavalsavalia/fastapi-logging-middleware-logging-requests-and-responses-with-ease-and-style-201b9aa4001a
+        Pure ASGI middleware which logs one line per (sampled) request with the request & response details
+        It taps the receive / send channels as the messages pass through instead of buffering & re-wrapping the bodies,
+        keeping at most max_body_bytes of each body; skip_body_paths / skip_body_prefixes (e.g. the home page & static files)
+        have no body captured at all
+        Headers listed in redacted_headers (e.g. the basic auth credentials) are never logged
+        Failed requests (5xx / exceptions) are always logged regardless of sample_rate
+        Every response carries an X-API-Request-ID header; the id is also available to the app as request.state.request_id
+        If a slow_request_log is given, every request is traced into it under its request id
     """
 
-    def __init__(self, app: FastAPI, *, logger: logging.Logger) -> None:
+    def __init__(self, app: ASGIApp, *, logger: logging.Logger, sample_rate: float = 1.0, max_body_bytes: int = 2048,
+                 redacted_headers: Iterable[str] = ('authorization', 'cookie', 'set-cookie'), skip_body_paths: Iterable[str] = (),
+                 skip_body_prefixes: Iterable[str] = (), slow_request_log: Optional[SlowRequestLog] = None):
+        self.app = app
         self._logger = logger
-        super().__init__(app)
-
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        request_id: str = str(uuid4())
-        logging_dict = {'X-API-REQUEST-ID': request_id}  # X-API-REQUEST-ID maps each request-response to a unique ID
-
-        await self.set_body(request)
-        response, response_dict = await self._log_response(call_next, request, request_id)
-        request_dict = await self._log_request(request)
-        logging_dict["request"] = request_dict
-        logging_dict["response"] = response_dict
-
-        self._logger.info(logging_dict)
-
-        return response
-
-    async def set_body(self, request: Request):
-        """
-        Overview:
-            Avails the response body to be logged within a middleware as it is generally not a standard practice
-        Arguments:
-            - request: Request
-        Returns:
-            - receive_: Receive
-        """
-        receive_ = await request._receive()
-        async def receive() -> Message: return receive_
-        request._receive = receive
-
-    async def _log_request(self, request: Request) -> str:
-        """
-        Arguments:
-            - request: Request
-        """
-        path = request.url.path
-        if request.query_params:
-            path += f"?{request.query_params}"
-
-        request_logging = {
-            "method": request.method,
-            "path": path,
-            "ip": request.client.host,
-            "headers": request.headers
-        }
-
-        try:
-            body = await request.form()
-            request_logging["data"] = body
-        except BaseException:
-            body = None
-
-        return request_logging
-
-    async def _log_response(self, call_next: Callable, request: Request, request_id: str) -> Response:
-        """
-        Arguments:
-            - call_next: Callable (To execute the actual path function and get response back)
-            - request: Request
-            - request_id: str (uuid)
-        Returns:
-            - response: Response
-            - response_logging: str
-        """
+        self.sample_rate = sample_rate
+        self.max_body_bytes = max_body_bytes
+        self.redacted_headers = {header.lower().encode() for header in redacted_headers}
+        self.skip_body_paths = set(skip_body_paths)
+        self.skip_body_prefixes = tuple(skip_body_prefixes)
+        self.slow_request_log = slow_request_log
+        self.requests_in_flight = metrics.gauge('http_requests_in_flight', 'Http requests being processed')
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = str(uuid4())
+        scope.setdefault('state', {})['request_id'] = request_id
+        is_sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        is_body_captured = is_sampled and self.max_body_bytes > 0 and not self._is_body_skipped(scope['path'])
+        request_body, response_body = bytearray(), bytearray()
+        response_start: Optional[Message] = None
+
+        async def receive_tapped() -> Message:
+            message = await receive()
+            if message['type'] == 'http.request':
+                self._capture(request_body, message.get('body', b''))
+            return message
+
+        async def send_tapped(message: Message):
+            nonlocal response_start
+            if message['type'] == 'http.response.start':
+                response_start = message
+                message['headers'] = [*message.get('headers', []), (REQUEST_ID_HEADER, request_id.encode())]
+            elif message['type'] == 'http.response.body' and is_body_captured:
+                self._capture(response_body, message.get('body', b''))
+            await send(message)
 
         start_time = time.perf_counter()
-        response = await self._execute_request(call_next, request, request_id)
-        finish_time = time.perf_counter()
-
-        overall_status = "successful" if response.status_code < 400 else "failed"
-        execution_time = finish_time - start_time
-
-        response_logging = {
-            "status": overall_status,
-            "status_code": response.status_code,
-            "headers": response.headers,
-            "time_taken": f"{execution_time:0.4f}s"
-        }
-
-        resp_body = [section async for section in response.__dict__["body_iterator"]]
-        response.__setattr__("body_iterator", AsyncIteratorWrapper(resp_body))
-
+        trace = self.slow_request_log.begin(request_id, f'{scope["method"]} {scope["path"]}') if self.slow_request_log else None
+        self.requests_in_flight.inc()
         try:
-            resp_body = json.loads(resp_body[0].decode())
-        except BaseException:
-            resp_body = str(resp_body)
-
-        response_logging["body"] = resp_body
-
-        return response, response_logging
-
-    async def _execute_request(self, call_next: Callable, request: Request, request_id: str) -> Response:
-        """
-        Overview:
-            Executes the actual path function using call_next; it also injects "X-API-Request-ID" header to the response
-        Arguments:
-            - call_next: Callable (To execute the actual path function and get response back)
-            - request: Request
-            - request_id: str (uuid)
-        Returns:
-            - response: Response
-        """
-        try:
-            response: Response = await call_next(request)
-            response.headers["X-API-Request-ID"] = request_id
-            return response
+            await self.app(scope, receive_tapped if is_body_captured else receive, send_tapped)
         except Exception as e:
-            self._logger.exception(
-                {
-                    "path": request.url.path,
-                    "method": request.method,
-                    "reason": e
+            self._logger.exception({'X-API-REQUEST-ID': request_id, 'path': scope['path'], 'method': scope['method'], 'reason': e})
+            raise
+        finally:
+            self.requests_in_flight.dec()
+            if trace:
+                self.slow_request_log.finish(trace, response_start['status'] if response_start else 500)
+        execution_time = time.perf_counter() - start_time
+
+        status_code = response_start['status'] if response_start else 500
+        if is_sampled or status_code >= 500:
+            self._logger.info({
+                'X-API-REQUEST-ID': request_id,
+                'request': self._get_request_logging(scope, request_body if is_body_captured else None),
+                'response': {
+                    'status': 'successful' if status_code < 400 else 'failed',
+                    'status_code': status_code,
+                    'headers': self._redact(response_start['headers'] if response_start else []),
+                    'time_taken': f'{execution_time:0.4f}s',
+                    'body': self._decode(response_body) if is_body_captured else None
                 }
-            )
+            })
 
+    def _is_body_skipped(self, path: str) -> bool:
+        return path in self.skip_body_paths or path.startswith(self.skip_body_prefixes)
 
-class AsyncIteratorWrapper:
-    """
-    Overview:
-        Transforms a regular iterable to an asynchronous one.
-    Link:
-        https://www.python.org/dev/peps/pep-0492/#example-2
-    """
+    def _capture(self, captured: bytearray, chunk: bytes):
+        remaining = self.max_body_bytes - len(captured)
+        if remaining > 0 and chunk:
+            captured += chunk[:remaining]
 
-    def __init__(self, obj):
-        self._it = iter(obj)
+    def _get_request_logging(self, scope: Scope, body: Optional[bytearray]) -> Dict:
+        path = scope['path']
+        if scope.get('query_string'):
+            path += f'?{scope["query_string"].decode("latin-1")}'
+        headers = scope.get('headers', [])
+        request_logging = {
+            'method': scope['method'],
+            'path': path,
+            'ip': scope['client'][0] if scope.get('client') else None,
+            'headers': self._redact(headers)
+        }
+        if body:
+            content_type = next((value.decode('latin-1') for name, value in headers if name == b'content-type'), '')
+            if content_type.startswith(FORM_CONTENT_TYPE):
+                request_logging['data'] = dict(parse_qsl(body.decode('utf-8', 'replace')))  # a capped body may cut the last field short
+            else:
+                request_logging['data'] = self._decode(body)
+        return request_logging
 
-    def __aiter__(self):
-        return self
+    def _redact(self, headers: List[Tuple[bytes, bytes]]) -> Dict[str, str]:
+        return {name.decode('latin-1'): REDACTED if name.lower() in self.redacted_headers else value.decode('latin-1')
+                for name, value in headers}
 
-    async def __anext__(self):
-        try:
-            value = next(self._it)
-        except StopIteration:
-            raise StopAsyncIteration
-        return value
+    def _decode(self, body: bytearray) -> str:
+        text = body.decode('utf-8', 'replace')
+        return text + '...' if len(body) >= self.max_body_bytes else text
@@ -1,20 +1,41 @@
+import time
+
 from backend.dao.mongodb_dao import MongodbDao
+from backend.dao.mongodb_matchmaker import MongodbMatchmaker
 from backend.langchain.llm_client import LangchainClient
-from backend.twilio.incoming_sms import IncomingSms
+from backend.twilio.incoming_sms import FALLBACK_REPLY, IncomingSms
+from backend.twilio.outgoing_sms_queue import OutgoingSmsQueue
+from backend.utils.diagnostics import SlowRequestLog
 from backend.utils.generic import logger
+from backend.utils.metrics import PROMETHEUS_CONTENT_TYPE, metrics
+from backend.utils.rate_limiter import RateLimiter
 from backend.utils.settings_accumalator import Settings
+from backend.utils.task_pool import BackgroundTaskPool
 from fastapi import (APIRouter, Depends, HTTPException, Request, Security,
                      responses, status)
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.templating import Jinja2Templates
 from starlette.datastructures import FormData
 from twilio.request_validator import RequestValidator
-from twilio.rest import Client as TwilioClient
+from twilio.twiml.messaging_response import MessagingResponse
+
+SMS_REPLY_MODE_INLINE = 'inline'
+SMS_REPLY_MODE_DEFERRED = 'deferred'
+REPLY_OUTCOME_OK = 'ok'
+REPLY_OUTCOME_ERROR = 'error'
+LATENCY_METRIC_DESCRIPTIONS = {
+    'sms_webhook_latency_seconds': 'Time taken to respond to the Twilio webhook',
+    'sms_reply_latency_seconds': 'Time taken from receiving an sms to having its reply ready'
+}
 
 
 class Routes():
-    def __init__(self, settings: Settings, mongodb_dao: MongodbDao, twilio_client: TwilioClient, langchain_client: LangchainClient):
+    def __init__(self, settings: Settings, mongodb_dao: MongodbDao, outgoing_sms_queue: OutgoingSmsQueue, langchain_client: LangchainClient,
+                 rate_limiter: RateLimiter, matchmaker: MongodbMatchmaker, task_pool: BackgroundTaskPool, slow_request_log: SlowRequestLog):
         self.settings = settings
+        self.outgoing_sms_queue = outgoing_sms_queue
+        self.task_pool = task_pool
+        self.slow_request_log = slow_request_log
         self.router = APIRouter()
         self.templates = Jinja2Templates(directory=self.settings.configs_app.web_templates_dir)
 
@@ -22,17 +43,62 @@ class Routes():
         async def get_home(request: Request):
             return self.templates.TemplateResponse(self.settings.configs_app.web_template_home_file_name, {'request': request})
 
-        @self.router.post(self.settings.configs_app.web_route_sms, dependencies=[Depends(self._authorize)])
-        async def receive_sms(request: Request):  # FIXME: check all dependencies are async or get rid of this
-            form = await request.form()
-            self.validate_twilio_signature(request, form)
+        @self.router.post(self.settings.configs_app.web_route_sms, dependencies=[Depends(self.authorize)])
+        async def receive_sms(request: Request):
+            start_time = time.perf_counter()
+            with metrics.time_stage('parse_form'):
+                form = await request.form()
+            with metrics.time_stage('validate_signature'):
+                self.validate_twilio_signature(request, form)
             sms_from, sms_body = form.get('From'), form.get('Body')
             logger.info(f'Recieved sms from {sms_from} with body: {sms_body}')
-            incoming_sms = IncomingSms(settings, mongodb_dao, twilio_client, langchain_client, sms_from, sms_body)
-            response = incoming_sms.get_response()
+            incoming_sms = IncomingSms(settings, mongodb_dao, outgoing_sms_queue, langchain_client, rate_limiter, matchmaker, sms_from,
+                                       sms_body)
+            if self.settings.configs_app.sms_reply_mode == SMS_REPLY_MODE_DEFERRED and \
+                    self.task_pool.submit(self._reply_deferred, incoming_sms, start_time, request.state.request_id):
+                reply_mode, response = SMS_REPLY_MODE_DEFERRED, str(MessagingResponse())  # acknowledge right away; reply is sent via REST
+            else:
+                reply_mode = SMS_REPLY_MODE_INLINE
+                try:
+                    response = await incoming_sms.get_response()
+                except Exception:
+                    self._observe_latency('sms_reply_latency_seconds', reply_mode, start_time, outcome=REPLY_OUTCOME_ERROR)
+                    raise
+                self._observe_latency('sms_reply_latency_seconds', reply_mode, start_time, outcome=REPLY_OUTCOME_OK)
+            self._observe_latency('sms_webhook_latency_seconds', reply_mode, start_time)
             return responses.PlainTextResponse(content=response, media_type="text/xml")
 
-    def _authorize(self, credentials: HTTPBasicCredentials = Security(HTTPBasic(auto_error=False))):
+        @self.router.get(self.settings.configs_app.web_route_metrics, dependencies=[Depends(self.authorize)])
+        async def get_metrics():
+            await metrics.collect()
+            return responses.PlainTextResponse(content=metrics.render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    async def _reply_deferred(self, incoming_sms: IncomingSms, start_time: float, request_id: str):
+        """
+        Overview:
+            Sends the reply via the outgoing sms queue; Twilio was already acknowledged with an empty response,
+            so if processing the sms fails the user gets FALLBACK_REPLY instead of no reply at all
+        """
+        trace = self.slow_request_log.begin(request_id, 'deferred reply')  # the webhook's own trace has finished by now
+        outcome = REPLY_OUTCOME_OK
+        try:
+            try:
+                message = await incoming_sms.get_reply()
+            except Exception as e:
+                logger.error(f'Failed to process sms from {incoming_sms.sms_from}, sending fallback reply: {repr(e)}')
+                message, outcome = FALLBACK_REPLY, REPLY_OUTCOME_ERROR
+            if message.strip():
+                await self.outgoing_sms_queue.enqueue(incoming_sms.sms_from, message)
+        finally:
+            self.slow_request_log.finish(trace)
+        self._observe_latency('sms_reply_latency_seconds', SMS_REPLY_MODE_DEFERRED, start_time, outcome=outcome)
+
+    def _observe_latency(self, metric_name: str, reply_mode: str, start_time: float, **labels):
+        latency = time.perf_counter() - start_time
+        metrics.histogram(metric_name, LATENCY_METRIC_DESCRIPTIONS[metric_name], mode=reply_mode, **labels).observe(latency)
+        logger.debug(f'{metric_name} ({reply_mode}): {latency:0.4f}s')
+
+    async def authorize(self, credentials: HTTPBasicCredentials = Security(HTTPBasic(auto_error=False))):
         incoming_username = credentials.username if credentials else ''
         incoming_password = credentials.password if credentials else ''
         expected_username = self.settings.secrets_app.app_username
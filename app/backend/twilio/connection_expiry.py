@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from backend.dao.mongodb_matchmaker import MongodbMatchmaker
+from backend.twilio.outgoing_sms_queue import OutgoingSmsQueue
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+from backend.utils.settings_accumalator import Settings
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING
+
+CONNECTION_EXPIRED_RESPONSE = 'Your connection with another user on our service has expired after 24 hours.\n\n' + \
+    'You\'re back to texting with your helpful AI, Pidge! 🪶 To chat with a human again, reply with "pidge human <city>".'
+
+
+class ConnectionExpiryScheduler:
+    """
+    Overview:
+        Background task which ends human connections older than connection_expiry_hours & notifies both users via the sms queue
+        Expired connections are found by a range query on the indexed connected_at field, a batch at a time
+        Each connection is ended through a conditional update so schedulers running in several workers expire it only once
+        Connections made before connected_at existed need it backfilled to ever expire (jobs.backfill_connected_at)
+    """
+
+    def __init__(self, settings: Settings, collection_users: AsyncIOMotorCollection, matchmaker: MongodbMatchmaker,
+                 outgoing_sms_queue: OutgoingSmsQueue):
+        configs_app = settings.configs_app
+        self.collection_users = collection_users
+        self.matchmaker = matchmaker
+        self.outgoing_sms_queue = outgoing_sms_queue
+        self.connection_ttl = timedelta(hours=configs_app.connection_expiry_hours)
+        self.poll_interval_seconds = configs_app.connection_expiry_poll_interval_seconds
+        self.batch_size = configs_app.connection_expiry_batch_size
+        self._task: asyncio.Task = None
+        self._is_stopping = asyncio.Event()
+
+    def start(self):
+        logger.info('Starting connection expiry scheduler..')
+        self._is_stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout_seconds: float = 10):
+        logger.info('Stopping connection expiry scheduler..')
+        self._is_stopping.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout_seconds)
+            except asyncio.TimeoutError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        while not self._is_stopping.is_set():
+            try:
+                expired_count = await self.expire_connections()
+                if expired_count == self.batch_size:
+                    continue  # there may be more expired connections; don't wait for the next poll
+            except Exception as e:
+                logger.exception(f'Connection expiry run failed: {e}')
+            try:
+                await asyncio.wait_for(self._is_stopping.wait(), timeout=self.poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def expire_connections(self) -> int:
+        """
+        Overview:
+            Ends a batch of expired connections
+        Returns:
+            - expired_count: int (number of expired users found in the batch)
+        """
+        connected_before = datetime.now() - self.connection_ttl
+        cursor = self.collection_users.find({'connected_at': {'$lt': connected_before}}, {'_id': 0, 'phone_number': 1}) \
+            .sort('connected_at', ASCENDING).limit(self.batch_size)
+        phone_numbers = [user['phone_number'] async for user in cursor]
+        for phone_number in phone_numbers:
+            connection = await self.matchmaker.expire_connection(phone_number, connected_before)
+            if connection is None:
+                continue  # already ended (e.g. as the other side of a connection earlier in this batch)
+            disconnected_users = [user for user in connection if user is not None]
+            for user in disconnected_users:
+                await self.outgoing_sms_queue.enqueue(user.phone_number, CONNECTION_EXPIRED_RESPONSE)
+            metrics.counter('connections_expired_total', 'Human connections ended by the expiry scheduler').inc()
+            logger.info(f'Expired connection of {" & ".join(user.phone_number for user in disconnected_users)}')
+        return len(phone_numbers)
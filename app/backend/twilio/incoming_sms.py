@@ -1,89 +1,124 @@
 from typing import List
 
 from backend.dao.mongodb_dao import MongodbDao
-from backend.dao.mongodb_langchain_dao import (MongoDBChatMessageHistory,
-                                               MongodbLangchainDao)
-from backend.dto.user_dto import UserDto
+from backend.dao.mongodb_langchain_dao import MongodbLangchainDao
+from backend.dao.mongodb_matchmaker import MongodbMatchmaker
+from backend.dao.mongodb_unit_of_work import MongodbUnitOfWork
+from backend.dto.user_dto import RATE_LIMITED_USER_FIELDS, UserDto
 from backend.langchain.llm_client import LangchainClient
-from backend.twilio.outgoing_sms import send_sms
+from backend.twilio.outgoing_sms_queue import OutgoingSmsQueue
 from backend.utils.exceptions import MongoDbUserNotFoundException
 from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+from backend.utils.rate_limiter import RateLimiter
 from backend.utils.settings_accumalator import Settings
-from twilio.rest import Client as TwilioClient
 from twilio.twiml.messaging_response import MessagingResponse
 
-SERVICE_NAME = 'Pigeon'
-SERVICE_PHONE_NUMBER = '+00000000000'
-SMS_ALLOWED_PER_DAY_FOR_SERVICE = 1000
-SMS_ALLOWED_PER_DAY_PER_USER = 50
+FALLBACK_REPLY = 'Pidge could not answer your previous SMS - try again after some time.'  # sent when processing an sms failed
 
 
 class IncomingSms:
-    def __init__(self, settings: Settings, mongodb_dao: MongodbDao, twilio_client: TwilioClient, langchain_client: LangchainClient,
-                 sms_from: str, sms_body: str):
-        self.twilio_client = twilio_client
-        self.sending_number = settings.secrets_twilio.sending_number
+    def __init__(self, settings: Settings, mongodb_dao: MongodbDao, outgoing_sms_queue: OutgoingSmsQueue, langchain_client: LangchainClient,
+                 rate_limiter: RateLimiter, matchmaker: MongodbMatchmaker, sms_from: str, sms_body: str):
+        self.settings = settings
+        self.outgoing_sms_queue = outgoing_sms_queue
         self.sms_from = sms_from
         self.sms_body = sms_body[:1599]
         self.is_user_onboarded = True
         self.mongodb_dao: MongodbDao = mongodb_dao
-        self.pigeon = self._get_user_from_db(SERVICE_PHONE_NUMBER, SERVICE_NAME)
-        self.user: UserDto = self._get_user_from_db(self.sms_from)
+        self.unit_of_work = MongodbUnitOfWork(mongodb_dao)  # user updates are flushed once the reply is ready
+        self.user: UserDto = None
+        self.is_user_name_known = False
+        self.are_user_cities_known = False
+        self.mongodb_langchain_dao: MongodbLangchainDao = MongodbLangchainDao(settings, mongodb_dao.mongodb_client, sms_from)
+        self.langchain_client = langchain_client
+        self.rate_limiter = rate_limiter
+        self.matchmaker = matchmaker
+        self.sms_allowed_per_day_per_user = rate_limiter.policy_user.sms_allowed_per_day
+
+    async def _load(self):
+        """
+        Overview:
+            Fetches (or on-boards) the sending user
+            Kept out of __init__ since all DB calls are coroutines
+        """
+        self.user = await self._get_user_from_db(self.sms_from)
         self.is_user_name_known = self.user.name is not None
         self.are_user_cities_known = self.user.cities_ca is not None
-        self.mongodb_langchain_dao: MongodbLangchainDao = MongodbLangchainDao(settings, sms_from)
-        self.langchain_client = langchain_client
 
-    def get_response(self) -> str:
-        message, response = '', MessagingResponse()
-        is_service_rate_limited = self.mongodb_dao.is_user_rate_limited(self.pigeon, SMS_ALLOWED_PER_DAY_FOR_SERVICE)
-        is_user_rate_limited = self.mongodb_dao.is_user_rate_limited(self.user, SMS_ALLOWED_PER_DAY_PER_USER)
-        if not is_service_rate_limited and not is_user_rate_limited:
-            chat_history = self.mongodb_langchain_dao.chat_history
-            message = self._process_admin_commands(response, chat_history)
-            if not message:
-                if not self.user.connected_phone_number:
-                    if not self.is_user_onboarded:
-                        message = self._get_new_user_onboarding_response()
-                        self.mongodb_langchain_dao.update_user_message(self.sms_body)
-                        self.mongodb_langchain_dao.update_ai_message(message)
+    async def get_response(self) -> str:
+        """
+        Overview:
+            Processes the sms and returns the reply as TwiML (to be returned inline to the Twilio webhook)
+        """
+        response = MessagingResponse()
+        response.message(await self.get_reply())
+        return str(response)
+
+    async def get_reply(self) -> str:
+        """
+        Overview:
+            Processes the sms and returns the plain text reply (empty if there is nothing to reply with)
+        """
+        with metrics.time_stage('load_user'):
+            await self._load()
+        message = ''
+        try:
+            with metrics.time_stage('rate_limit'):
+                is_service_rate_limited = await self.rate_limiter.is_service_rate_limited()
+                is_user_rate_limited = await self.rate_limiter.is_rate_limited(self.user, self.rate_limiter.policy_user)
+            if not is_service_rate_limited and not is_user_rate_limited:
+                message = await self._process_admin_commands()
+                if not message:
+                    if not self.user.connected_phone_number:
+                        if not self.is_user_onboarded:
+                            message = self._get_new_user_onboarding_response()
+                            await self.mongodb_langchain_dao.update_user_message(self.sms_body)
+                            await self.mongodb_langchain_dao.update_ai_message(message)
+                        else:
+                            use_cache = self.is_user_name_known and self.are_user_cities_known  # name / cities replies must reach the llm
+                            message = await self.langchain_client.get_user_chat_response(self.sms_from, self.sms_body, use_cache=use_cache)
+                            if not self.is_user_name_known:
+                                message = await self._get_user_name_response()
+                            elif not self.are_user_cities_known:
+                                message = await self._get_user_cities_response()
                     else:
-                        message = self.langchain_client.get_user_chat_response(chat_history, self.sms_from, self.sms_body)
-                        if not self.is_user_name_known:
-                            message = self._get_user_name_response()
-                        elif not self.are_user_cities_known:
-                            message = self._get_user_cities_response()
+                        with metrics.time_stage('load_connected_user'):
+                            connected_user: UserDto = await self.mongodb_dao.get_user_by_phone_number(self.user.connected_phone_number,
+                                                                                               RATE_LIMITED_USER_FIELDS)
+                        body = f'[{self.user.connected_name}]:\n\n {self.sms_body}'
+                        is_sms_failed_response = await self._send_sms_connected_user(connected_user, body)
+                        if is_sms_failed_response:
+                            message = is_sms_failed_response
+                        else:
+                            await self.matchmaker.record_reply(self.user)
                 else:
-                    connected_user: UserDto = self.mongodb_dao.get_user_by_phone_number(self.user.connected_phone_number)
-                    body = f'[{self.user.connected_name}]:\n\n {self.sms_body}'
-                    is_sms_failed_response = self._send_sms_connected_user(connected_user, body)
-                    if is_sms_failed_response:
-                        message = is_sms_failed_response
+                    logger.warn(f'Detected admin command from user with phone number {self.sms_from} and processed it')
             else:
-                logger.warn(f'Detected admin command from user with phone number {self.sms_from} and processed it')
-        else:
-            logger.warn(f'Rate limit reached - not sending reply')
+                logger.warn(f'Rate limit reached - not sending reply')
+        finally:
+            with metrics.time_stage('flush_user_updates'):
+                await self.unit_of_work.flush()
         message += self._get_message_trailer()
-        response.message(message[:1599])
-        return str(response)
+        return message[:1599]
 
-    def _get_user_from_db(self, phone_number: str, name: str = None) -> UserDto:
+    async def _get_user_from_db(self, phone_number: str, name: str = None) -> UserDto:
         user = None
         try:
-            user = self.mongodb_dao.get_user_by_phone_number(phone_number)
+            user = await self.mongodb_dao.get_user_by_phone_number(phone_number)
             logger.info(f'User with phone number {phone_number} fetched from DB')
         except MongoDbUserNotFoundException as e:
             logger.info(f'User does not exist in DB; adding the user to the DB..')
-            user = self._add_new_user_to_db(phone_number, name)
+            user = await self._add_new_user_to_db(phone_number, name)
         except Exception as e:
             logger.error(f'Error while fetching user from DB: {str(e)}')
         finally:
             return user
 
-    def _add_new_user_to_db(self, phone_number: str, name: str = None) -> UserDto:
+    async def _add_new_user_to_db(self, phone_number: str, name: str = None) -> UserDto:
         user_dto = UserDto(phone_number=phone_number, name=name)
         try:
-            inserted_id = self.mongodb_dao.insert_user(user_dto)
+            inserted_id = await self.mongodb_dao.insert_user(user_dto)
             logger.info(f'New user with phone number {phone_number} inserted in DB with ID: {inserted_id}')
             self.is_user_onboarded = False
             return user_dto
@@ -93,7 +128,7 @@ class IncomingSms:
         finally:
             return user_dto
 
-    def _process_admin_commands(self, response: MessagingResponse, chat_history: MongoDBChatMessageHistory) -> bool:
+    async def _process_admin_commands(self) -> str:
         is_admin_command_invalid = False
         admin_command_response = ''
         sms_body_list = self.sms_body.lower().split(' ')
@@ -106,25 +141,25 @@ class IncomingSms:
                 elif command == 'name':
                     new_name = ' '.join(sms_body_list[2:])
                     if new_name:
-                        admin_command_response = self._handle_admin_command_name(new_name, chat_history)
+                        admin_command_response = await self._handle_admin_command_name(new_name)
                     else:
                         is_admin_command_invalid = True
                 elif command == 'cities':
                     new_cities = ' '.join(sms_body_list[2:])
                     if new_cities:
-                        admin_command_response = self._handle_admin_command_cities(new_cities, chat_history)
+                        admin_command_response = await self._handle_admin_command_cities(new_cities)
                     else:
                         is_admin_command_invalid = True
                 elif command == 'human':
                     city = ' '.join(sms_body_list[2:]).strip()
                     if city and city != 'Unknown':
-                        admin_command_response = self._handle_admin_command_human(city)
+                        admin_command_response = await self._handle_admin_command_human(city)
                     else:
                         is_admin_command_invalid = True
                 elif command == 'ai':
-                    admin_command_response = self._handle_admin_command_ai()
+                    admin_command_response = await self._handle_admin_command_ai()
                 elif command == 'delete':
-                    admin_command_response = self._handle_admin_command_delete()
+                    admin_command_response = await self._handle_admin_command_delete()
                 else:
                     is_admin_command_invalid = True
         except Exception as e:
@@ -141,7 +176,7 @@ class IncomingSms:
         if not explicit:
             help_response += 'I could not understand your command. Here is some help: \n'
         help_response += 'You have a limited number of messages per day using which you can chat with pidge ' + \
-            f'({SMS_ALLOWED_PER_DAY_PER_USER - self.user.sms_counter} messages left for today). ' + \
+            f'({self.sms_allowed_per_day_per_user - self.user.sms_counter} messages left for today). ' + \
             'If you want to invoke specific actions, you can use one of the following 6 commands:\n\n' + \
             '1. pidge help: gives the list of all commands.\n\n' + \
             '2. pidge name <name>: updates your name (example "pidge name Wanderer").\n\n' + \
@@ -154,79 +189,99 @@ class IncomingSms:
             'For more information, visit www.pigeonmsg.com'
         return help_response
 
-    def _handle_admin_command_name(self, name: str, chat_history: MongoDBChatMessageHistory):
+    async def _handle_admin_command_name(self, name: str):
         logger.info(f'Updating user name..')
         query = 'I want to update my name in the system. Forget any name I might have told you earlier and call me only by my new name. ' + \
             f'My new name is {name}'
-        _ = self.langchain_client.get_user_chat_response(chat_history, self.sms_from, query)
-        user_name_response = self._get_user_name_response(update=True)
+        _ = await self.langchain_client.get_user_chat_response(self.sms_from, query, use_cache=False)
+        user_name_response = await self._get_user_name_response(update=True)
         return user_name_response
 
-    def _handle_admin_command_cities(self, cities: str, chat_history: MongoDBChatMessageHistory):
+    async def _handle_admin_command_cities(self, cities: str):
         logger.info(f'Updating user cities..')
         query = 'I want to update the cities for which I am willing to help other users plan their travel. ' +\
             'If I told you any city names earlier related to this, forget them. ' + \
             'Only remember these new city names. ' + \
             f'The new city names are  {cities}'
-        _ = self.langchain_client.get_user_chat_response(chat_history, self.sms_from, query)
-        cities_response = self._get_user_cities_response(update=True)
+        _ = await self.langchain_client.get_user_chat_response(self.sms_from, query, use_cache=False)
+        cities_response = await self._get_user_cities_response(update=True)
         return cities_response
 
-    def _handle_admin_command_human(self, city: str):
+    async def _handle_admin_command_human(self, city: str):
         logger.info(f'Searching human connections..')
         human_connection_response = 'You are already connected to another user.' +\
             'You must first end that connection by texting "pidge ai" before you request another connection.'
         if not self.user.connected_phone_number:
-            human_connection_response = f'Unfortunately, no user in our system is familiar with the city - {city.title()} 😞. ' +\
-                'Do try again in a few days as we are constantly on-boarding new users every day!'
-            connected_user = self.mongodb_dao.find_user_by_city(self.user, city)
+            city_id = self.matchmaker.city_gazetteer.get_city_id(city)
+            city_name = self.matchmaker.city_gazetteer.get_name(city_id) if city_id else city.title()
+            connected_user = await self.matchmaker.connect(self.user, city_id) if city_id else None
             logger.info(f'connected_user: ${connected_user}')
             if connected_user:
-                connection_helper_name, connection_requestor_name = f'{city.upper()} HELPER', f'{city.upper()} HELP REQUESTOR'
-                human_connection_response = f'Congratulations, we were able to find a user who is familiar with {city.title()} 🎉! ' + \
-                    'I have connected you two and all future messages you send will be forwarded to this user.\n\n' + \
-                    f'You will know you are chatting to this user by [{connection_helper_name}] prefixed before the message.\n\n' + \
-                    'You (or the other user) may chose to end the connection any time by sending the text "pidge ai".'
-                help_provider_response = f'Hello! Another user has requested some help with the city - {city.title()} ℹ️! ' + \
-                    'I have connected you two and all future messages you send will be forwarded to this user.\n\n' + \
-                    f'You will know you are chatting to this user by [{connection_requestor_name}] prefixed before the message.\n\n' + \
-                    'You (or the other user) may chose to end the connection any time by sending the text "pidge ai".'
-                self.mongodb_dao.update_connection_details(self.user, connected_user.phone_number, connection_requestor_name)
-                self.mongodb_dao.update_connection_details(connected_user, self.user.phone_number, connection_helper_name)
-                is_sms_failed_response = self._send_sms_connected_user(connected_user, help_provider_response)
+                human_connection_response, help_provider_response = self._get_connection_responses(city_id)
+                is_sms_failed_response = await self._send_sms_connected_user(connected_user, help_provider_response)
                 if is_sms_failed_response:
                     human_connection_response = is_sms_failed_response
+            elif city_id and await self.matchmaker.add_to_waitlist(self.user, city_id):
+                human_connection_response = f'Everyone who is familiar with the city - {city_name} is busy right now ⏳. ' +\
+                    'I have added you to the waitlist and will connect you as soon as one of them is free ' +\
+                    '(you can leave the waitlist by texting "pidge ai").'
+            else:
+                human_connection_response = f'Unfortunately, no user in our system is familiar with the city - {city_name} 😞. ' +\
+                    'Do try again in a few days as we are constantly on-boarding new users every day!'
         return human_connection_response
 
-    def _handle_admin_command_ai(self):
+    def _get_connection_responses(self, city_id: str):
+        city_name = self.matchmaker.city_gazetteer.get_name(city_id)
+        connection_helper_name, connection_requestor_name = self.matchmaker.get_connection_names(city_id)
+        human_connection_response = f'Congratulations, we were able to find a user who is familiar with {city_name} 🎉! ' + \
+            'I have connected you two and all future messages you send will be forwarded to this user.\n\n' + \
+            f'You will know you are chatting to this user by [{connection_helper_name}] prefixed before the message.\n\n' + \
+            'You (or the other user) may chose to end the connection any time by sending the text "pidge ai".'
+        help_provider_response = f'Hello! Another user has requested some help with the city - {city_name} ℹ️! ' + \
+            'I have connected you two and all future messages you send will be forwarded to this user.\n\n' + \
+            f'You will know you are chatting to this user by [{connection_requestor_name}] prefixed before the message.\n\n' + \
+            'You (or the other user) may chose to end the connection any time by sending the text "pidge ai".'
+        return human_connection_response, help_provider_response
+
+    async def _connect_waitlisted_user(self, helper: UserDto):
+        """
+        Overview:
+            Connects a helper who just became available to a waitlisted user (if any) & notifies both of them
+        """
+        match = await self.matchmaker.connect_waitlisted(helper)
+        if match:
+            requestor, city_id = match
+            human_connection_response, help_provider_response = self._get_connection_responses(city_id)
+            await self._send_sms_connected_user(requestor, human_connection_response)
+            await self._send_sms_connected_user(helper, help_provider_response)
+
+    async def _handle_admin_command_ai(self):
         logger.info(f'Removing human connections..')
-        connected_number = self.user.connected_phone_number
         ai_connection_response = 'If you were connected to another user on our service, that connection has now concluded.\n\n' +\
             'You\'re back to texting with your helpful AI, Pidge! 🪶'
-        if connected_number:
-            connected_user: UserDto = self.mongodb_dao.get_user_by_phone_number(connected_number)
-            self.mongodb_dao.update_connection_details(self.user, None, None)
-            self.mongodb_dao.update_connection_details(connected_user, None, None)
-            self._send_sms_connected_user(connected_user, ai_connection_response)
+        connected_user = await self.matchmaker.disconnect(self.user)
+        if connected_user:
+            await self._send_sms_connected_user(connected_user, ai_connection_response)
+            await self._connect_waitlisted_user(connected_user)
         return ai_connection_response
 
-    def _handle_admin_command_delete(self):
-        self._handle_admin_command_ai()
+    async def _handle_admin_command_delete(self):
+        await self._handle_admin_command_ai()
         logger.info(f'Deleting all user data from the system..')
-        self.mongodb_dao.delete_user(self.user)
-        self.mongodb_langchain_dao.delete_chat_history()
+        self.unit_of_work.delete_user(self.user)
+        await self.mongodb_langchain_dao.delete_chat_history()
         delete_response = 'All your data has been deleted from the system. If you want to join the platform again, ' + \
             'you will have to wait one day before you can be on-boarded.\n\nThanks for using PigeonMsg!'
         return delete_response
 
-    def _send_sms_connected_user(self, connected_user: UserDto, body: str) -> str:
+    async def _send_sms_connected_user(self, connected_user: UserDto, body: str) -> str:
         response = ''
-        is_service_rate_limited = self.mongodb_dao.is_user_rate_limited(self.pigeon, SMS_ALLOWED_PER_DAY_FOR_SERVICE)
-        is_user_rate_limited = self.mongodb_dao.is_user_rate_limited(connected_user, SMS_ALLOWED_PER_DAY_PER_USER)
+        is_service_rate_limited = await self.rate_limiter.is_service_rate_limited()
+        is_user_rate_limited = await self.rate_limiter.is_rate_limited(connected_user, self.rate_limiter.policy_user)
         if not is_service_rate_limited:
             if not is_user_rate_limited:
-                is_message_sent = send_sms(self.twilio_client, self.sending_number, connected_user, body)
-                if not is_message_sent:
+                is_message_queued = await self.outgoing_sms_queue.enqueue(connected_user.phone_number, body)
+                if not is_message_queued:
                     response = 'Failed to send your previous SMS - try again after some time.'
             else:
                 response = 'The user you are chatting with has reached their rate limit for the day - ' +\
@@ -237,9 +292,9 @@ class IncomingSms:
 
     def _get_message_trailer(self) -> str:
         trailer = ''
-        sms_left_today = SMS_ALLOWED_PER_DAY_PER_USER - self.user.sms_counter
+        sms_left_today = self.sms_allowed_per_day_per_user - self.user.sms_counter
         if sms_left_today < 3 and sms_left_today >= 0:
-            trailer += f'\n\nNOTE: You have {sms_left_today} sms left for today. This will reset to {SMS_ALLOWED_PER_DAY_PER_USER} sms at 12 am UTC'
+            trailer += f'\n\nNOTE: You have {sms_left_today} sms left for today. This will reset to {self.sms_allowed_per_day_per_user} sms at 12 am UTC'
         return trailer
 
     def _get_new_user_onboarding_response(self):
@@ -252,12 +307,11 @@ class IncomingSms:
             'What should I call you? If you don\'t feel comfortable sharing your real name, reply with a made up one like "Wanderer" 😊 \n\n'
         return onboarding_response
 
-    def _get_user_name_response(self, update=False):
+    async def _get_user_name_response(self, update=False):
         logger.info(f'Fetching username via langchain..')
-        chat_history = self.mongodb_langchain_dao.chat_history
         query = 'What is my name? Respond by saying only my name and nothing else. If you don\'t know my name, say Unknown.'
-        user_name = self.langchain_client.get_admin_chat_response(chat_history, self.sms_from, query)
-        self.mongodb_dao.update_user_name(self.user, user_name)
+        user_name = await self.langchain_client.get_admin_chat_response(self.sms_from, query)
+        self.unit_of_work.update_user_name(self.user, user_name)
         user_name_response = \
             f'Hi {user_name}, nice to meet you! There are a couple long messages I\'ll send you as part of on-boarding to the platform - ' +\
             'please bear with me.\n\nThis platform is sustained by folks who are willing to help other users ' +\
@@ -271,19 +325,20 @@ class IncomingSms:
             user_name_response = \
                 f'Got it, {user_name}! How can I assist you today with your travel plans to a city in California? ' + \
                 'If you have any questions, feel free to ask!'
-        self.mongodb_langchain_dao.delete_most_recent_messages(3)  # delete admin interactions from chat history
-        self.mongodb_langchain_dao.update_ai_message(user_name_response)
+        await self.mongodb_langchain_dao.delete_most_recent_messages(3)  # delete admin interactions from chat history
+        await self.mongodb_langchain_dao.update_ai_message(user_name_response)
         return user_name_response
 
     # FIXME: explore openai tool for getting structured output
-    def _get_user_cities_response(self, update=False):
+    async def _get_user_cities_response(self, update=False):
         logger.info(f'Fetching city names via langchain..')
-        chat_history = self.mongodb_langchain_dao.chat_history
         query = 'What are the cities I have indicated I can help other users with? Respond by saying only comma seperated city names ' +\
             'and nothing else. Make sure city names are not acronyms. If I have not given any city names, simply respond with Unknown.'
-        user_cities = self.langchain_client.get_admin_chat_response(chat_history, self.sms_from, query)
+        user_cities = await self.langchain_client.get_admin_chat_response(self.sms_from, query)
         user_cities_list = user_cities.strip().split(',')
-        self.mongodb_dao.update_user_cities(self.user, user_cities_list)
+        self.unit_of_work.update_user_cities(self.user, user_cities_list)
+        if not self.user.connected_phone_number:
+            await self._connect_waitlisted_user(self.user)
         city_response = f'Great! I\'ve noted that you\'re willing to help others with their travel plans to {user_cities}.\n\n'
         if len(user_cities_list) == 0 or user_cities_list == ['Unknown']:
             city_response = f'No worries, you can always let me know later if you change your mind.\n\n'
@@ -293,6 +348,6 @@ class IncomingSms:
             'anonymously! To get a list of all commands, reply with "pidge help".\n\n' +\
             'You can of-course ask me questions anytime! ' +\
             'Can I assist you with planning your next trip to any city in California?'
-        self.mongodb_langchain_dao.delete_most_recent_messages(3)  # delete admin interactions from chat history
-        self.mongodb_langchain_dao.update_ai_message(user_cities_response)
+        await self.mongodb_langchain_dao.delete_most_recent_messages(3)  # delete admin interactions from chat history
+        await self.mongodb_langchain_dao.update_ai_message(user_cities_response)
         return user_cities_response
@@ -1,20 +1,47 @@
-from backend.dto.user_dto import UserDto
+from aiohttp import ClientSession
 from backend.utils.generic import logger
-from twilio.base.exceptions import TwilioRestException
+from backend.utils.metrics import metrics
+from backend.utils.settings_accumalator import Settings
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 from twilio.rest import Client as TwilioClient
+from twilio.rest.api.v2010.account.message import MessageInstance
 
 
-def send_sms(twilio_client: TwilioClient, from_: str, user: UserDto, body: str):
-    is_message_sent = False
-    logger.info(f'Sending message: From: {from_}, To: {user.phone_number},  Body: {body}')
-    try:
-        message = twilio_client.messages.create(
+class LazyAsyncTwilioHttpClient(AsyncTwilioHttpClient):
+    """
+    Overview:
+        AsyncTwilioHttpClient opens its aiohttp session in the constructor which requires a running event loop
+        This client defers opening the (pooled) session to the first request so the Twilio client can be built at import time
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(pool_connections=False, **kwargs)
+
+    async def request(self, *args, **kwargs):
+        if self.session is None:
+            self.session = ClientSession(trace_configs=self.trace_configs)
+        return await super().request(*args, **kwargs)
+
+
+def create_twilio_client(settings: Settings) -> TwilioClient:
+    twilio_client = TwilioClient(settings.secrets_twilio.account_sid, settings.secrets_twilio.auth_token,
+                                 http_client=LazyAsyncTwilioHttpClient())
+    if settings.configs_app.twilio_api_base_url:
+        twilio_client.api.base_url = settings.configs_app.twilio_api_base_url  # e.g. the fake Twilio of the load test
+    return twilio_client
+
+
+async def send_sms(twilio_client: TwilioClient, from_: str, to: str, body: str) -> MessageInstance:
+    """
+    Overview:
+        Sends a single sms via the Twilio REST API; failures (TwilioRestException, network errors) are raised to the caller
+    """
+    logger.info(f'Sending message: From: {from_}, To: {to},  Body: {body}')
+    with metrics.time_stage('twilio_send'):
+        message = await twilio_client.messages.create_async(
             from_=from_,
-            to=user.phone_number,
+            to=to,
             body=body
         )
-        is_message_sent = True
-        logger.info(f'Message sent successfully: ID {message.sid}')
-    except TwilioRestException as e:
-        logger.error(f"Failed to send message: {e}")
-    return is_message_sent
+    logger.info(f'Message sent successfully: ID {message.sid}')
+    return message
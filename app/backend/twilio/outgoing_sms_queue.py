@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from backend.twilio.outgoing_sms import send_sms
+from backend.utils.generic import logger
+from backend.utils.settings_accumalator import Settings
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import ASCENDING, ReturnDocument, errors
+from twilio.base.exceptions import TwilioRestException
+from twilio.rest import Client as TwilioClient
+
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_DEAD = 'dead'
+
+
+class OutgoingSmsQueue:
+    """
+    Overview:
+        Durable (MongoDB backed) queue of outgoing sms drained by a pool of background delivery workers
+        Enqueueing costs a single insert so webhooks never wait on the Twilio REST API
+        Each sms document tracks its delivery status: pending -> sending -> sent, or back to pending with an exponential backoff
+        until max attempts is reached at which point it is moved to the dead-letter status
+        A worker holds a lease on the sms it is sending so sms claimed by a crashed worker are retried once the lease expires
+    """
+
+    def __init__(self, settings: Settings, collection_outgoing_sms: AsyncIOMotorCollection, twilio_client: TwilioClient):
+        configs_app = settings.configs_app
+        self.collection_outgoing_sms = collection_outgoing_sms
+        self.twilio_client = twilio_client
+        self.sending_number = settings.secrets_twilio.sending_number
+        self.workers = configs_app.outgoing_sms_workers
+        self.max_attempts = configs_app.outgoing_sms_max_attempts
+        self.retry_base_seconds = configs_app.outgoing_sms_retry_base_seconds
+        self.retry_max_seconds = configs_app.outgoing_sms_retry_max_seconds
+        self.poll_interval_seconds = configs_app.outgoing_sms_poll_interval_seconds
+        self.lease_seconds = configs_app.outgoing_sms_lease_seconds
+        self.retention_days = configs_app.outgoing_sms_retention_days
+        self._worker_tasks: List[asyncio.Task] = []
+        self._is_stopping = False
+        self._sms_enqueued = asyncio.Event()
+
+    async def create_indexes(self):
+        await self.collection_outgoing_sms.create_index([('status', ASCENDING), ('next_attempt_at', ASCENDING)])
+        await self.collection_outgoing_sms.create_index('expire_at', expireAfterSeconds=0)
+
+    async def enqueue(self, to: str, body: str) -> bool:
+        is_enqueued, now = False, datetime.now()
+        try:
+            await self.collection_outgoing_sms.insert_one({
+                'from_': self.sending_number,
+                'to': to,
+                'body': body,
+                'status': STATUS_PENDING,
+                'attempts': 0,
+                'next_attempt_at': now,
+                'created_at': now,
+                'updated_at': now
+            })
+            is_enqueued = True
+            self._sms_enqueued.set()
+        except errors.PyMongoError as e:
+            logger.error(f'Failed to enqueue sms to {to}: {e}')
+        return is_enqueued
+
+    def start(self):
+        logger.info(f'Starting {self.workers} outgoing sms workers..')
+        self._is_stopping = False
+        self._worker_tasks = [asyncio.create_task(self._run_worker(worker_id)) for worker_id in range(self.workers)]
+
+    async def stop(self, timeout_seconds: float = 10):
+        """
+        Overview:
+            Lets the workers finish the sms they are sending; sms still pending stay in the queue for the next start
+        """
+        logger.info('Stopping outgoing sms workers..')
+        self._is_stopping = True
+        self._sms_enqueued.set()
+        if self._worker_tasks:
+            _, pending_tasks = await asyncio.wait(self._worker_tasks, timeout=timeout_seconds)
+            for task in pending_tasks:
+                task.cancel()
+        self._worker_tasks = []
+
+    async def _run_worker(self, worker_id: int):
+        while not self._is_stopping:
+            try:
+                sms = await self._claim_next()
+                if sms is None:
+                    self._sms_enqueued.clear()
+                    try:
+                        await asyncio.wait_for(self._sms_enqueued.wait(), timeout=self.poll_interval_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self._deliver(sms)
+            except Exception as e:
+                logger.error(f'Outgoing sms worker {worker_id} failed: {e}')
+                await asyncio.sleep(self.poll_interval_seconds)
+
+    async def _claim_next(self) -> Optional[dict]:
+        now = datetime.now()
+        return await self.collection_outgoing_sms.find_one_and_update(
+            {'$or': [
+                {'status': STATUS_PENDING, 'next_attempt_at': {'$lte': now}},
+                {'status': STATUS_SENDING, 'next_attempt_at': {'$lte': now}}  # lease of a crashed worker expired
+            ]},
+            {'$set': {'status': STATUS_SENDING, 'next_attempt_at': now + timedelta(seconds=self.lease_seconds), 'updated_at': now},
+             '$inc': {'attempts': 1}},
+            sort=[('next_attempt_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _deliver(self, sms: dict):
+        try:
+            message = await send_sms(self.twilio_client, sms['from_'], sms['to'], sms['body'])
+            await self._update_status(sms, STATUS_SENT, {'sid': message.sid, 'twilio_status': message.status})
+        except Exception as e:
+            if sms['attempts'] >= self.max_attempts or not self._is_retryable(e):
+                logger.error(f'Giving up on sms {sms["_id"]} to {sms["to"]} after {sms["attempts"]} attempts: {e}')
+                await self._update_status(sms, STATUS_DEAD, {'last_error': str(e)})
+            else:
+                backoff_seconds = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (sms['attempts'] - 1))
+                logger.warning(f'Failed to send sms {sms["_id"]} to {sms["to"]}, retrying in {backoff_seconds}s: {e}')
+                await self._update_status(sms, STATUS_PENDING, {
+                    'last_error': str(e),
+                    'next_attempt_at': datetime.now() + timedelta(seconds=backoff_seconds)
+                })
+
+    async def _update_status(self, sms: dict, status: str, fields: dict):
+        now = datetime.now()
+        fields = {**fields, 'status': status, 'updated_at': now}
+        if status in (STATUS_SENT, STATUS_DEAD):
+            fields['expire_at'] = now + timedelta(days=self.retention_days)
+        await self.collection_outgoing_sms.update_one({'_id': sms['_id']}, {'$set': fields})
+
+    def _is_retryable(self, e: Exception) -> bool:
+        """
+        Overview:
+            Client errors reported by Twilio (for example an invalid 'To' number) will fail the same way on every attempt
+        """
+        if isinstance(e, TwilioRestException):
+            return e.status == 429 or e.status >= 500
+        return True
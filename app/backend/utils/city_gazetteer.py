@@ -0,0 +1,44 @@
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from backend.utils.generic import logger, read_json
+
+UNKNOWN_CITY = 'unknown'
+NON_ALPHANUMERIC_PATTERN = re.compile(r'[^a-z0-9]+')
+
+
+class CityGazetteer:
+    """
+    Overview:
+        Resolves free-text California city names (any case / spacing / punctuation, or aliases like "SF" & "LA")
+        to canonical city ids so helpers can be matched by an exact, indexed lookup
+        Names missing from the bundled gazetteer resolve to a slug of the normalized name, so they still match each other
+    """
+
+    def __init__(self, gazetteer_file: str):
+        gazetteer = read_json(gazetteer_file)
+        self.names: Dict[str, str] = {}  # city id -> display name
+        self.city_ids: Dict[str, str] = {}  # normalized name or alias -> city id
+        for city in gazetteer['cities']:
+            self.names[city['id']] = city['name']
+            for name in [city['name'], city['id'], *city['aliases']]:
+                self.city_ids[self.normalize(name)] = city['id']
+        logger.info(f'Loaded {len(self.names)} cities & {len(self.city_ids)} aliases from the {gazetteer["state"]} gazetteer')
+
+    def normalize(self, name: str) -> str:
+        name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()  # San José -> San Jose
+        return NON_ALPHANUMERIC_PATTERN.sub(' ', name.casefold()).strip()
+
+    def get_city_id(self, name: str) -> Optional[str]:
+        normalized_name = self.normalize(name)
+        if not normalized_name or normalized_name == UNKNOWN_CITY:
+            return None
+        return self.city_ids.get(normalized_name, normalized_name.replace(' ', '-'))
+
+    def get_city_ids(self, names: List[str]) -> List[str]:
+        city_ids = [self.get_city_id(name) for name in names]
+        return list(dict.fromkeys(city_id for city_id in city_ids if city_id))  # drops unknowns & duplicates, keeps order
+
+    def get_name(self, city_id: str) -> str:
+        return self.names.get(city_id, city_id.replace('-', ' ').title())
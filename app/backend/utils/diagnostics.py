@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from backend.utils.exceptions import ProfilerBusyException
+from backend.utils.generic import logger
+from backend.utils.metrics import RequestTrace, current_trace, metrics
+
+
+class SlowRequestLog:
+    """
+    Overview:
+        Bounded ring buffer of the stage breakdown of every request slower than threshold_seconds
+        A trace is begun per request (RouterLoggingMiddleware) & per deferred reply (Routes); the stages timed with
+        metrics.time_stage while it is current are collected into it, and it is only kept if the request turned out slow
+    """
+
+    def __init__(self, threshold_seconds: float, max_entries: int):
+        self.threshold_seconds = threshold_seconds
+        self._entries: deque = deque(maxlen=max_entries)  # oldest first
+        self._slow_requests = metrics.counter('slow_requests_total', 'Requests slower than the slow request threshold')
+
+    def begin(self, request_id: str, name: str) -> RequestTrace:
+        trace = RequestTrace(request_id, name)
+        trace.token = current_trace.set(trace)
+        return trace
+
+    def finish(self, trace: RequestTrace, status_code: Optional[int] = None):
+        seconds = time.perf_counter() - trace.start_time
+        current_trace.reset(trace.token)
+        if seconds < self.threshold_seconds:
+            return
+        self._slow_requests.inc()
+        self._entries.append({
+            'request_id': trace.request_id,
+            'name': trace.name,
+            'status_code': status_code,
+            'finished_at': datetime.now().isoformat(),
+            'seconds': round(seconds, 6),
+            'stages': [{'stage': stage, 'offset_seconds': round(offset, 6), 'seconds': round(stage_seconds, 6)}
+                       for stage, offset, stage_seconds in trace.stages]
+        })
+
+    def get_entries(self, request_id: Optional[str] = None) -> List[Dict]:
+        """
+        Returns:
+            - entries: List[Dict] (newest first; a request replied to in deferred mode can have an entry for the webhook & for the reply)
+        """
+        return [entry for entry in reversed(self._entries) if request_id is None or entry['request_id'] == request_id]
+
+
+class SamplingProfiler:
+    """
+    Overview:
+        Samples the stacks of all threads of the process from a background thread every interval_seconds
+        and aggregates them into collapsed stacks ("thread;outer frame;..;inner frame count" per line),
+        the input format of flamegraph.pl / speedscope
+        The event loop keeps running while it samples; only one profile can be taken at a time
+    """
+
+    def __init__(self, interval_seconds: float, max_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.max_seconds = max_seconds
+        self._lock = asyncio.Lock()
+
+    async def profile(self, seconds: float) -> str:
+        if self._lock.locked():
+            raise ProfilerBusyException('A profile is already being taken')
+        async with self._lock:
+            seconds = min(seconds, self.max_seconds)
+            logger.info(f'Profiling for {seconds}s every {self.interval_seconds}s..')
+            stacks = await asyncio.to_thread(self._sample, seconds)
+            return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+    def _sample(self, seconds: float) -> Counter:
+        stacks = Counter()
+        sampler_thread_id = threading.get_ident()
+        end_time = time.monotonic() + seconds
+        while time.monotonic() < end_time:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != sampler_thread_id:
+                    stacks[self._collapse(thread_names.get(thread_id, str(thread_id)), frame)] += 1
+            time.sleep(self.interval_seconds)
+        return stacks
+
+    def _collapse(self, thread_name: str, frame) -> str:
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        frames.append(thread_name)
+        return ';'.join(reversed(frames))
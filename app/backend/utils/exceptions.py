@@ -1,3 +1,7 @@
 
 class MongoDbUserNotFoundException(Exception):
     pass
+
+
+class ProfilerBusyException(Exception):
+    pass
@@ -1,10 +1,19 @@
+import atexit
 import logging
 import logging.config
+import logging.handlers
+import queue
+import time
 from json import dump, load
+from threading import Lock
 
+from backend.utils.metrics import metrics
 from pythonjsonlogger import jsonlogger
 
 logger = None
+QUEUE_DROP_NEWEST = 'drop_newest'
+QUEUE_DROP_OLDEST = 'drop_oldest'
+QUEUE_BLOCK = 'block'
 
 
 class CustomLogger():
@@ -13,10 +22,72 @@ class CustomLogger():
         def add_fields(self, log_record, record, message_dict):
             super().add_fields(log_record, record, message_dict)
 
+    class BoundedQueueHandler(logging.handlers.QueueHandler):
+        """
+        Overview:
+            Hands records to the listener thread as they are (formatting happens there, so records must not be mutated
+            after they were logged) & applies the drop policy once the bounded queue is full:
+            drop_newest (discard the record being logged), drop_oldest (discard the oldest queued one) or block (wait for room)
+        """
+
+        def __init__(self, record_queue: queue.Queue, drop_policy: str):
+            super().__init__(record_queue)
+            self.drop_policy = drop_policy
+
+        def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+            return record
+
+        def enqueue(self, record: logging.LogRecord):
+            if self.drop_policy == QUEUE_BLOCK:
+                self.queue.put(record)
+                return
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                pass
+            if self.drop_policy == QUEUE_DROP_OLDEST:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.put_nowait(record)
+                except (queue.Empty, queue.Full):
+                    pass  # raced with another thread; the new record is dropped instead
+            metrics.counter('log_records_dropped_total', 'Log records dropped', reason='queue_full').inc()
+
+    class RateLimitFilter(logging.Filter):
+        """
+        Overview:
+            Token bucket per logger name; records below WARNING beyond records_per_second (with bursts of up to burst) are dropped
+        """
+
+        def __init__(self, records_per_second: float, burst: int):
+            super().__init__()
+            self.records_per_second = records_per_second
+            self.burst = burst
+            self.buckets = {}  # logger name -> [tokens, time_last_refill]
+            self._lock = Lock()  # records may be logged from any thread
+
+        def filter(self, record: logging.LogRecord) -> bool:
+            if record.levelno >= logging.WARNING:
+                return True
+            now = time.monotonic()
+            with self._lock:
+                bucket = self.buckets.setdefault(record.name, [self.burst, now])
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.records_per_second)
+                bucket[1] = now
+                if bucket[0] >= 1:
+                    bucket[0] -= 1
+                    return True
+            metrics.counter('log_records_dropped_total', 'Log records dropped', reason='rate_limited').inc()
+            return False
+
     def __init__(self):
         self.logging_config = None
         self.logger = None
+        self.queue_options = None
+        self.queue_listener = None
         self._apply()
+        atexit.register(self._stop_queue_listener)  # flushes the queued records on exit
 
     def _apply(self):
         self.logging_config = {
@@ -40,7 +111,7 @@ class CustomLogger():
             }
         }
 
-        logging.config.dictConfig(self.logging_config)
+        self._configure()
         self.logger = logging.getLogger(__name__)
         self.change_formatter()
         self.change_logging_level()
@@ -52,11 +123,47 @@ class CustomLogger():
             self.logging_config['formatters']['json']['format'] = format_minimized
         else:
             self.logging_config['formatters']['json']['format'] = format_default
-        logging.config.dictConfig(self.logging_config)
+        self._configure()
 
     def change_logging_level(self, root_logging_level=logging.INFO):
         self.logging_config['root']['level'] = root_logging_level
+        self._configure()
+
+    def enable_queue(self, max_size: int = 10000, drop_policy: str = QUEUE_DROP_NEWEST, records_per_second: float = 0, burst: int = 100):
+        """
+        Overview:
+            Switches to queue based logging: the root handlers move to a listener thread which formats & writes the records,
+            so logging on the event loop thread only costs a put on a bounded queue
+        Arguments:
+            - max_size: int (records queued at most before drop_policy applies)
+            - drop_policy: str (drop_newest / drop_oldest / block)
+            - records_per_second: float (per logger rate limit of records below WARNING, 0 for none)
+            - burst: int
+        """
+        self.queue_options = {'max_size': max_size, 'drop_policy': drop_policy, 'records_per_second': records_per_second, 'burst': burst}
+        self._configure()
+
+    def disable_queue(self):
+        self.queue_options = None
+        self._configure()
+
+    def _configure(self):
+        self._stop_queue_listener()
         logging.config.dictConfig(self.logging_config)
+        if self.queue_options is None:
+            return
+        root_logger = logging.getLogger()
+        queue_handler = self.BoundedQueueHandler(queue.Queue(self.queue_options['max_size']), self.queue_options['drop_policy'])
+        if self.queue_options['records_per_second'] > 0:
+            queue_handler.addFilter(self.RateLimitFilter(self.queue_options['records_per_second'], self.queue_options['burst']))
+        self.queue_listener = logging.handlers.QueueListener(queue_handler.queue, *root_logger.handlers, respect_handler_level=True)
+        root_logger.handlers = [queue_handler]
+        self.queue_listener.start()
+
+    def _stop_queue_listener(self):
+        if self.queue_listener:
+            self.queue_listener.stop()  # writes out the records still queued
+            self.queue_listener = None
 
 
 def read_json(json_path_str: str):
@@ -0,0 +1,224 @@
+import bisect
+import math
+import time
+from contextvars import ContextVar
+from threading import Lock
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_LATENCY_METRIC = 'sms_stage_latency_seconds'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None  # if set, the value is read from it when collected
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function else self.value
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class RequestTrace:
+    """
+    Overview:
+        The stages timed while handling one request, as (stage, offset from the start of the request, seconds)
+    """
+
+    __slots__ = ('request_id', 'name', 'start_time', 'stages', 'token')
+
+    def __init__(self, request_id: str, name: str):
+        self.request_id = request_id
+        self.name = name
+        self.start_time = time.perf_counter()
+        self.stages: List[Tuple[str, float, float]] = []
+        self.token = None
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar('current_trace', default=None)  # set per request, see SlowRequestLog
+
+
+class StageTimer:
+    """
+    Overview:
+        Context manager timing one stage of the sms pipeline into the stage latency histogram
+        and into the trace of the current request, if one is being traced
+    """
+
+    __slots__ = ('stage', 'histogram', 'start_time')
+
+    def __init__(self, stage: str, histogram: Histogram):
+        self.stage = stage
+        self.histogram = histogram
+
+    def __enter__(self) -> 'StageTimer':
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start_time
+        self.histogram.observe(seconds)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.stages.append((self.stage, self.start_time - trace.start_time, seconds))
+
+
+class MetricsRegistry:
+    """
+    Overview:
+        In-process registry of counters, gauges & histograms identified by name and labels
+        Metrics are only ever updated from the event loop thread so updates are plain attribute writes;
+        the lock only guards the creation of new metrics
+    """
+
+    def __init__(self):
+        self.descriptions: Dict[str, str] = {}
+        self.counters: Dict[Tuple[str, Tuple], Counter] = {}
+        self.gauges: Dict[Tuple[str, Tuple], Gauge] = {}
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self._stage_histograms: Dict[str, Histogram] = {}
+        self._collectors: Dict[str, Callable[[], Awaitable[None]]] = {}
+        self._lock = Lock()
+
+    def counter(self, name: str, description: str = '', **labels) -> Counter:
+        key = (name, tuple(sorted(labels.items())))
+        counter = self.counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self.counters.setdefault(key, Counter())
+                self.descriptions.setdefault(name, description)
+        return counter
+
+    def gauge(self, name: str, description: str = '', **labels) -> Gauge:
+        key = (name, tuple(sorted(labels.items())))
+        gauge = self.gauges.get(key)
+        if gauge is None:
+            with self._lock:
+                gauge = self.gauges.setdefault(key, Gauge())
+                self.descriptions.setdefault(name, description)
+        return gauge
+
+    def histogram(self, name: str, description: str = '', buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS, **labels) -> Histogram:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram(buckets))
+                self.descriptions.setdefault(name, description)
+        return histogram
+
+    def set_collector(self, name: str, collector: Callable[[], Awaitable[None]]):
+        """
+        Overview:
+            Registers (or replaces) an async function refreshing metrics that need I/O, e.g. aggregates read from MongoDB,
+            awaited by collect right before the metrics are rendered
+        """
+        self._collectors[name] = collector
+
+    async def collect(self):
+        for name, collector in list(self._collectors.items()):
+            try:
+                await collector()
+            except Exception:  # stale values beat a failing metrics endpoint
+                self.counter('metrics_collector_errors_total', 'Failed refreshes of metrics collectors', collector=name).inc()
+
+    def time_stage(self, stage: str) -> StageTimer:
+        """
+        Overview:
+            Times a stage of the sms pipeline, e.g. `with metrics.time_stage('retrieval'): ...`
+        """
+        histogram = self._stage_histograms.get(stage)
+        if histogram is None:
+            histogram = self._stage_histograms[stage] = self.histogram(STAGE_LATENCY_METRIC, 'Latency of each stage of the sms pipeline',
+                                                                       stage=stage)
+        return StageTimer(stage, histogram)
+
+    def snapshot(self) -> List[dict]:
+        snapshot = [{'name': name, 'labels': dict(labels), 'value': counter.value} for (name, labels), counter in self.counters.items()]
+        snapshot += [{'name': name, 'labels': dict(labels), 'value': gauge.get()} for (name, labels), gauge in self.gauges.items()]
+        snapshot += [{'name': name, 'labels': dict(labels), 'count': histogram.count, 'sum': histogram.sum}
+                     for (name, labels), histogram in self.histograms.items()]
+        return snapshot
+
+    def render_prometheus(self) -> str:
+        """
+        Overview:
+            Renders all metrics in the Prometheus text exposition format (version 0.0.4)
+        """
+        lines = []
+        for metric_type, metrics_by_key in (('counter', self.counters), ('gauge', self.gauges)):
+            for name, series in self._group_by_name(metrics_by_key).items():
+                lines += self._get_header(name, metric_type)
+                for labels, metric in series:
+                    value = metric.value if metric_type == 'counter' else metric.get()
+                    lines.append(f'{name}{self._format_labels(labels)} {self._format_value(value)}')
+        for name, series in self._group_by_name(self.histograms).items():
+            lines += self._get_header(name, 'histogram')
+            for labels, histogram in series:
+                cumulative_count = 0
+                for bucket, bucket_count in zip((*histogram.buckets, math.inf), histogram.bucket_counts):
+                    cumulative_count += bucket_count
+                    bucket_labels = labels + (('le', self._format_value(bucket)),)
+                    lines.append(f'{name}_bucket{self._format_labels(bucket_labels)} {cumulative_count}')
+                lines.append(f'{name}_sum{self._format_labels(labels)} {self._format_value(histogram.sum)}')
+                lines.append(f'{name}_count{self._format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def _group_by_name(self, metrics_by_key: Dict[Tuple[str, Tuple], object]) -> Dict[str, List[Tuple[Tuple, object]]]:
+        grouped: Dict[str, List[Tuple[Tuple, object]]] = {}
+        for (name, labels), metric in list(metrics_by_key.items()):
+            grouped.setdefault(name, []).append((labels, metric))
+        return grouped
+
+    def _get_header(self, name: str, metric_type: str) -> List[str]:
+        description = self.descriptions.get(name, '').replace('\\', '\\\\').replace('\n', '\\n')
+        return [f'# HELP {name} {description}', f'# TYPE {name} {metric_type}']
+
+    def _format_labels(self, labels: Tuple) -> str:
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{key}="{self._escape_label_value(value)}"' for key, value in labels) + '}'
+
+    def _escape_label_value(self, value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def _format_value(self, value: float) -> str:
+        if value == math.inf:
+            return '+Inf'
+        return repr(float(value))
+
+
+metrics = MetricsRegistry()
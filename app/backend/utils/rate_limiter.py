@@ -0,0 +1,103 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import List
+
+from backend.dto.user_dto import UserDto
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+
+SECONDS_PER_DAY = 24 * 60 * 60
+RATE_LIMIT_MODE_MONGODB = 'mongodb'
+RATE_LIMIT_MODE_TOKEN_BUCKET = 'token_bucket'
+SERVICE_BUCKET_KEY = 'service'
+
+
+class RateLimitPolicy:
+    def __init__(self, name: str, sms_allowed_per_day: int):
+        self.name = name
+        self.sms_allowed_per_day = sms_allowed_per_day
+
+    def __str__(self):
+        return f'{self.name} ({self.sms_allowed_per_day} sms / day)'
+
+
+class RateLimiter(ABC):
+    """
+    Overview:
+        Base class for rate limiters; a single call both checks the limit of a subject (user / service) and consumes one sms from it
+        Implementations also refresh user.sms_counter so that the remaining sms shown to the user stay accurate
+    """
+
+    def __init__(self, policy_user: RateLimitPolicy, policy_service: RateLimitPolicy):
+        self.policy_user = policy_user
+        self.policy_service = policy_service
+
+    @abstractmethod
+    async def is_rate_limited(self, user: UserDto, policy: RateLimitPolicy) -> bool:
+        pass
+
+    @abstractmethod
+    async def is_service_rate_limited(self) -> bool:
+        pass
+
+    def _is_recently_offboarded(self, user: UserDto, now: datetime) -> bool:
+        return user.deletion_date < now + timedelta(days=2)
+
+    def _record_rejection(self, policy: RateLimitPolicy, reason: str):
+        metrics.counter('rate_limit_rejections_total', 'Sms rejected by the rate limiter', policy=policy.name, reason=reason).inc()
+
+
+class TokenBucketRateLimiter(RateLimiter):
+    """
+    Overview:
+        In-process token buckets (one per phone number) holding up to a day's worth of sms and refilling continuously
+        Suitable only for single-node deployments since the buckets are not shared between processes
+    """
+
+    def __init__(self, policy_user: RateLimitPolicy, policy_service: RateLimitPolicy, max_buckets: int = 100000):
+        super().__init__(policy_user, policy_service)
+        self.max_buckets = max_buckets
+        self.buckets = OrderedDict()  # phone_number (or service key) -> [tokens, time_last_refill]; least recently used first
+
+    async def is_rate_limited(self, user: UserDto, policy: RateLimitPolicy) -> bool:
+        if self._is_recently_offboarded(user, datetime.now()):
+            logger.info(f'User {user.phone_number} recently off-boarded from the system..')
+            self._record_rejection(policy, 'offboarded')
+            return True
+        bucket = self._get_bucket(user.phone_number, policy)
+        user_rate_limited = not self._consume(bucket)
+        if user_rate_limited:
+            logger.info(f'User {user.phone_number} rate limit reached for policy {policy}')
+            self._record_rejection(policy, 'limit_reached')
+        user.sms_counter = policy.sms_allowed_per_day - int(bucket[0])
+        return user_rate_limited
+
+    async def is_service_rate_limited(self) -> bool:
+        service_rate_limited = not self._consume(self._get_bucket(SERVICE_BUCKET_KEY, self.policy_service))
+        if service_rate_limited:
+            logger.info(f'Service rate limit reached for policy {self.policy_service}')
+            self._record_rejection(self.policy_service, 'limit_reached')
+        return service_rate_limited
+
+    def _consume(self, bucket: List[float]) -> bool:
+        is_consumed = bucket[0] >= 1
+        if is_consumed:
+            bucket[0] -= 1
+        return is_consumed
+
+    def _get_bucket(self, key: str, policy: RateLimitPolicy) -> List[float]:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = [float(policy.sms_allowed_per_day), now]
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        else:
+            refill_rate = policy.sms_allowed_per_day / SECONDS_PER_DAY
+            bucket[0] = min(float(policy.sms_allowed_per_day), bucket[0] + (now - bucket[1]) * refill_rate)
+            bucket[1] = now
+            self.buckets.move_to_end(key)
+        return bucket
@@ -3,13 +3,14 @@ from os import environ
 from backend.utils.generic import create_json, file_to_dict, logger, read_json
 from dotenv import load_dotenv
 
-env_configs_file = '/pigeon/.env'
-app_configs_file = '/pigeon/app/configs/configs.json'
-app_secrets_file = '/pigeon/secrets/app.json'
-db_secrets_file = '/pigeon/secrets/mongodb/mongodb_credentials.txt'
-twilio_secrets_file = '/pigeon/secrets/twilio/.twilio-cli/config.json'
-openai_secrets_file = '/pigeon/secrets/openai/openai_credentials.txt'
-combined_configs_file = '/pigeon/secrets/tmp_runtime_configs.json'
+pigeon_root = environ.get('PIGEON_ROOT', '/pigeon')  # the container's layout; overridden e.g. by the load test to run outside docker
+env_configs_file = f'{pigeon_root}/.env'
+app_configs_file = f'{pigeon_root}/app/configs/configs.json'
+app_secrets_file = f'{pigeon_root}/secrets/app.json'
+db_secrets_file = f'{pigeon_root}/secrets/mongodb/mongodb_credentials.txt'
+twilio_secrets_file = f'{pigeon_root}/secrets/twilio/.twilio-cli/config.json'
+openai_secrets_file = f'{pigeon_root}/secrets/openai/openai_credentials.txt'
+combined_configs_file = f'{pigeon_root}/secrets/tmp_runtime_configs.json'
 
 
 class ConfigsEnv:
@@ -57,20 +58,82 @@ class Settings:
     class ConfigsApp:
         def __init__(self, app_configs: dict):
             self.uvicorn_reload = app_configs['uvicorn_reload']
+            self.uvicorn_workers = int(app_configs['uvicorn_workers'])  # 0: one per cpu core
+            self.uvicorn_graceful_shutdown_seconds = float(app_configs['uvicorn_graceful_shutdown_seconds'])
             self.logging_format_minimized = bool(app_configs['logging_format_minimized'])
             self.logging_level = app_configs['logging_level']
+            self.logging_queue_enabled = bool(app_configs['logging_queue_enabled'])
+            self.logging_queue_max_size = int(app_configs['logging_queue_max_size'])
+            self.logging_queue_drop_policy = app_configs['logging_queue_drop_policy']
+            self.logging_rate_limit_records_per_second = float(app_configs['logging_rate_limit_records_per_second'])
+            self.logging_rate_limit_burst = int(app_configs['logging_rate_limit_burst'])
             self.mongodb_collection_users = app_configs['mongodb_collection_users']
             self.mongodb_collection_chats = app_configs['mongodb_collection_chats']
+            self.mongodb_collection_service_counters = app_configs['mongodb_collection_service_counters']
+            self.mongodb_collection_outgoing_sms = app_configs['mongodb_collection_outgoing_sms']
+            self.mongodb_collection_chat_summaries = app_configs['mongodb_collection_chat_summaries']
+            self.mongodb_collection_helper_waitlist = app_configs['mongodb_collection_helper_waitlist']
+            self.mongodb_max_pool_size = int(app_configs['mongodb_max_pool_size'])
+            self.mongodb_min_pool_size = int(app_configs['mongodb_min_pool_size'])
+            self.mongodb_max_idle_time_ms = int(app_configs['mongodb_max_idle_time_ms'])
+            self.mongodb_connect_timeout_ms = int(app_configs['mongodb_connect_timeout_ms'])
+            self.mongodb_server_selection_timeout_ms = int(app_configs['mongodb_server_selection_timeout_ms'])
+            self.mongodb_wait_queue_timeout_ms = int(app_configs['mongodb_wait_queue_timeout_ms'])
             self.web_route_home = app_configs['web_route_home']
             self.web_route_sms = app_configs['web_route_sms']
+            self.web_route_metrics = app_configs['web_route_metrics']
+            self.web_route_admin = app_configs['web_route_admin']
             self.web_route_static = app_configs['web_route_static']
             self.web_static_dir = app_configs['web_static_dir']
             self.web_templates_dir = app_configs['web_templates_dir']
             self.web_template_home_file_name = app_configs['web_template_home_file_name']
+            self.request_logging_sample_rate = float(app_configs['request_logging_sample_rate'])
+            self.request_logging_max_body_bytes = int(app_configs['request_logging_max_body_bytes'])
+            self.request_logging_redacted_headers = list(app_configs['request_logging_redacted_headers'])
+            self.helper_waitlist_ttl_hours = float(app_configs['helper_waitlist_ttl_hours'])
+            self.connection_expiry_hours = float(app_configs['connection_expiry_hours'])
+            self.connection_expiry_poll_interval_seconds = float(app_configs['connection_expiry_poll_interval_seconds'])
+            self.connection_expiry_batch_size = int(app_configs['connection_expiry_batch_size'])
+            self.city_gazetteer_file = app_configs['city_gazetteer_file']
             self.langchain_retrieval_docs_dir = app_configs['langchain_retrieval_docs_dir']
-            self.langchain_retrieval_docs_dir = app_configs['langchain_retrieval_docs_dir']
+            self.langchain_vectorstore_dir = app_configs['langchain_vectorstore_dir']
             self.openai_model = app_configs['openai_model']
             self.openai_temperature = app_configs['openai_temperature']
+            self.openai_embedding_model = app_configs['openai_embedding_model']
+            self.chat_history_max_messages = int(app_configs['chat_history_max_messages'])
+            self.chat_history_max_tokens = int(app_configs['chat_history_max_tokens'])
+            self.chat_summary_batch_messages = int(app_configs['chat_summary_batch_messages'])
+            self.condense_question_skip_enabled = bool(app_configs['condense_question_skip_enabled'])
+            self.condense_question_min_history_messages = int(app_configs['condense_question_min_history_messages'])
+            self.condense_question_history_tail_messages = int(app_configs['condense_question_history_tail_messages'])
+            self.condense_question_memo_max_entries = int(app_configs['condense_question_memo_max_entries'])
+            self.semantic_cache_enabled = bool(app_configs['semantic_cache_enabled'])
+            self.semantic_cache_similarity_threshold = float(app_configs['semantic_cache_similarity_threshold'])
+            self.semantic_cache_ttl_seconds = float(app_configs['semantic_cache_ttl_seconds'])
+            self.semantic_cache_max_entries = int(app_configs['semantic_cache_max_entries'])
+            self.user_cache_enabled = bool(app_configs['user_cache_enabled'])
+            self.user_cache_ttl_seconds = float(app_configs['user_cache_ttl_seconds'])
+            self.user_cache_max_entries = int(app_configs['user_cache_max_entries'])
+            self.rate_limit_mode = app_configs['rate_limit_mode']
+            self.rate_limit_sms_per_day_per_user = int(app_configs['rate_limit_sms_per_day_per_user'])
+            self.rate_limit_sms_per_day_for_service = int(app_configs['rate_limit_sms_per_day_for_service'])
+            self.service_quota_shards = int(app_configs['service_quota_shards'])
+            self.service_quota_count_cache_seconds = float(app_configs['service_quota_count_cache_seconds'])
+            self.twilio_api_base_url = app_configs['twilio_api_base_url']
+            self.outgoing_sms_workers = int(app_configs['outgoing_sms_workers'])
+            self.outgoing_sms_max_attempts = int(app_configs['outgoing_sms_max_attempts'])
+            self.outgoing_sms_retry_base_seconds = float(app_configs['outgoing_sms_retry_base_seconds'])
+            self.outgoing_sms_retry_max_seconds = float(app_configs['outgoing_sms_retry_max_seconds'])
+            self.outgoing_sms_poll_interval_seconds = float(app_configs['outgoing_sms_poll_interval_seconds'])
+            self.outgoing_sms_lease_seconds = float(app_configs['outgoing_sms_lease_seconds'])
+            self.outgoing_sms_retention_days = int(app_configs['outgoing_sms_retention_days'])
+            self.sms_reply_mode = app_configs['sms_reply_mode']
+            self.deferred_reply_max_concurrency = int(app_configs['deferred_reply_max_concurrency'])
+            self.deferred_reply_max_pending = int(app_configs['deferred_reply_max_pending'])
+            self.slow_request_threshold_seconds = float(app_configs['slow_request_threshold_seconds'])
+            self.slow_request_log_max_entries = int(app_configs['slow_request_log_max_entries'])
+            self.profiler_sample_interval_seconds = float(app_configs['profiler_sample_interval_seconds'])
+            self.profiler_max_seconds = float(app_configs['profiler_max_seconds'])
 
     class SecretsApp:
         def __init__(self, app_secrets: dict):
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Awaitable, Callable, Set
+
+from backend.utils.generic import logger
+from backend.utils.metrics import metrics
+
+
+class BackgroundTaskPool:
+    """
+    Overview:
+        Runs coroutines in the background on the event loop with a cap on how many run concurrently
+        and on how many may be waiting, so a burst of work can't grow memory without bound
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int):
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        metrics.gauge('background_tasks_in_flight', 'Deferred replies & chat summaries running or waiting in the background').set_function(
+            lambda: len(self._tasks))
+
+    def submit(self, coroutine_function: Callable[..., Awaitable], *args) -> bool:
+        """
+        Returns:
+            - is_submitted: bool (False if the pool is full; the caller is expected to do the work itself)
+        """
+        if len(self._tasks) >= self.max_pending:
+            logger.warning(f'Background task pool is full ({len(self._tasks)} tasks) - not accepting {coroutine_function.__name__}')
+            return False
+        task = asyncio.create_task(self._run(coroutine_function, *args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, coroutine_function: Callable[..., Awaitable], *args):
+        async with self._semaphore:
+            try:
+                await coroutine_function(*args)
+            except Exception as e:
+                logger.exception(f'Background task {coroutine_function.__name__} failed: {e}')
+
+    async def drain(self, timeout_seconds: float = 30):
+        if self._tasks:
+            logger.info(f'Waiting for {len(self._tasks)} background tasks to finish..')
+            _, pending_tasks = await asyncio.wait(set(self._tasks), timeout=timeout_seconds)
+            for task in pending_tasks:
+                task.cancel()
@@ -0,0 +1,62 @@
+"""
+Compares the per-call overhead of building the LangChain RAG chain on every request (the old behaviour)
+against invoking the chain compiled once in LangchainClient.__init__
+
+Usage (from the app directory):
+    python -m benchmarks.bench_chain_assembly --iterations 500
+"""
+import argparse
+import asyncio
+import logging
+import time
+from statistics import mean, median
+from typing import Callable, Dict, List
+
+from backend.utils.generic import custom_logger
+
+from benchmarks.fakes import (FakeLangchainClient, create_fake_settings,
+                              get_empty_session_history)
+
+
+async def _time_calls(call: Callable, iterations: int) -> List[float]:
+    timings = []
+    for i in range(iterations):
+        start_time = time.perf_counter()
+        await call(f'+1{i % 50:010d}')
+        timings.append(time.perf_counter() - start_time)
+    return timings
+
+
+def _summarize(timings: List[float]) -> Dict[str, str]:
+    return {'mean': f'{mean(timings) * 1000:0.3f}ms', 'p50': f'{median(timings) * 1000:0.3f}ms'}
+
+
+async def main(iterations: int):
+    custom_logger.change_logging_level(root_logging_level=logging.WARNING)
+    langchain_client = FakeLangchainClient(create_fake_settings(), get_empty_session_history)
+    query = 'When should I go?'
+
+    async def per_call_assembly(phone_number: str):
+        chain_user = langchain_client._create_chain_user()
+        await chain_user.ainvoke({'question': query}, config={'configurable': {'session_id': phone_number}})
+
+    async def prebuilt(phone_number: str):
+        await langchain_client.chain_user.ainvoke({'question': query}, config={'configurable': {'session_id': phone_number}})
+
+    async def assembly_only(_: str):
+        langchain_client._create_chain_user()
+
+    await _time_calls(prebuilt, 20)  # warm-up
+    results = {
+        'assembly_only': _summarize(await _time_calls(assembly_only, iterations)),
+        'per_call_assembly': _summarize(await _time_calls(per_call_assembly, iterations)),
+        'prebuilt': _summarize(await _time_calls(prebuilt, iterations)),
+    }
+    for name, summary in results.items():
+        print(f'{name:>20}: {summary}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500)
+    asyncio.run(main(parser.parse_args().iterations))
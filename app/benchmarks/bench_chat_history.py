@@ -0,0 +1,92 @@
+"""
+Shows that chat history tail reads, tail deletes & appends stay constant-time as the chats collection grows,
+since every query of MongodbChatMessageHistory is bounded by the (SessionId, _id) index
+
+Needs a running mongod; the benchmark database is dropped before & after the run
+Usage (from the app directory):
+    python -m benchmarks.bench_chat_history --mongodb-uri mongodb://localhost:27017 --sizes 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from random import randrange
+from statistics import median
+from typing import Callable, Dict, List
+
+from backend.dao.mongodb_chat_history import (HISTORY_KEY, SESSION_ID_KEY,
+                                              MongodbChatMessageHistory)
+from backend.utils.generic import custom_logger
+from langchain_core.messages import HumanMessage, message_to_dict
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+
+DATABASE_NAME = 'pigeon_benchmarks'
+SESSIONS = 10000
+INSERT_BATCH_SIZE = 10000
+TAIL_MESSAGES = 20
+
+
+def _get_session_id(i: int) -> str:
+    return f'+1{i:010d}'
+
+
+async def _grow_collection(collection: AsyncIOMotorCollection, current_size: int, size: int):
+    history = json.dumps(message_to_dict(HumanMessage(content='What is the best time to visit Yosemite?')))
+    for start in range(current_size, size, INSERT_BATCH_SIZE):
+        end = min(start + INSERT_BATCH_SIZE, size)
+        await collection.insert_many([{SESSION_ID_KEY: _get_session_id(i % SESSIONS), HISTORY_KEY: history} for i in range(start, end)],
+                                     ordered=False)
+
+
+async def _time_calls(call: Callable, collection: AsyncIOMotorCollection, iterations: int) -> float:
+    timings = []
+    for _ in range(iterations):
+        history = MongodbChatMessageHistory(collection, _get_session_id(randrange(SESSIONS)))
+        start_time = time.perf_counter()
+        await call(history)
+        timings.append(time.perf_counter() - start_time)
+    return median(timings) * 1000
+
+
+async def _explain_tail_read(collection: AsyncIOMotorCollection) -> Dict:
+    cursor = collection.find({SESSION_ID_KEY: _get_session_id(0)}).sort('_id', -1).limit(TAIL_MESSAGES)
+    stats = (await cursor.explain())['executionStats']
+    return {'keys_examined': stats['totalKeysExamined'], 'docs_examined': stats['totalDocsExamined']}
+
+
+async def main(mongodb_uri: str, sizes: List[int], iterations: int):
+    custom_logger.change_logging_level(root_logging_level=logging.WARNING)
+    client = AsyncIOMotorClient(mongodb_uri)
+    await client.drop_database(DATABASE_NAME)
+    collection = client[DATABASE_NAME]['chats']
+    await MongodbChatMessageHistory.create_indexes(collection)
+
+    async def tail_read(history: MongodbChatMessageHistory):
+        await history.aget_recent_messages(TAIL_MESSAGES)
+
+    async def append(history: MongodbChatMessageHistory):
+        await history.aadd_messages([HumanMessage(content='And where should I stay?')])
+
+    async def tail_delete(history: MongodbChatMessageHistory):
+        await history.adelete_recent_messages(1)
+
+    current_size = 0
+    try:
+        for size in sorted(sizes):
+            await _grow_collection(collection, current_size, size)
+            current_size = size
+            results = {call.__name__: f'{await _time_calls(call, collection, iterations):0.3f}ms' for call in (tail_read, append, tail_delete)}
+            print(f'{size:>10} messages: p50 {results}, tail read plan {await _explain_tail_read(collection)}')
+    finally:
+        await client.drop_database(DATABASE_NAME)
+        client.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mongodb-uri', default='mongodb://localhost:27017')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.mongodb_uri, args.sizes, args.iterations))
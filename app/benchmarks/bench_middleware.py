@@ -0,0 +1,123 @@
+"""
+Compares the per-request overhead of the request logging middleware: no middleware, the old BaseHTTPMiddleware
+implementation (benchmarks.legacy_middleware) & the pure ASGI RouterLoggingMiddleware (all requests / 10% sampled)
+Requests are driven straight through the ASGI interface (no HTTP client / server) & logs go to os.devnull,
+so the numbers are the cost of the app + middleware + log formatting only
+
+Usage (from the app directory):
+    python -m benchmarks.bench_middleware --iterations 2000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from statistics import median
+from typing import Callable, Dict, List, Tuple
+from urllib.parse import urlencode
+
+from backend.middleware import RouterLoggingMiddleware
+from backend.utils.generic import CustomLogger
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, Response
+from fastapi.staticfiles import StaticFiles
+
+from benchmarks.legacy_middleware import LegacyRouterLoggingMiddleware
+
+TWIML_RESPONSE = '<?xml version="1.0" encoding="UTF-8"?><Response><Message>' + 'Pidge says hi! ' * 60 + '</Message></Response>'
+HOME_PAGE = '<html><body>' + '<p>PigeonMsg</p>' * 2000 + '</body></html>'
+STATIC_FILE_BYTES = 512 * 1024
+SMS_FORM = urlencode({'From': '+10000000001', 'To': '+10000000000', 'Body': 'What is the best time to visit Yosemite? ' * 5,
+                      'MessageSid': 'SM' + '0' * 32, 'AccountSid': 'AC' + '0' * 32}).encode()
+
+
+def create_logger() -> logging.Logger:
+    handler = logging.StreamHandler(open(os.devnull, 'w'))
+    handler.setFormatter(CustomLogger.CustomJsonFormatter('%(levelname)s %(name)s %(message)s'))
+    bench_logger = logging.getLogger('bench_middleware')
+    bench_logger.addHandler(handler)
+    bench_logger.setLevel(logging.INFO)
+    bench_logger.propagate = False
+    return bench_logger
+
+
+def create_app(static_dir: str, add_middleware: Callable[[FastAPI], None]) -> FastAPI:
+    app = FastAPI()
+
+    @app.post('/sms')
+    async def sms(request: Request):
+        await request.form()
+        return Response(content=TWIML_RESPONSE, media_type='application/xml')
+
+    @app.get('/')
+    async def home():
+        return HTMLResponse(HOME_PAGE)
+
+    app.mount('/static', StaticFiles(directory=static_dir), name='static')
+    add_middleware(app)
+    return app
+
+
+def create_scope(method: str, path: str, headers: List[Tuple[bytes, bytes]]) -> Dict:
+    return {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http', 'path': path,
+            'raw_path': path.encode(), 'root_path': '', 'query_string': b'', 'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+            'headers': [(b'host', b'testserver'), (b'authorization', b'Basic dXNlcm5hbWU6cGFzc3dvcmQ='), *headers]}
+
+
+async def call_app(app: FastAPI, method: str, path: str, body: bytes = b'', headers: List[Tuple[bytes, bytes]] = ()) -> int:
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent_bytes = 0
+
+    async def receive():
+        return messages.pop() if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal sent_bytes
+        sent_bytes += len(message.get('body', b''))
+
+    await app(create_scope(method, path, list(headers)), receive, send)
+    return sent_bytes
+
+
+async def _time_requests(app: FastAPI, request: Dict, iterations: int) -> float:
+    timings = []
+    for _ in range(iterations):
+        start_time = time.perf_counter()
+        await call_app(app, **request)
+        timings.append(time.perf_counter() - start_time)
+    return median(timings) * 1e6
+
+
+async def main(iterations: int):
+    bench_logger = create_logger()
+    with tempfile.TemporaryDirectory() as static_dir:
+        with open(os.path.join(static_dir, 'logo.png'), 'wb') as f:
+            f.write(os.urandom(STATIC_FILE_BYTES))
+        variants = {
+            'no_middleware': lambda app: None,
+            'legacy': lambda app: app.add_middleware(LegacyRouterLoggingMiddleware, logger=bench_logger),
+            'asgi': lambda app: app.add_middleware(RouterLoggingMiddleware, logger=bench_logger, skip_body_paths=['/'],
+                                                   skip_body_prefixes=['/static/']),
+            'asgi_sampled_10%': lambda app: app.add_middleware(RouterLoggingMiddleware, logger=bench_logger, sample_rate=0.1,
+                                                               skip_body_paths=['/'], skip_body_prefixes=['/static/']),
+        }
+        requests = {
+            'sms': {'method': 'POST', 'path': '/sms', 'body': SMS_FORM,
+                    'headers': [(b'content-type', b'application/x-www-form-urlencoded'), (b'content-length', str(len(SMS_FORM)).encode())]},
+            'home': {'method': 'GET', 'path': '/'},
+            'static': {'method': 'GET', 'path': '/static/logo.png'},
+        }
+        for name, add_middleware in variants.items():
+            app = create_app(static_dir, add_middleware)
+            for request in requests.values():
+                await _time_requests(app, request, 20)  # warm-up
+            results = {request_name: f'{await _time_requests(app, request, iterations):0.1f}us' for request_name, request in requests.items()}
+            print(f'{name:>18}: p50 {results}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations))
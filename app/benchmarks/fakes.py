@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+from backend.langchain.llm_client import LangchainClient
+from langchain_core.chat_history import (BaseChatMessageHistory,
+                                         InMemoryChatMessageHistory)
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import \
+    FakeListChatModel
+from langchain_core.runnables import RunnableLambda
+
+FAKE_DOCS = [Document(page_content=f'Travel tip #{i} for visiting California.') for i in range(4)]
+
+
+def create_fake_settings() -> SimpleNamespace:
+    """
+    Overview:
+        Minimal stand-in for Settings holding only the attributes the benchmarked components read
+    """
+    return SimpleNamespace(
+        configs_env=SimpleNamespace(environment='dev'),
+        configs_app=SimpleNamespace(openai_model='fake', openai_temperature='0.2', mongodb_collection_users='users',
+                                    mongodb_collection_chats='chats', chat_history_max_messages=20,
+                                    chat_history_max_tokens=1500, chat_summary_batch_messages=40, condense_question_skip_enabled=False,
+                                    condense_question_min_history_messages=2, condense_question_history_tail_messages=0,
+                                    condense_question_memo_max_entries=0, semantic_cache_enabled=False),
+        secrets_app=SimpleNamespace(app_username='username', app_password='password'),
+        secrets_twilio=SimpleNamespace(sending_number='+10000000000', account_sid='AC00000000000000000000000000000000',
+                                       auth_token='auth_token'),
+        secrets_openai=SimpleNamespace(api_key='api_key'),
+    )
+
+
+def get_empty_session_history(session_id: str) -> BaseChatMessageHistory:
+    return InMemoryChatMessageHistory()  # a fresh history keeps every call equally expensive
+
+
+class FakeLangchainClient(LangchainClient):
+    """
+    Overview:
+        LangchainClient with a canned chat model & retriever so only LangChain's own overhead is measured
+    """
+
+    def _init_llm_chat(self):
+        return FakeListChatModel(responses=['What is the best time to visit Yosemite?', 'Late spring, when the waterfalls peak.'])
+
+    def _init_embeddings(self):
+        return DeterministicFakeEmbedding(size=256)
+
+    def _init_retriever(self):
+        return RunnableLambda(lambda question: FAKE_DOCS)
@@ -0,0 +1,104 @@
+"""
+Synthetic multi-user sms traffic for the load test: every virtual user plays CONVERSATION (on-boarding, AI questions,
+"pidge human" pairing with another virtual user, relayed messages, back to the AI) with a new phone number each time round,
+with the messages of all users paced to a target rate
+"""
+import asyncio
+import random
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+
+from benchmarks.loadtest.fake_twilio import WebhookSigner
+
+AI_QUESTIONS = (
+    'What is the best time to visit Yosemite?',
+    'Where should I stay in San Francisco for 3 nights?',
+    'Is Highway 1 from Monterey to Big Sur open in winter?',
+    'What are some good day trips from Sacramento?',
+    'Which beaches near Los Angeles are good for kids?',
+)
+CONVERSATION: Tuple[Tuple[str, str], ...] = (  # (kind, body); None bodies are drawn from AI_QUESTIONS
+    ('onboarding', 'Hi'),
+    ('onboarding', 'Sam'),
+    ('onboarding', 'San Francisco, Sacramento'),
+    ('ai_question', None),
+    ('ai_question', None),
+    ('pairing', 'pidge human San Francisco'),
+    ('relay', 'Any tips for Golden Gate Park?'),
+    ('relay', 'Thanks, that helps a lot!'),
+    ('pairing', 'pidge ai'),
+    ('ai_question', None),
+)
+
+
+class Pacer:
+    """
+    Overview:
+        Hands out send slots at a fixed rate shared by all virtual users
+    """
+
+    def __init__(self, rate: float):
+        self.interval_seconds = 1 / rate
+        self.next_slot = time.perf_counter()
+
+    async def wait(self):
+        now = time.perf_counter()
+        slot = max(self.next_slot, now)
+        self.next_slot = slot + self.interval_seconds
+        await asyncio.sleep(slot - now)
+
+
+class ConversationDriver:
+    """
+    Overview:
+        Sends signed webhooks to the app from `users` virtual users until `duration_seconds` passed
+        & records the latency of every webhook call per message kind
+    """
+
+    def __init__(self, client: httpx.AsyncClient, sms_url: str, signer: WebhookSigner, twilio_number: str, rate: float, users: int,
+                 duration_seconds: float):
+        self.client = client
+        self.sms_url = sms_url
+        self.signer = signer
+        self.twilio_number = twilio_number
+        self.pacer = Pacer(rate)
+        self.users = users
+        self.duration_seconds = duration_seconds
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def run(self) -> float:
+        """
+        Returns:
+            - elapsed_seconds: float
+        """
+        start_time = time.perf_counter()
+        end_time = start_time + self.duration_seconds
+        await asyncio.gather(*(self._play_user(user, end_time) for user in range(self.users)))
+        return time.perf_counter() - start_time
+
+    async def _play_user(self, user: int, end_time: float):
+        conversation = 0
+        while time.perf_counter() < end_time:
+            phone_number = f'+1555{user:04d}{conversation:04d}'
+            for kind, body in CONVERSATION:
+                await self.pacer.wait()
+                if time.perf_counter() >= end_time:
+                    return
+                await self._send(kind, phone_number, body or random.choice(AI_QUESTIONS))
+            conversation += 1
+
+    async def _send(self, kind: str, phone_number: str, body: str):
+        params = {'From': phone_number, 'To': self.twilio_number, 'Body': body, 'MessageSid': f'SM{random.getrandbits(128):032x}'}
+        start_time = time.perf_counter()
+        try:
+            response = await self.client.post(self.sms_url, data=params, headers=self.signer.get_headers(params))
+            is_failed = response.status_code != 200
+        except httpx.HTTPError:
+            is_failed = True
+        if is_failed:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        else:
+            self.latencies.setdefault(kind, []).append(time.perf_counter() - start_time)
@@ -0,0 +1,91 @@
+"""
+OpenAI-compatible stand-in serving /v1/chat/completions & /v1/embeddings with a configurable latency & completion size
+Answers to the admin questions of IncomingSms are canned (every user is called Wanderer & can help with
+San Francisco & Sacramento) so the on-boarding & "pidge human" flows work; every other completion is filler text
+Embeddings are deterministic per input, so repeated questions hit the semantic answer cache like they would in production
+"""
+import asyncio
+import base64
+import hashlib
+import random
+import struct
+import time
+from typing import Dict, List, Union
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+EMBEDDING_DIMENSIONS = 256
+FAKE_USER_NAME = 'Wanderer'
+FAKE_USER_CITIES = 'San Francisco, Sacramento'
+FILLER_WORDS = ('Late', 'spring', 'is', 'a', 'great', 'time', 'to', 'visit', 'Yosemite', 'when', 'the', 'waterfalls', 'peak.')
+
+
+def _get_completion(messages: List[Dict], completion_tokens: int) -> str:
+    question = messages[-1]['content'] if messages else ''
+    if question.startswith('What is my name?'):
+        return FAKE_USER_NAME
+    if question.startswith('What are the cities I have indicated'):
+        return FAKE_USER_CITIES
+    return ' '.join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(completion_tokens))
+
+
+def _get_embedding(text_or_tokens: Union[str, List[int]], encoding_format: str) -> Union[List[float], str]:
+    seed = hashlib.sha256(repr(text_or_tokens).encode()).digest()
+    generator = random.Random(seed)
+    vector = [generator.gauss(0, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = sum(value * value for value in vector) ** 0.5
+    vector = [value / norm for value in vector]
+    if encoding_format == 'base64':
+        return base64.b64encode(struct.pack(f'<{EMBEDDING_DIMENSIONS}f', *vector)).decode()
+    return vector
+
+
+def create_app(latency_seconds: float, embedding_latency_seconds: float, completion_tokens: int) -> FastAPI:
+    app = FastAPI()
+    stats = {'chat_completions': 0, 'embeddings': 0, 'embedded_inputs': 0}
+
+    @app.post('/v1/chat/completions')
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats['chat_completions'] += 1
+        await asyncio.sleep(latency_seconds)
+        content = _get_completion(body.get('messages', []), completion_tokens)
+        prompt_tokens = sum(len(str(message.get('content', ''))) for message in body.get('messages', [])) // 4
+        return {
+            'id': f'chatcmpl-{stats["chat_completions"]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop', 'logprobs': None}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': len(content.split()),
+                      'total_tokens': prompt_tokens + len(content.split())}
+        }
+
+    @app.post('/v1/embeddings')
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body['input']
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        stats['embeddings'] += 1
+        stats['embedded_inputs'] += len(inputs)
+        await asyncio.sleep(embedding_latency_seconds)
+        encoding_format = body.get('encoding_format', 'float')
+        return {
+            'object': 'list',
+            'model': body.get('model', 'fake'),
+            'data': [{'object': 'embedding', 'index': i, 'embedding': _get_embedding(text, encoding_format)} for i, text in enumerate(inputs)],
+            'usage': {'prompt_tokens': len(inputs), 'total_tokens': len(inputs)}
+        }
+
+    @app.get('/stats')
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def serve(port: int, latency_seconds: float, embedding_latency_seconds: float, completion_tokens: int):
+    uvicorn.run(create_app(latency_seconds, embedding_latency_seconds, completion_tokens), host='127.0.0.1', port=port,
+                log_level='warning', access_log=False)
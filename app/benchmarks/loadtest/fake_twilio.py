@@ -0,0 +1,64 @@
+"""
+Twilio stand-ins: a REST endpoint accepting the outgoing sms of the app (Messages.json) & a signer producing
+X-Twilio-Signature headers that Routes.validate_twilio_signature (RequestValidator) accepts for the inbound webhook
+"""
+import asyncio
+import uuid
+from email.utils import formatdate
+from typing import Dict
+
+import uvicorn
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from twilio.request_validator import RequestValidator
+
+
+class WebhookSigner:
+    """
+    Overview:
+        Signs webhook requests the way Twilio does: HMAC-SHA1 of the full url + the sorted form params, keyed by the auth token
+    """
+
+    def __init__(self, auth_token: str, url: str):
+        self.url = url
+        self.validator = RequestValidator(auth_token)
+
+    def get_headers(self, params: Dict[str, str]) -> Dict[str, str]:
+        return {'X-Twilio-Signature': self.validator.compute_signature(self.url, params)}
+
+
+def create_app(latency_seconds: float) -> FastAPI:
+    app = FastAPI()
+    stats = {'messages': 0, 'recipients': set()}
+
+    @app.post('/2010-04-01/Accounts/{account_sid}/Messages.json')
+    async def create_message(account_sid: str, request: Request):
+        form = await request.form()
+        stats['messages'] += 1
+        stats['recipients'].add(form.get('To'))
+        await asyncio.sleep(latency_seconds)
+        sid = f'SM{uuid.uuid4().hex}'
+        return JSONResponse(status_code=status.HTTP_201_CREATED, content={
+            'sid': sid,
+            'account_sid': account_sid,
+            'to': form.get('To'),
+            'from': form.get('From'),
+            'body': form.get('Body'),
+            'status': 'queued',
+            'num_segments': '1',
+            'direction': 'outbound-api',
+            'api_version': '2010-04-01',
+            'date_created': formatdate(usegmt=True),
+            'date_updated': formatdate(usegmt=True),
+            'uri': f'/2010-04-01/Accounts/{account_sid}/Messages/{sid}.json'
+        })
+
+    @app.get('/stats')
+    async def get_stats():
+        return {'messages': stats['messages'], 'recipients': len(stats['recipients'])}
+
+    return app
+
+
+def serve(port: int, latency_seconds: float):
+    uvicorn.run(create_app(latency_seconds), host='127.0.0.1', port=port, log_level='warning', access_log=False)
@@ -0,0 +1,246 @@
+"""
+Offline end-to-end load test of the /sms webhook: boots the app (main.py, --workers processes) against a fake OpenAI, a fake Twilio
+(benchmarks.loadtest.fake_openai / fake_twilio) & a throwaway local mongod, drives synthetic conversations
+(benchmarks.loadtest.conversations) with signed webhooks at a target rate and reports the throughput, the p50 / p95 / p99
+webhook latency (overall & per message kind) and the MongoDB operations the run took (serverStatus opcounters)
+
+The app runs in the stage environment so Twilio signatures are validated; rate limits are raised out of the way
+Needs mongod on the PATH (or --mongod); on a fully offline box tiktoken's encodings have to be cached (TIKTOKEN_CACHE_DIR)
+Usage (from the app directory):
+    python -m benchmarks.loadtest.run --rate 20 --users 50 --duration 60 --output loadtest.json
+    python -m benchmarks.loadtest.run --rate 80 --users 200 --workers 4    # multi-worker production mode
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+from pymongo import MongoClient
+
+from benchmarks.loadtest import fake_openai, fake_twilio
+from benchmarks.loadtest.conversations import ConversationDriver
+from benchmarks.loadtest.fake_twilio import WebhookSigner
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ENVIRONMENT = 'stage'
+DATABASE_NAME = 'pigeon_loadtest'
+MONGODB_USERNAME = 'loadtest'
+MONGODB_PASSWORD = 'loadtest'
+APP_USERNAME = 'loadtest'
+APP_PASSWORD = 'loadtest'
+TWILIO_ACCOUNT_SID = 'AC' + '0' * 32
+TWILIO_AUTH_TOKEN = 'loadtest_auth_token'
+TWILIO_SENDING_NUMBER = '+15550000000'
+STARTUP_TIMEOUT_SECONDS = 120
+SHUTDOWN_TIMEOUT_SECONDS = 60  # above the graceful shutdown timeout of the app
+RETRIEVAL_DOCS = 20
+PERCENTILES = (50, 95, 99)
+
+
+def _get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until(is_ready, description: str, timeout_seconds: float = STARTUP_TIMEOUT_SECONDS):
+    end_time = time.monotonic() + timeout_seconds
+    while time.monotonic() < end_time:
+        try:
+            if is_ready():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f'{description} did not come up within {timeout_seconds}s')
+
+
+def _start_mongod(mongod: str, data_dir: str, port: int) -> subprocess.Popen:
+    if not shutil.which(mongod):
+        sys.exit(f'{mongod} not found - install MongoDB or pass --mongod /path/to/mongod')
+    process = subprocess.Popen([mongod, '--dbpath', data_dir, '--port', str(port), '--bind_ip', '127.0.0.1', '--quiet'],
+                               stdout=subprocess.DEVNULL)
+    client = MongoClient(port=port, serverSelectionTimeoutMS=1000)
+    _wait_until(lambda: client.admin.command('ping'), 'mongod')
+    client.admin.command('createUser', MONGODB_USERNAME, pwd=MONGODB_PASSWORD, roles=['root'])
+    client.close()
+    return process
+
+
+def _start_fake(serve, **kwargs) -> multiprocessing.Process:
+    process = multiprocessing.Process(target=serve, kwargs=kwargs, daemon=True)
+    process.start()
+    _wait_until(lambda: httpx.get(f'http://127.0.0.1:{kwargs["port"]}/stats').status_code == 200, serve.__module__)
+    return process
+
+
+def _write_json(file_path: str, data: Dict):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as f:
+        json.dump(data, f, indent=4)
+
+
+def _write_lines(file_path: str, lines: List[str]):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def _create_pigeon_root(root: str, args: argparse.Namespace, ports: Dict[str, int]):
+    """
+    Overview:
+        Lays out the .env, configs & secrets the app reads from PIGEON_ROOT (the /pigeon tree of the container)
+    """
+    _write_lines(os.path.join(root, '.env'), [
+        f'ENVIRONMENT={ENVIRONMENT}', f'APP_PORT_NUMBER={ports["app"]}', 'MONGODB_CONTAINER_NAME=127.0.0.1',
+        f'MONGODB_PORT_NUMBER={ports["mongodb"]}', f'MONGO_INITDB_DATABASE={DATABASE_NAME}', 'MONGO_AUTH_DATABASE=admin'])
+    _write_json(os.path.join(root, 'secrets', 'app.json'), {'app_username': APP_USERNAME, 'app_password': APP_PASSWORD})
+    _write_lines(os.path.join(root, 'secrets', 'mongodb', 'mongodb_credentials.txt'),
+                 [f'MONGO_INITDB_ROOT_USERNAME={MONGODB_USERNAME}', f'MONGO_INITDB_ROOT_PASSWORD={MONGODB_PASSWORD}'])
+    _write_json(os.path.join(root, 'secrets', 'twilio', '.twilio-cli', 'config.json'), {
+        'profiles': {'pigeon': {'accountSid': TWILIO_ACCOUNT_SID, 'authToken': TWILIO_AUTH_TOKEN}},
+        'twilio_sending_number': TWILIO_SENDING_NUMBER})
+    _write_lines(os.path.join(root, 'secrets', 'openai', 'openai_credentials.txt'), ['OPENAI_API_KEY=loadtest'])
+
+    docs_dir = os.path.join(root, 'retrieval_docs')
+    for i in range(RETRIEVAL_DOCS):
+        _write_lines(os.path.join(docs_dir, f'doc_{i}.txt'), [f'Travel guide #{i}: ' + 'Plan ahead for parking near the coast. ' * 40])
+
+    with open(os.path.join(APP_DIR, 'configs', 'configs.json')) as f:
+        configs = json.load(f)
+    configs['common'].update({
+        'web_static_dir': os.path.join(APP_DIR, 'frontend', 'static', ''),
+        'web_templates_dir': os.path.join(APP_DIR, 'frontend', 'templates', ''),
+        'city_gazetteer_file': os.path.join(APP_DIR, 'backend', 'utils', 'gazetteer', 'ca_cities.json'),
+        'langchain_retrieval_docs_dir': os.path.join(docs_dir, ''),
+        'langchain_vectorstore_dir': os.path.join(root, 'vectorstore', ''),
+        'twilio_api_base_url': f'http://127.0.0.1:{ports["twilio"]}',
+        'rate_limit_sms_per_day_per_user': 10 ** 6,
+        'rate_limit_sms_per_day_for_service': 10 ** 9,
+        'sms_reply_mode': args.reply_mode,
+    })
+    configs[ENVIRONMENT].update({'uvicorn_reload': False, 'uvicorn_workers': args.workers, 'logging_level': args.logging_level})
+    _write_json(os.path.join(root, 'app', 'configs', 'configs.json'), configs)
+
+
+def _start_app(root: str, ports: Dict[str, int], log_file) -> subprocess.Popen:
+    env = {**os.environ, 'PIGEON_ROOT': root, 'OPENAI_API_BASE': f'http://127.0.0.1:{ports["openai"]}/v1'}
+    process = subprocess.Popen([sys.executable, 'main.py'], cwd=APP_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+    def is_ready() -> bool:
+        if process.poll() is not None:
+            raise SystemExit(f'The app exited with code {process.returncode} - see {log_file.name}')
+        return httpx.get(f'http://127.0.0.1:{ports["app"]}/').status_code == 200
+
+    _wait_until(is_ready, f'The app (logs: {log_file.name})')
+    return process
+
+
+def _get_opcounters(port: int) -> Dict[str, int]:
+    client = MongoClient(port=port, username=MONGODB_USERNAME, password=MONGODB_PASSWORD)
+    try:
+        return dict(client.admin.command('serverStatus')['opcounters'])
+    finally:
+        client.close()
+
+
+def _get_percentiles(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {}
+    latencies = sorted(latencies)
+    summary = {f'p{p}': round(latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))] * 1000, 2) for p in PERCENTILES}
+    summary['max'] = round(latencies[-1] * 1000, 2)
+    return summary
+
+
+async def _drive(args: argparse.Namespace, ports: Dict[str, int]) -> Dict:
+    sms_url = f'http://127.0.0.1:{ports["app"]}/sms'
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(auth=(APP_USERNAME, APP_PASSWORD), limits=limits, timeout=args.request_timeout) as client:
+        driver = ConversationDriver(client, sms_url, WebhookSigner(TWILIO_AUTH_TOKEN, sms_url), TWILIO_SENDING_NUMBER, args.rate,
+                                    args.users, args.duration)
+        elapsed_seconds = await driver.run()
+    all_latencies = [latency for latencies in driver.latencies.values() for latency in latencies]
+    return {
+        'elapsed_seconds': round(elapsed_seconds, 2),
+        'requests': len(all_latencies),
+        'errors': driver.errors,
+        'throughput_rps': round(len(all_latencies) / elapsed_seconds, 2),
+        'latency_ms': _get_percentiles(all_latencies),
+        'latency_ms_by_kind': {kind: {'requests': len(latencies), **_get_percentiles(latencies)}
+                               for kind, latencies in driver.latencies.items()},
+    }
+
+
+def main(args: argparse.Namespace):
+    ports = {name: _get_free_port() for name in ('app', 'mongodb', 'openai', 'twilio')}
+    root = tempfile.mkdtemp(prefix='pigeon_loadtest_')
+    processes = []
+    app_process = None
+    try:
+        os.makedirs(os.path.join(root, 'mongodb'))
+        processes.append(_start_mongod(args.mongod, os.path.join(root, 'mongodb'), ports['mongodb']))
+        processes.append(_start_fake(fake_openai.serve, port=ports['openai'], latency_seconds=args.openai_latency,
+                                     embedding_latency_seconds=args.openai_embedding_latency, completion_tokens=args.completion_tokens))
+        processes.append(_start_fake(fake_twilio.serve, port=ports['twilio'], latency_seconds=args.twilio_latency))
+        _create_pigeon_root(root, args, ports)
+        with open(os.path.join(root, 'app.log'), 'w') as log_file:
+            print(f'Starting the app (logs: {log_file.name})..')
+            app_process = _start_app(root, ports, log_file)
+
+            print(f'Driving {args.users} users at {args.rate} sms/s for {args.duration}s ({args.reply_mode} replies, {args.workers} workers)..')
+            opcounters_before = _get_opcounters(ports['mongodb'])
+            report = asyncio.run(_drive(args, ports))
+            time.sleep(args.settle)  # let queued outgoing sms & deferred replies go out
+            opcounters_after = _get_opcounters(ports['mongodb'])
+            report['mongodb_ops'] = {op: opcounters_after[op] - opcounters_before.get(op, 0) for op in opcounters_after}
+            report['mongodb_ops_per_request'] = {op: round(count / max(report['requests'], 1), 2) for op, count in report['mongodb_ops'].items()}
+            report['openai'] = httpx.get(f'http://127.0.0.1:{ports["openai"]}/stats').json()
+            report['twilio'] = httpx.get(f'http://127.0.0.1:{ports["twilio"]}/stats').json()
+            report['config'] = {key: getattr(args, key) for key in ('rate', 'users', 'duration', 'reply_mode', 'workers', 'openai_latency',
+                                                                   'openai_embedding_latency', 'completion_tokens', 'twilio_latency')}
+    finally:
+        if app_process and app_process.poll() is None:
+            app_process.terminate()  # SIGTERM lets uvicorn run the shutdown hooks
+            app_process.wait(SHUTDOWN_TIMEOUT_SECONDS)
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait() if isinstance(process, subprocess.Popen) else process.join()
+        if args.keep_root:
+            print(f'Kept the run directory: {root}')
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print(json.dumps(report, indent=4))
+    if args.output:
+        _write_json(os.path.abspath(args.output), report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=20, help='target sms per second across all users')
+    parser.add_argument('--users', type=int, default=50, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to drive traffic for')
+    parser.add_argument('--reply-mode', choices=['inline', 'deferred'], default='inline')
+    parser.add_argument('--workers', type=int, default=1, help='app worker processes (0: one per cpu core)')
+    parser.add_argument('--openai-latency', type=float, default=0.5, help='seconds per chat completion')
+    parser.add_argument('--openai-embedding-latency', type=float, default=0.05, help='seconds per embeddings request')
+    parser.add_argument('--completion-tokens', type=int, default=50)
+    parser.add_argument('--twilio-latency', type=float, default=0.1, help='seconds per outgoing sms')
+    parser.add_argument('--request-timeout', type=float, default=60)
+    parser.add_argument('--settle', type=float, default=5, help='seconds to wait for background work after the traffic stops')
+    parser.add_argument('--logging-level', default='WARNING')
+    parser.add_argument('--mongod', default='mongod')
+    parser.add_argument('--output', help='also write the report to this json file')
+    parser.add_argument('--keep-root', action='store_true', help='keep the run directory (app log, configs, mongod data)')
+    main(parser.parse_args())
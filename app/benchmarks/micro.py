@@ -0,0 +1,249 @@
+"""
+Micro-benchmarks of the components on the per-message path: admin command parsing, TwiML generation, the request logging
+middleware, Twilio signature validation, UserDto decoding & LangChain chain assembly / invocation with a fake chat model
+Needs no credentials, network or mongod so it can run in CI on a plain Linux box
+
+Each case is timed as the median over --rounds rounds of the mean time per call. Timings are normalized by a fixed
+pure-python calibration loop, so a baseline recorded on one box can be checked on another
+A case regresses if it got slower than its baseline by more than --threshold (relative) AND --min-regression-us (absolute);
+the run then exits with status 1
+
+Usage (from the app directory):
+    python -m benchmarks.micro                      # check against benchmarks/baselines/micro.json
+    python -m benchmarks.micro --update-baseline    # record a new baseline (commit it along with the change that moved it)
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+from statistics import median
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import parse_qsl
+
+from backend.dto.user_dto import RATE_LIMITED_USER_FIELDS, UserDto
+from backend.middleware import RouterLoggingMiddleware
+from backend.routes import Routes
+from backend.twilio.incoming_sms import IncomingSms
+from backend.utils.generic import custom_logger
+from backend.utils.rate_limiter import RateLimitPolicy
+from starlette.datastructures import FormData
+from starlette.requests import Request
+
+from benchmarks.bench_middleware import (SMS_FORM, call_app, create_app,
+                                         create_logger)
+from benchmarks.fakes import (FakeLangchainClient, create_fake_settings,
+                              get_empty_session_history)
+from benchmarks.loadtest.fake_twilio import WebhookSigner
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'micro.json')
+SMS_URL = 'http://testserver/sms'
+SMS_HEADERS = [(b'content-type', b'application/x-www-form-urlencoded'), (b'content-length', str(len(SMS_FORM)).encode())]
+ADMIN_COMMAND_BODIES = ('pidge help', 'pidge name', 'pidge fly me to the moon', 'What is the best time to visit Yosemite?')
+REPLY = 'Late spring, when the waterfalls peak. Book Yosemite Valley lodging early and check Tioga Pass road status. ' * 3
+USER_DOCUMENT = {'_id': 'user', 'phone_number': '+10000000001', 'name': 'Wanderer', 'cities_ca': ['San Francisco', 'Sacramento'],
+                 'city_ids': ['san_francisco', 'sacramento'], 'time_last_sms': datetime(2024, 1, 1), 'sms_counter': 3,
+                 'deletion_date': datetime(2099, 12, 31, 23, 59, 59), 'connected_phone_number': None, 'connected_name': None,
+                 'connected_at': None, 'last_helped_at': None, 'helper_missed_count': 0, 'connection_replied': None}
+CALIBRATION_LOOPS = 10000
+
+
+class CannedReplyIncomingSms(IncomingSms):
+    async def get_reply(self) -> str:
+        return REPLY
+
+
+def _create_settings():
+    settings = create_fake_settings()
+    settings.configs_env.environment = 'stage'  # signatures are only validated outside dev
+    settings.configs_app.web_templates_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend',
+                                                          'templates')
+    settings.configs_app.web_route_home = '/'
+    settings.configs_app.web_route_sms = '/sms'
+    settings.configs_app.web_route_metrics = '/metrics'
+    settings.configs_app.mongodb_collection_chat_summaries = 'chat_summaries'
+    return settings
+
+
+def _create_incoming_sms(settings, incoming_sms_class=IncomingSms) -> IncomingSms:
+    mongodb_dao = SimpleNamespace(mongodb_client=SimpleNamespace(get_collection=lambda name: None), collection_users=None)
+    rate_limiter = SimpleNamespace(policy_user=RateLimitPolicy('user', 50))
+    incoming_sms = incoming_sms_class(settings, mongodb_dao, None, None, rate_limiter, None, USER_DOCUMENT['phone_number'], '')
+    incoming_sms.user = UserDto.from_document(USER_DOCUMENT)
+    return incoming_sms
+
+
+async def _create_admin_command_parsing(settings) -> Callable:
+    incoming_sms = _create_incoming_sms(settings)
+    bodies = itertools.cycle(ADMIN_COMMAND_BODIES)
+
+    async def call():
+        incoming_sms.sms_body = next(bodies)
+        await incoming_sms._process_admin_commands()
+    return call
+
+
+async def _create_twiml_get_response(settings) -> Callable:
+    return _create_incoming_sms(settings, CannedReplyIncomingSms).get_response
+
+
+async def _create_sms_request(settings, with_middleware: bool) -> Callable:
+    bench_logger = create_logger()
+
+    def add_middleware(app):
+        if with_middleware:
+            app.add_middleware(RouterLoggingMiddleware, logger=bench_logger)
+    app = create_app(tempfile.gettempdir(), add_middleware)  # no static files are requested
+    return lambda: call_app(app, 'POST', '/sms', SMS_FORM, SMS_HEADERS)
+
+
+async def _create_validate_twilio_signature(settings) -> Callable:
+    routes = Routes(settings, None, None, None, None, None, None, None)
+    params = dict(parse_qsl(SMS_FORM.decode()))
+    signature_headers = WebhookSigner(settings.secrets_twilio.auth_token, SMS_URL).get_headers(params)
+    request = Request({'type': 'http', 'method': 'POST', 'scheme': 'http', 'server': ('testserver', 80), 'path': '/sms',
+                       'query_string': b'', 'root_path': '', 'headers': [(b'host', b'testserver'), *SMS_HEADERS,
+                       *((name.lower().encode(), value.encode()) for name, value in signature_headers.items())]})
+    form = FormData(params)
+    return lambda: routes.validate_twilio_signature(request, form)
+
+
+async def _create_user_dto_from_document(settings) -> Callable:
+    return lambda: UserDto.from_document(USER_DOCUMENT)
+
+
+async def _create_user_dto_from_projected_document(settings) -> Callable:
+    document = {field: USER_DOCUMENT[field] for field in RATE_LIMITED_USER_FIELDS}
+    return lambda: UserDto.from_document(document, projected=True)
+
+
+async def _create_chain_assembly(settings) -> Callable:
+    return FakeLangchainClient(settings, get_empty_session_history)._create_chain_user
+
+
+async def _create_chain_user_invoke(settings) -> Callable:
+    langchain_client = FakeLangchainClient(settings, get_empty_session_history)
+    config = {'configurable': {'session_id': USER_DOCUMENT['phone_number']}}
+    return lambda: langchain_client.chain_user.ainvoke({'question': 'When should I go?'}, config=config)
+
+
+CASES: Dict[str, Callable[..., Awaitable[Callable]]] = {
+    'admin_command_parsing': _create_admin_command_parsing,
+    'twiml_get_response': _create_twiml_get_response,
+    'sms_request_without_middleware': lambda settings: _create_sms_request(settings, with_middleware=False),
+    'sms_request_with_middleware': lambda settings: _create_sms_request(settings, with_middleware=True),
+    'validate_twilio_signature': _create_validate_twilio_signature,
+    'user_dto_from_document': _create_user_dto_from_document,
+    'user_dto_from_projected_document': _create_user_dto_from_projected_document,
+    'chain_assembly': _create_chain_assembly,
+    'chain_user_invoke': _create_chain_user_invoke,
+}
+
+
+async def _time_round(call: Callable, number: int) -> float:
+    start_time = time.perf_counter()
+    for _ in range(number):
+        result = call()
+        if asyncio.iscoroutine(result):
+            await result
+    return (time.perf_counter() - start_time) / number
+
+
+async def _time_case(call: Callable, rounds: int, round_seconds: float, warmup_seconds: float) -> float:
+    """
+    Returns:
+        - microseconds: float (median over the rounds of the mean time per call)
+    """
+    warmup_end_time = time.perf_counter() + warmup_seconds
+    while time.perf_counter() < warmup_end_time:  # e.g. LangChain's caches take a few dozen calls to settle
+        await _time_round(call, 1)
+    number = 1
+    while (elapsed := await _time_round(call, number) * number) < round_seconds:
+        number = max(number * 2, int(number * round_seconds / max(elapsed, 1e-9)))
+    return median([await _time_round(call, number) for _ in range(rounds)]) * 1e6
+
+
+async def _calibrate(args: argparse.Namespace) -> float:
+    return await _time_case(lambda: sum(i * i for i in range(CALIBRATION_LOOPS)), args.rounds, args.round_seconds, args.warmup_seconds)
+
+
+def _read_baseline(baseline_file: str) -> Optional[Dict]:
+    if not os.path.exists(baseline_file):
+        return None
+    with open(baseline_file) as f:
+        return json.load(f)
+
+
+def _compare(results: Dict, baseline: Dict, threshold: float, min_regression_us: float) -> bool:
+    """
+    Returns:
+        - is_regressed: bool
+    """
+    scale = baseline['calibration_us'] / results['calibration_us']  # > 1 if this box is faster than the one of the baseline
+    is_regressed = False
+    print(f'{"case":>34} {"baseline":>12} {"current":>12} {"change":>8}  (this box is {scale:0.2f}x the baseline box)')
+    for name, current_us in results['cases'].items():
+        normalized_us = current_us * scale
+        baseline_us = baseline['cases'].get(name)
+        if baseline_us is None:
+            print(f'{name:>34} {"-":>12} {normalized_us:>10.2f}us {"new":>8}')
+            continue
+        change = normalized_us / baseline_us - 1
+        is_case_regressed = change > threshold and normalized_us - baseline_us > min_regression_us
+        is_regressed |= is_case_regressed
+        print(f'{name:>34} {baseline_us:>10.2f}us {normalized_us:>10.2f}us {change:>+8.1%}{"  REGRESSED" if is_case_regressed else ""}')
+    return is_regressed
+
+
+async def main(args: argparse.Namespace) -> int:
+    custom_logger.change_logging_level(root_logging_level=logging.ERROR)
+    settings = _create_settings()
+    names = args.cases or list(CASES)
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'calibration_us': round(await _calibrate(args), 3),
+        'cases': {}
+    }
+    for name in names:
+        call = await CASES[name](settings)
+        results['cases'][name] = round(await _time_case(call, args.rounds, args.round_seconds, args.warmup_seconds), 3)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(json.dumps(results, indent=4))
+        print(f'Baseline written to {args.baseline}')
+        return 0
+    baseline = _read_baseline(args.baseline)
+    if baseline is None:
+        print(json.dumps(results, indent=4))
+        print(f'No baseline at {args.baseline} - record one with --update-baseline')
+        return 0
+    is_regressed = _compare(results, baseline, args.threshold, args.min_regression_us)
+    return 1 if is_regressed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), help='run only these cases')
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--round-seconds', type=float, default=0.1, help='minimum duration of a round')
+    parser.add_argument('--warmup-seconds', type=float, default=1, help='time each case is run for before it is measured')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown which counts as a regression')
+    parser.add_argument('--min-regression-us', type=float, default=20, help='slowdowns smaller than this never count as a regression')
+    parser.add_argument('--output', help='also write the results to this json file')
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,33 @@
+"""
+Backfills the canonical city_ids of existing users from their cities_ca so helper matching can use the city index
+
+Usage (from the app directory, e.g. inside the app container):
+    python -m jobs.backfill_city_ids --batch-size 1000 [--overwrite]
+"""
+import argparse
+import asyncio
+
+from backend.dao.mongodb_client import MongodbClient
+from backend.dao.mongodb_dao import MongodbDao
+from backend.utils.generic import logger
+from backend.utils.settings_accumalator import SettingsAccumalator
+
+
+async def main(batch_size: int, overwrite: bool):
+    settings = SettingsAccumalator().settings
+    mongodb_client = MongodbClient(settings)
+    try:
+        mongodb_dao = MongodbDao(settings, mongodb_client)
+        await mongodb_dao.create_indexes()
+        updated_count = await mongodb_dao.backfill_city_ids(batch_size, overwrite)
+        logger.info(f'Backfilled city ids of {updated_count} users')
+    finally:
+        mongodb_client.close_connection()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--overwrite', action='store_true', help='recompute city ids of users which already have them')
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.overwrite))
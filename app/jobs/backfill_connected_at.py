@@ -0,0 +1,30 @@
+"""
+Backfills connected_at of human connections made before it was recorded, so the connection expiry scheduler ends them
+connection_expiry_hours after the backfill
+
+Usage (from the app directory, e.g. inside the app container):
+    python -m jobs.backfill_connected_at
+"""
+import argparse
+import asyncio
+
+from backend.dao.mongodb_client import MongodbClient
+from backend.dao.mongodb_dao import MongodbDao
+from backend.utils.generic import logger
+from backend.utils.settings_accumalator import SettingsAccumalator
+
+
+async def main():
+    settings = SettingsAccumalator().settings
+    mongodb_client = MongodbClient(settings)
+    try:
+        mongodb_dao = MongodbDao(settings, mongodb_client)
+        updated_count = await mongodb_dao.backfill_connected_at()
+        logger.info(f'Backfilled connected_at of {updated_count} connected users')
+    finally:
+        mongodb_client.close_connection()
+
+
+if __name__ == '__main__':
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    asyncio.run(main())
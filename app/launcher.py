@@ -1,19 +1,55 @@
+from contextlib import asynccontextmanager
+from os import environ
+
+from backend.admin_routes import AdminRoutes
+from backend.dao.mongodb_chat_history import MongodbChatSummaryStore
+from backend.dao.mongodb_client import MongodbClient
 from backend.dao.mongodb_dao import MongodbDao
+from backend.dao.mongodb_langchain_dao import MongodbLangchainDao
+from backend.dao.mongodb_matchmaker import MongodbMatchmaker
+from backend.dao.mongodb_rate_limiter import MongodbRateLimiter
+from backend.dao.mongodb_service_quota import MongodbServiceQuota
 from backend.langchain.llm_client import LangchainClient
 from backend.middleware import RouterLoggingMiddleware
 from backend.routes import Routes
+from backend.twilio.connection_expiry import ConnectionExpiryScheduler
+from backend.twilio.outgoing_sms import create_twilio_client
+from backend.twilio.outgoing_sms_queue import OutgoingSmsQueue
+from backend.utils.diagnostics import SamplingProfiler, SlowRequestLog
 from backend.utils.generic import custom_logger, logger
+from backend.utils.rate_limiter import (RATE_LIMIT_MODE_TOKEN_BUCKET,
+                                        RateLimiter, RateLimitPolicy,
+                                        TokenBucketRateLimiter)
 from backend.utils.settings_accumalator import SettingsAccumalator
+from backend.utils.task_pool import BackgroundTaskPool
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
-from twilio.rest import Client as TwilioClient
+
+RETRIEVAL_INDEX_SHARED_ENV = 'PIGEON_RETRIEVAL_INDEX_SHARED'  # set by main.py once it synced the index for its worker processes
 
 
 class Launcher:
+    """
+    Overview:
+        Builds the app in two steps: settings, logging & the FastAPI app itself at import time, and every resource holding
+        connections, threads or sessions (MongoDB pool, Twilio http client, Chroma, background workers) in the lifespan hook,
+        i.e. inside each worker process once it started - so nothing is shared across a fork or built in a process which never serves
+    """
+
     def __init__(self):
         self.settings = None
         self.twilio_client = None
+        self.outgoing_sms_queue = None
+        self.task_pool = None
+        self.mongodb_client = None
         self.mongodb_dao = None
+        self.rate_limiter = None
+        self.matchmaker = None
+        self.connection_expiry_scheduler = None
+        self.service_quota = None
+        self.langchain_client = None
+        self.slow_request_log = None
+        self.profiler = None
         self.launch()
 
     def launch(self):
@@ -21,31 +57,136 @@ class Launcher:
         self.settings = SettingsAccumalator().settings
         custom_logger.change_formatter(minimized=self.settings.configs_app.logging_format_minimized)
         custom_logger.change_logging_level(root_logging_level=self.settings.configs_app.logging_level)
+        if self.settings.configs_app.logging_queue_enabled:
+            configs_app = self.settings.configs_app
+            custom_logger.enable_queue(configs_app.logging_queue_max_size, configs_app.logging_queue_drop_policy,
+                                       configs_app.logging_rate_limit_records_per_second, configs_app.logging_rate_limit_burst)
+
+        logger.info('Creating slow request log & profiler..')
+        self.slow_request_log = SlowRequestLog(self.settings.configs_app.slow_request_threshold_seconds,
+                                               self.settings.configs_app.slow_request_log_max_entries)
+        self.profiler = SamplingProfiler(self.settings.configs_app.profiler_sample_interval_seconds,
+                                         self.settings.configs_app.profiler_max_seconds)
+
+    def create_resources(self):
+        """
+        Overview:
+            Creates the per-process resources; runs in the lifespan hook of every worker process
+        """
+        logger.info('Creating MongoDB client..')
+        self.mongodb_client = MongodbClient(self.settings)
 
         logger.info('Creating user DAO..')
-        self.mongodb_dao = MongodbDao(self.settings)
+        self.mongodb_dao = MongodbDao(self.settings, self.mongodb_client)
+
+        logger.info('Creating helper matchmaker..')
+        collection_helper_waitlist = self.mongodb_client.get_collection(self.settings.configs_app.mongodb_collection_helper_waitlist)
+        self.matchmaker = MongodbMatchmaker(self.settings, self.mongodb_dao.collection_users, collection_helper_waitlist,
+                                            self.mongodb_dao.city_gazetteer, self.mongodb_dao.user_cache)
+
+        logger.info('Creating rate limiter..')
+        self.rate_limiter = self._create_rate_limiter()
 
         logger.info('Creating Twilio client..')
-        self.twilio_client = TwilioClient(self.settings.secrets_twilio.account_sid, self.settings.secrets_twilio.auth_token)
+        self.twilio_client = create_twilio_client(self.settings)
+
+        logger.info('Creating outgoing sms queue..')
+        collection_outgoing_sms = self.mongodb_client.get_collection(self.settings.configs_app.mongodb_collection_outgoing_sms)
+        self.outgoing_sms_queue = OutgoingSmsQueue(self.settings, collection_outgoing_sms, self.twilio_client)
+
+        logger.info('Creating connection expiry scheduler..')
+        self.connection_expiry_scheduler = ConnectionExpiryScheduler(self.settings, self.mongodb_dao.collection_users, self.matchmaker,
+                                                                     self.outgoing_sms_queue)
+
+        logger.info('Creating background task pool for deferred replies & chat summaries..')
+        self.task_pool = BackgroundTaskPool(self.settings.configs_app.deferred_reply_max_concurrency,
+                                            self.settings.configs_app.deferred_reply_max_pending)
 
         logger.info('Creating LangChain client..')
-        self.langchain_client = LangchainClient(self.settings)
+        get_session_history = MongodbLangchainDao.get_session_history_factory(self.settings, self.mongodb_client)
+        chat_summary_store = MongodbChatSummaryStore(self.mongodb_client.get_collection(self.settings.configs_app.mongodb_collection_chat_summaries))
+        self.langchain_client = LangchainClient(self.settings, get_session_history, chat_summary_store, self.task_pool,
+                                                is_retrieval_index_shared=environ.get(RETRIEVAL_INDEX_SHARED_ENV) == '1')
+
+    def _create_rate_limiter(self) -> RateLimiter:
+        configs_app = self.settings.configs_app
+        policy_user = RateLimitPolicy('user', configs_app.rate_limit_sms_per_day_per_user)
+        policy_service = RateLimitPolicy('service', configs_app.rate_limit_sms_per_day_for_service)
+        if configs_app.rate_limit_mode == RATE_LIMIT_MODE_TOKEN_BUCKET:
+            return TokenBucketRateLimiter(policy_user, policy_service)
+        self.service_quota = MongodbServiceQuota(
+            self.mongodb_client.get_collection(configs_app.mongodb_collection_service_counters),
+            configs_app.rate_limit_sms_per_day_for_service,
+            configs_app.service_quota_shards,
+            configs_app.service_quota_count_cache_seconds
+        )
+        return MongodbRateLimiter(policy_user, policy_service, self.mongodb_dao.collection_users, self.service_quota)
+
+    @asynccontextmanager
+    async def lifespan(self, app: FastAPI):
+        self.create_resources()
+        self.include_routes(app)
+        await self.startup()
+        try:
+            yield
+        finally:
+            await self.shutdown()
+
+    async def startup(self):
+        logger.info('Creating MongoDB indexes..')
+        await self.mongodb_dao.create_indexes()
+        await self.matchmaker.create_indexes()
+        await MongodbLangchainDao.create_indexes(self.settings, self.mongodb_client)
+        if self.service_quota:
+            await self.service_quota.create_indexes()
+        await self.outgoing_sms_queue.create_indexes()
+        self.outgoing_sms_queue.start()
+        self.connection_expiry_scheduler.start()
+        if self.mongodb_dao.user_cache:
+            await self.mongodb_dao.user_cache.start()
+
+    async def shutdown(self):
+        await self.connection_expiry_scheduler.stop()
+        if self.mongodb_dao.user_cache:
+            await self.mongodb_dao.user_cache.stop()
+        await self.task_pool.drain()
+        await self.outgoing_sms_queue.stop()
+        logger.info('Closing Twilio & MongoDB connections..')
+        await self.twilio_client.http_client.close()
+        self.mongodb_client.close_connection()
 
     def configure_app(self, app: FastAPI):
+        """
+        Overview:
+            Adds the middleware & static files, which must be in place before the app starts; the routes need the
+            per-process resources and are added by the lifespan hook (include_routes)
+        """
         logger.info('Configuring FastAPI app..')
+        configs_app = self.settings.configs_app
         app.add_middleware(
             RouterLoggingMiddleware,
-            logger=logger
+            logger=logger,
+            sample_rate=configs_app.request_logging_sample_rate,
+            max_body_bytes=configs_app.request_logging_max_body_bytes,
+            redacted_headers=configs_app.request_logging_redacted_headers,
+            skip_body_paths=[configs_app.web_route_home, configs_app.web_route_metrics],
+            skip_body_prefixes=[configs_app.web_route_static.rstrip('/') + '/', configs_app.web_route_admin.rstrip('/') + '/'],
+            slow_request_log=self.slow_request_log
         )
-        routes = Routes(self.settings, self.mongodb_dao, self.twilio_client, self.langchain_client)
-        app.include_router(routes.router)
         app.mount(
             path=self.settings.configs_app.web_route_static,
             app=StaticFiles(directory=self.settings.configs_app.web_static_dir),
             name="static"
         )
 
+    def include_routes(self, app: FastAPI):
+        routes = Routes(self.settings, self.mongodb_dao, self.outgoing_sms_queue, self.langchain_client, self.rate_limiter,
+                        self.matchmaker, self.task_pool, self.slow_request_log)
+        app.include_router(routes.router)
+        admin_routes = AdminRoutes(self.settings, routes.authorize, self.slow_request_log, self.profiler)
+        app.include_router(admin_routes.router)
+
 
-app = FastAPI()
 launcher = Launcher()
+app = FastAPI(lifespan=launcher.lifespan)
 launcher.configure_app(app)
@@ -1,12 +1,42 @@
-from backend.utils.generic import custom_logger
-from launcher import launcher
+from os import cpu_count, environ
+from typing import Dict
+
+from backend.langchain.llm_client import LangchainClient
+from backend.utils.generic import logger
+from backend.utils.rate_limiter import RATE_LIMIT_MODE_TOKEN_BUCKET
+from backend.utils.settings_accumalator import Settings
 from uvicorn import run
 
+
+def get_uvicorn_options(settings: Settings) -> Dict:
+    """
+    Overview:
+        Options of uvicorn.run; no log_config since the app configured logging itself (custom_logger) - uvicorn would apply
+        a dictConfig on top, replacing the queue handler of the root logger - so uvicorn's loggers simply propagate to the root logger
+    """
+    configs_app = settings.configs_app
+    return {
+        'host': '0.0.0.0',
+        'port': settings.configs_env.app_port_number,
+        'reload': configs_app.uvicorn_reload,
+        'workers': 1 if configs_app.uvicorn_reload else configs_app.uvicorn_workers or cpu_count(),  # 0 workers: one per core
+        'timeout_graceful_shutdown': configs_app.uvicorn_graceful_shutdown_seconds,  # in-flight webhooks get this long on SIGTERM
+        'log_config': None
+    }
+
+
+def main():
+    from launcher import RETRIEVAL_INDEX_SHARED_ENV, launcher  # builds the settings, logging & app; not needed by get_uvicorn_options
+    options = get_uvicorn_options(launcher.settings)
+    workers = options['workers']
+    if workers > 1:
+        logger.info(f'Syncing the retrieval index shared by {workers} worker processes..')
+        LangchainClient.sync_shared_retrieval_index(launcher.settings)
+        environ[RETRIEVAL_INDEX_SHARED_ENV] = '1'  # inherited by the workers
+        if launcher.settings.configs_app.rate_limit_mode == RATE_LIMIT_MODE_TOKEN_BUCKET:
+            logger.warning(f'Token bucket rate limits are per process - each of the {workers} workers allows the full limits')
+    run('launcher:app', **options)
+
+
 if __name__ == '__main__':
-    run(
-        'launcher:app',
-        host='0.0.0.0',
-        port=launcher.settings.configs_env.app_port_number,
-        reload=launcher.settings.configs_app.uvicorn_reload,
-        log_config=custom_logger.logging_config
-    )
+    main()
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+from backend.utils.settings_accumalator import Settings
+from mongomock_motor import AsyncMongoMockClient
+
+from benchmarks.fakes import create_fake_settings
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class MongomockClient:
+    """
+    Overview:
+        In-memory stand-in for MongodbClient (mongomock-motor), exposing the same collections API to the DAOs
+    """
+
+    def __init__(self):
+        self.client = AsyncMongoMockClient()
+        self.db = self.client['pigeon_tests']
+
+    def get_collection(self, collection_name: str):
+        collection = self.db[collection_name]
+        collection.delegate = collection._AsyncMongoMockCollection__collection  # the wrapped sync collection, like Motor's delegate
+        return collection
+
+    def close_connection(self):
+        self.client.close()
+
+
+class RecordingOutgoingSmsQueue:
+    """
+    Overview:
+        Stand-in for OutgoingSmsQueue which records the enqueued sms instead of delivering them
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    async def enqueue(self, to: str, body: str) -> bool:
+        self.messages.append((to, body))
+        return True
+
+
+def create_configs_app(**overrides) -> Settings.ConfigsApp:
+    """
+    Overview:
+        The dev configs of configs/configs.json with the file paths pointed into this checkout
+    """
+    with open(os.path.join(APP_DIR, 'configs', 'configs.json')) as f:
+        configs = json.load(f)
+    return Settings.ConfigsApp({
+        **configs['common'],
+        **configs['dev'],
+        'web_static_dir': os.path.join(APP_DIR, 'frontend', 'static', ''),
+        'web_templates_dir': os.path.join(APP_DIR, 'frontend', 'templates', ''),
+        'city_gazetteer_file': os.path.join(APP_DIR, 'backend', 'utils', 'gazetteer', 'ca_cities.json'),
+        **overrides
+    })
+
+
+@pytest.fixture
+def settings():
+    settings = create_fake_settings()
+    settings.configs_app = create_configs_app()
+    return settings
+
+
+@pytest.fixture
+def mongodb_client():
+    mongodb_client = MongomockClient()
+    yield mongodb_client
+    mongodb_client.close_connection()
+
+
+@pytest.fixture
+def outgoing_sms_queue() -> RecordingOutgoingSmsQueue:
+    return RecordingOutgoingSmsQueue()
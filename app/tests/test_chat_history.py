@@ -0,0 +1,78 @@
+import asyncio
+
+from backend.dao.mongodb_chat_history import (SESSION_INDEX_KEYS,
+                                              MongodbChatMessageHistory)
+from langchain_core.messages import AIMessage, HumanMessage
+
+SESSION_ID, OTHER_SESSION_ID = '+15550000001', '+15550000002'
+MESSAGES = [HumanMessage('I am going to Fresno'), AIMessage('Enjoy Fresno!'), HumanMessage('Is it hot?'), AIMessage('Very hot in summer.')]
+
+
+def _create_history(mongodb_client, session_id: str = SESSION_ID) -> MongodbChatMessageHistory:
+    return MongodbChatMessageHistory(mongodb_client.get_collection('chats'), session_id)
+
+
+def test_sync_access_matches_async_access(mongodb_client):
+    history = _create_history(mongodb_client)
+
+    history.add_messages(MESSAGES[:2])
+    asyncio.run(history.aadd_messages(MESSAGES[2:]))
+
+    assert history.messages == asyncio.run(history.aget_messages()) == MESSAGES
+    assert [message for _, message in history.get_recent_messages(2)] == MESSAGES[2:]
+
+
+def test_sync_clear_only_clears_the_session(mongodb_client):
+    history, other_history = _create_history(mongodb_client), _create_history(mongodb_client, OTHER_SESSION_ID)
+    history.add_messages(MESSAGES)
+    other_history.add_messages(MESSAGES[:1])
+
+    history.clear()
+
+    assert history.messages == []
+    assert other_history.messages == MESSAGES[:1]
+
+
+def test_recent_messages_are_scoped_to_the_session(mongodb_client):
+    history, other_history = _create_history(mongodb_client), _create_history(mongodb_client, OTHER_SESSION_ID)
+
+    async def add_and_read():
+        await history.aadd_messages(MESSAGES)
+        await other_history.aadd_messages([HumanMessage('I am going to Eureka')])
+        return await history.aget_recent_messages(3), await other_history.aget_recent_messages(3)
+
+    recent_messages, other_recent_messages = asyncio.run(add_and_read())
+
+    assert [message for _, message in recent_messages] == MESSAGES[-3:]  # oldest first
+    assert [message.content for _, message in other_recent_messages] == ['I am going to Eureka']
+
+
+def test_delete_recent_messages_only_deletes_the_newest_of_the_session(mongodb_client):
+    history, other_history = _create_history(mongodb_client), _create_history(mongodb_client, OTHER_SESSION_ID)
+
+    async def add_and_delete():
+        await other_history.aadd_messages(MESSAGES)
+        await history.aadd_messages(MESSAGES)
+        return await history.adelete_recent_messages(2)
+
+    assert asyncio.run(add_and_delete()) == 2
+    assert history.messages == MESSAGES[:2]
+    assert other_history.messages == MESSAGES
+
+
+def test_messages_between_ids_are_bounded(mongodb_client):
+    history = _create_history(mongodb_client)
+    history.add_messages(MESSAGES)
+    ids = [message_id for message_id, _ in history.get_recent_messages(len(MESSAGES))]
+
+    messages_between = asyncio.run(history.aget_messages_between(ids[0], ids[3], limit=1))
+
+    assert messages_between == [(ids[1], MESSAGES[1])]
+
+
+def test_session_index_is_created(mongodb_client):
+    collection = mongodb_client.get_collection('chats')
+
+    asyncio.run(MongodbChatMessageHistory.create_indexes(collection))
+
+    assert SESSION_INDEX_KEYS in [index['key'] for index in asyncio.run(collection.index_information()).values()]
@@ -0,0 +1,63 @@
+import asyncio
+from typing import List
+
+from backend.dao.mongodb_chat_history import (SUMMARY_KEY,
+                                              MongodbChatMessageHistory,
+                                              MongodbChatSummaryStore)
+from backend.langchain.chat_history_window import ChatHistoryWindow
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from benchmarks.fakes import create_fake_settings
+
+SESSION_ID = '+15550000001'
+MESSAGES = [HumanMessage(f'Question {i}') if i % 2 == 0 else AIMessage(f'Answer {i}') for i in range(10)]
+
+
+async def _summarize(summary: str, messages: List[BaseMessage]) -> str:
+    return ' '.join([summary] + [message.content for message in messages]).strip()
+
+
+def _create_window(mongodb_client, max_messages: int = 4, max_tokens: int = 1000):
+    settings = create_fake_settings()
+    settings.configs_app.chat_history_max_messages = max_messages
+    settings.configs_app.chat_history_max_tokens = max_tokens
+    settings.configs_app.chat_summary_batch_messages = 4
+    history = MongodbChatMessageHistory(mongodb_client.get_collection('chats'), SESSION_ID)
+    summary_store = MongodbChatSummaryStore(mongodb_client.get_collection('chat_summaries'))
+    window = ChatHistoryWindow(settings, lambda session_id: history, _summarize, summary_store)
+    history.add_messages(MESSAGES)
+    return window, history, summary_store
+
+
+def test_window_keeps_the_most_recent_messages_within_the_budgets(mongodb_client):
+    window, _, _ = _create_window(mongodb_client)
+
+    assert asyncio.run(window.get_session_history(SESSION_ID).aget_messages()) == MESSAGES[-4:]
+
+    window.max_tokens = 2 * window.count_tokens(MESSAGES[-1])
+    assert asyncio.run(window.get_session_history(SESSION_ID).aget_messages()) == MESSAGES[-2:]
+
+
+def test_older_messages_are_folded_into_the_summary(mongodb_client):
+    window, history, summary_store = _create_window(mongodb_client)
+    recent_messages = history.get_recent_messages(4)
+
+    asyncio.run(window._update_summary(history, SESSION_ID, recent_messages[0][0]))
+
+    summary = asyncio.run(summary_store.get_summary(SESSION_ID))[SUMMARY_KEY]
+    assert summary == ' '.join(message.content for message in MESSAGES[:6])  # two batches of up to 4 messages
+    messages = asyncio.run(window.get_session_history(SESSION_ID).aget_messages())
+    assert messages[0].type == 'system' and summary in messages[0].content
+    assert messages[1:] == MESSAGES[-4:]
+
+
+def test_sync_access_matches_async_access(mongodb_client):
+    window, history, summary_store = _create_window(mongodb_client)
+    asyncio.run(window._update_summary(history, SESSION_ID, history.get_recent_messages(4)[0][0]))
+    windowed_history = window.get_session_history(SESSION_ID)
+
+    assert windowed_history.messages == asyncio.run(windowed_history.aget_messages())
+
+    windowed_history.clear()
+    assert windowed_history.messages == []
+    assert summary_store.get_summary_sync(SESSION_ID) is None
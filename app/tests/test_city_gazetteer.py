@@ -0,0 +1,46 @@
+import asyncio
+import os
+
+from backend.dao.mongodb_dao import MongodbDao
+from backend.dto.user_dto import UserDto
+from backend.utils.city_gazetteer import CityGazetteer
+from conftest import APP_DIR
+
+GAZETTEER_FILE = os.path.join(APP_DIR, 'backend', 'utils', 'gazetteer', 'ca_cities.json')
+
+
+def test_names_and_aliases_resolve_to_the_canonical_id():
+    gazetteer = CityGazetteer(GAZETTEER_FILE)
+
+    for name in ('San Francisco', ' san   FRANCISCO ', 'SF', 'frisco', 'San-Francisco!'):
+        assert gazetteer.get_city_id(name) == 'san-francisco'
+    assert gazetteer.get_city_id('San José') == 'san-jose'
+
+
+def test_unknown_names_resolve_to_a_slug():
+    gazetteer = CityGazetteer(GAZETTEER_FILE)
+
+    assert gazetteer.get_city_id('Tiny  Town') == gazetteer.get_city_id('tiny town') == 'tiny-town'
+    assert gazetteer.get_name('tiny-town') == 'Tiny Town'
+    assert gazetteer.get_city_id('Unknown') is None and gazetteer.get_city_id(' ') is None
+
+
+def test_city_ids_drop_unknowns_and_duplicates():
+    gazetteer = CityGazetteer(GAZETTEER_FILE)
+
+    assert gazetteer.get_city_ids(['LA', 'unknown', 'Los Angeles', 'Eureka']) == ['los-angeles', 'eureka']
+
+
+def test_backfill_canonicalizes_the_cities_of_existing_users(settings, mongodb_client):
+    mongodb_dao = MongodbDao(settings, mongodb_client)
+    users = [UserDto('+15550000001', cities_ca=['SF', 'Eureka']), UserDto('+15550000002', cities_ca=['LA'], city_ids=['stale'])]
+
+    async def insert_and_backfill():
+        await mongodb_dao.collection_users.insert_many([user.to_document() for user in users])
+        updated_counts = [await mongodb_dao.backfill_city_ids(batch_size=1), await mongodb_dao.backfill_city_ids(overwrite=True)]
+        return updated_counts, await mongodb_dao.collection_users.find({}, {'_id': 0, 'city_ids': 1}).to_list(length=None)
+
+    updated_counts, city_ids = asyncio.run(insert_and_backfill())
+
+    assert updated_counts == [1, 1]
+    assert city_ids == [{'city_ids': ['san-francisco', 'eureka']}, {'city_ids': ['los-angeles']}]
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from backend.dao.mongodb_dao import MongodbDao
+from backend.dao.mongodb_matchmaker import MongodbMatchmaker
+from backend.dto.user_dto import UserDto
+from backend.twilio.connection_expiry import (CONNECTION_EXPIRED_RESPONSE,
+                                              ConnectionExpiryScheduler)
+from conftest import create_configs_app
+
+HELPER, REQUESTOR, OTHER = '+15550000001', '+15550000002', '+15550000003'
+
+
+def _create_scheduler(settings, mongodb_client, outgoing_sms_queue) -> ConnectionExpiryScheduler:
+    mongodb_dao = MongodbDao(settings, mongodb_client)
+    matchmaker = MongodbMatchmaker(settings, mongodb_dao.collection_users, mongodb_client.get_collection('helper_waitlist'),
+                                   mongodb_dao.city_gazetteer)
+    return ConnectionExpiryScheduler(settings, mongodb_dao.collection_users, matchmaker, outgoing_sms_queue)
+
+
+def _insert_users(mongodb_client, *users: UserDto):
+    asyncio.run(mongodb_client.get_collection('users').insert_many([user.to_document() for user in users]))
+
+
+def _get_user(mongodb_client, phone_number: str) -> dict:
+    return asyncio.run(mongodb_client.get_collection('users').find_one({'phone_number': phone_number}))
+
+
+def _connect(connected_at, **helper_fields):
+    return (UserDto(HELPER, connected_phone_number=REQUESTOR, connected_name='FRESNO HELPER', connected_at=connected_at,
+                    connection_replied=False, **helper_fields),
+            UserDto(REQUESTOR, connected_phone_number=HELPER, connected_name='FRESNO HELP REQUESTOR', connected_at=connected_at))
+
+
+def test_expired_connection_is_ended_on_both_sides(settings, mongodb_client, outgoing_sms_queue):
+    _insert_users(mongodb_client, *_connect(datetime.now() - timedelta(hours=25)))
+
+    assert asyncio.run(_create_scheduler(settings, mongodb_client, outgoing_sms_queue).expire_connections()) == 2
+
+    for phone_number in (HELPER, REQUESTOR):
+        assert _get_user(mongodb_client, phone_number)['connected_phone_number'] is None
+    assert sorted(outgoing_sms_queue.messages) == [(HELPER, CONNECTION_EXPIRED_RESPONSE), (REQUESTOR, CONNECTION_EXPIRED_RESPONSE)]
+    assert _get_user(mongodb_client, HELPER)['helper_missed_count'] == 1  # never replied in the connection
+
+
+def test_connection_younger_than_the_expiry_is_kept(settings, mongodb_client, outgoing_sms_queue):
+    _insert_users(mongodb_client, *_connect(datetime.now() - timedelta(hours=1)))
+
+    asyncio.run(_create_scheduler(settings, mongodb_client, outgoing_sms_queue).expire_connections())
+
+    assert _get_user(mongodb_client, HELPER)['connected_phone_number'] == REQUESTOR
+    assert outgoing_sms_queue.messages == []
+
+
+def test_half_torn_connection_is_ended_and_notified(settings, mongodb_client, outgoing_sms_queue):
+    helper, _ = _connect(datetime.now() - timedelta(hours=25))
+    _insert_users(mongodb_client, helper, UserDto(REQUESTOR, connected_phone_number=OTHER, connected_at=datetime.now()))
+
+    asyncio.run(_create_scheduler(settings, mongodb_client, outgoing_sms_queue).expire_connections())
+
+    assert _get_user(mongodb_client, HELPER)['connected_phone_number'] is None
+    assert _get_user(mongodb_client, REQUESTOR)['connected_phone_number'] == OTHER  # not part of the expired connection
+    assert outgoing_sms_queue.messages == [(HELPER, CONNECTION_EXPIRED_RESPONSE)]
+
+
+def test_concurrent_schedulers_expire_a_connection_once(settings, mongodb_client, outgoing_sms_queue):
+    _insert_users(mongodb_client, *_connect(datetime.now() - timedelta(hours=25)))
+    schedulers = [_create_scheduler(settings, mongodb_client, outgoing_sms_queue) for _ in range(2)]
+
+    async def expire_concurrently():
+        await asyncio.gather(*(scheduler.expire_connections() for scheduler in schedulers))
+    asyncio.run(expire_concurrently())
+
+    assert sorted(outgoing_sms_queue.messages) == [(HELPER, CONNECTION_EXPIRED_RESPONSE), (REQUESTOR, CONNECTION_EXPIRED_RESPONSE)]
+
+
+def test_backfilled_connection_without_connected_at_expires(settings, mongodb_client, outgoing_sms_queue):
+    _insert_users(mongodb_client, *_connect(connected_at=None))
+    settings.configs_app = create_configs_app(connection_expiry_hours=0)
+    scheduler = _create_scheduler(settings, mongodb_client, outgoing_sms_queue)
+
+    assert asyncio.run(scheduler.expire_connections()) == 0
+    assert asyncio.run(MongodbDao(settings, mongodb_client).backfill_connected_at()) == 2
+    time.sleep(0.01)  # connected_at must be strictly older than the cutoff (MongoDB stores milliseconds)
+    asyncio.run(scheduler.expire_connections())
+
+    assert _get_user(mongodb_client, HELPER)['connected_phone_number'] is None
+    assert len(outgoing_sms_queue.messages) == 2
@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import pytest
+from backend.utils.diagnostics import SamplingProfiler, SlowRequestLog
+from backend.utils.exceptions import ProfilerBusyException
+from backend.utils.metrics import current_trace, metrics
+
+
+def test_only_slow_requests_are_kept_with_their_stages():
+    slow_request_log = SlowRequestLog(threshold_seconds=0.01, max_entries=10)
+
+    slow_request_log.finish(slow_request_log.begin('fast', 'POST /sms'), 200)
+    trace = slow_request_log.begin('slow', 'POST /sms')
+    with metrics.time_stage('llm'):
+        time.sleep(0.02)
+    slow_request_log.finish(trace, 200)
+
+    entries = slow_request_log.get_entries()
+    assert [entry['request_id'] for entry in entries] == ['slow']
+    assert [stage['stage'] for stage in entries[0]['stages']] == ['llm']
+    assert current_trace.get() is None
+
+
+def test_slow_request_log_is_bounded_and_newest_first():
+    slow_request_log = SlowRequestLog(threshold_seconds=0, max_entries=2)
+
+    for request_id in ('first', 'second', 'third'):
+        slow_request_log.finish(slow_request_log.begin(request_id, 'POST /sms'))
+
+    assert [entry['request_id'] for entry in slow_request_log.get_entries()] == ['third', 'second']
+    assert [entry['request_id'] for entry in slow_request_log.get_entries('second')] == ['second']
+
+
+def test_profile_collapses_the_stacks_of_busy_threads():
+    profiler = SamplingProfiler(interval_seconds=0.001, max_seconds=0.05)
+
+    async def profile_while_busy():
+        return await asyncio.gather(profiler.profile(seconds=10), asyncio.to_thread(time.sleep, 0.05))
+
+    collapsed_stacks, _ = asyncio.run(profile_while_busy())
+
+    stacks = dict(line.rsplit(' ', 1) for line in collapsed_stacks.splitlines())
+    assert any(stack.startswith('MainThread;') for stack in stacks)  # the event loop
+    assert all(int(count) > 0 for count in stacks.values())
+
+
+def test_only_one_profile_is_taken_at_a_time():
+    profiler = SamplingProfiler(interval_seconds=0.001, max_seconds=0.05)
+
+    async def profile_twice():
+        return await asyncio.gather(profiler.profile(seconds=0.05), profiler.profile(seconds=0.05), return_exceptions=True)
+
+    results = asyncio.run(profile_twice())
+
+    assert isinstance(results[1], ProfilerBusyException)
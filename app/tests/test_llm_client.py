@@ -0,0 +1,33 @@
+import asyncio
+from collections import defaultdict
+
+from langchain_core.chat_history import InMemoryChatMessageHistory
+
+from benchmarks.fakes import FakeLangchainClient, create_fake_settings
+
+ALICE, BOB = '+15550000001', '+15550000002'
+
+
+class CountingLangchainClient(FakeLangchainClient):
+    chains_created = 0
+
+    def _create_chain_user(self):
+        CountingLangchainClient.chains_created += 1
+        return super()._create_chain_user()
+
+
+def test_chains_are_built_once_and_resolve_the_history_per_session():
+    histories = defaultdict(InMemoryChatMessageHistory)
+    client = CountingLangchainClient(create_fake_settings(), lambda session_id: histories[session_id])
+    chain_user, chains_created = client.chain_user, CountingLangchainClient.chains_created
+
+    async def ask_concurrently():
+        return await asyncio.gather(client.get_user_chat_response(ALICE, 'I am Alice, going to Fresno'),
+                                    client.get_user_chat_response(BOB, 'I am Bob, going to Eureka'))
+
+    asyncio.run(ask_concurrently())
+
+    assert client.chain_user is chain_user and CountingLangchainClient.chains_created == chains_created
+    assert [message.content for message in histories[ALICE].messages][0] == 'I am Alice, going to Fresno'
+    assert [message.content for message in histories[BOB].messages][0] == 'I am Bob, going to Eureka'
+    assert len(histories[ALICE].messages) == len(histories[BOB].messages) == 2  # question & answer of the session only
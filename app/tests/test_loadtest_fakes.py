@@ -0,0 +1,45 @@
+import base64
+import struct
+
+from fastapi.testclient import TestClient
+from twilio.request_validator import RequestValidator
+
+from benchmarks.loadtest import fake_openai, fake_twilio
+
+AUTH_TOKEN = 'token'
+SMS_URL = 'http://testserver/sms'
+
+
+def test_fake_openai_answers_the_admin_questions_and_counts_calls():
+    client = TestClient(fake_openai.create_app(latency_seconds=0, embedding_latency_seconds=0, completion_tokens=5))
+
+    name = client.post('/v1/chat/completions', json={'messages': [{'role': 'user', 'content': 'What is my name? ...'}]}).json()
+    filler = client.post('/v1/chat/completions', json={'messages': [{'role': 'user', 'content': 'Hi'}]}).json()
+
+    assert name['choices'][0]['message']['content'] == fake_openai.FAKE_USER_NAME
+    assert filler['usage']['completion_tokens'] == 5
+    assert client.get('/stats').json()['chat_completions'] == 2
+
+
+def test_fake_openai_embeddings_are_deterministic_in_both_encodings():
+    client = TestClient(fake_openai.create_app(latency_seconds=0, embedding_latency_seconds=0, completion_tokens=5))
+
+    floats = client.post('/v1/embeddings', json={'input': ['Yosemite', 'Fresno']}).json()['data']
+    encoded = client.post('/v1/embeddings', json={'input': 'Yosemite', 'encoding_format': 'base64'}).json()['data']
+
+    decoded = struct.unpack(f'<{fake_openai.EMBEDDING_DIMENSIONS}f', base64.b64decode(encoded[0]['embedding']))
+    assert [round(value, 5) for value in decoded] == [round(value, 5) for value in floats[0]['embedding']]
+    assert floats[0]['embedding'] != floats[1]['embedding']
+    assert client.get('/stats').json()['embedded_inputs'] == 3
+
+
+def test_fake_twilio_accepts_messages_and_signs_webhooks():
+    client = TestClient(fake_twilio.create_app(latency_seconds=0))
+    params = {'Body': 'hello', 'From': '+15550000001'}
+
+    response = client.post('/2010-04-01/Accounts/AC1/Messages.json', data={'To': '+15550000001', 'Body': 'hi'})
+    headers = fake_twilio.WebhookSigner(AUTH_TOKEN, SMS_URL).get_headers(params)
+
+    assert response.status_code == 201 and response.json()['sid'].startswith('SM')
+    assert client.get('/stats').json() == {'messages': 1, 'recipients': 1}
+    assert RequestValidator(AUTH_TOKEN).validate(SMS_URL, params, headers['X-Twilio-Signature'])
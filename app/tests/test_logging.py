@@ -0,0 +1,47 @@
+import logging
+import logging.handlers
+import queue
+
+import uvicorn
+from backend.utils.generic import (QUEUE_DROP_NEWEST, QUEUE_DROP_OLDEST,
+                                   CustomLogger, custom_logger)
+from main import get_uvicorn_options
+
+
+def _create_record(message: str, level: int = logging.INFO) -> logging.LogRecord:
+    return logging.LogRecord('tests', level, __file__, 0, message, None, None)
+
+
+def test_queue_handler_survives_uvicorn_config(settings):
+    settings.configs_env.app_port_number = 8001
+    custom_logger.enable_queue()
+    try:
+        uvicorn.Config('launcher:app', **get_uvicorn_options(settings))
+
+        assert [type(handler) for handler in logging.getLogger().handlers] == [CustomLogger.BoundedQueueHandler]
+        assert custom_logger.queue_listener is not None
+    finally:
+        custom_logger.disable_queue()
+
+
+def test_full_queue_drops_newest_records():
+    handler = CustomLogger.BoundedQueueHandler(queue.Queue(2), QUEUE_DROP_NEWEST)
+    for message in ('first', 'second', 'third'):
+        handler.emit(_create_record(message))
+
+    assert [handler.queue.get_nowait().msg for _ in range(2)] == ['first', 'second']
+
+
+def test_full_queue_drops_oldest_records():
+    handler = CustomLogger.BoundedQueueHandler(queue.Queue(2), QUEUE_DROP_OLDEST)
+    for message in ('first', 'second', 'third'):
+        handler.emit(_create_record(message))
+
+    assert [handler.queue.get_nowait().msg for _ in range(2)] == ['second', 'third']
+
+
+def test_rate_limit_drops_only_records_below_warning():
+    rate_limit_filter = CustomLogger.RateLimitFilter(records_per_second=0.001, burst=2)
+
+    assert [rate_limit_filter.filter(_create_record('info')) for _ in range(3)] == [True, True, False]
+    assert rate_limit_filter.filter(_create_record('warning', logging.WARNING))
@@ -0,0 +1,16 @@
+from os import cpu_count
+
+import pytest
+from main import get_uvicorn_options
+
+
+@pytest.mark.parametrize('uvicorn_reload, uvicorn_workers, workers', [(True, 4, 1), (False, 4, 4), (False, 0, cpu_count())])
+def test_worker_count(settings, uvicorn_reload, uvicorn_workers, workers):
+    settings.configs_env.app_port_number = 8001
+    settings.configs_app.uvicorn_reload, settings.configs_app.uvicorn_workers = uvicorn_reload, uvicorn_workers
+
+    options = get_uvicorn_options(settings)
+
+    assert options['workers'] == workers  # reloading only works with a single process; 0 means one worker per core
+    assert options['timeout_graceful_shutdown'] == settings.configs_app.uvicorn_graceful_shutdown_seconds
+    assert options['log_config'] is None
@@ -0,0 +1,94 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from backend.dao.mongodb_dao import MongodbDao
+from backend.dao.mongodb_matchmaker import MongodbMatchmaker
+from backend.dto.user_dto import UserDto
+
+HELPERS = ('+15550000001', '+15550000002', '+15550000003')
+REQUESTOR, OTHER_REQUESTOR = '+15550000011', '+15550000012'
+CITY_ID = 'fresno'
+
+
+def _create_matchmaker(settings, mongodb_client) -> MongodbMatchmaker:
+    mongodb_dao = MongodbDao(settings, mongodb_client)
+    return MongodbMatchmaker(settings, mongodb_dao.collection_users, mongodb_client.get_collection('helper_waitlist'),
+                             mongodb_dao.city_gazetteer)
+
+
+def _insert_users(mongodb_client, *users: UserDto):
+    asyncio.run(mongodb_client.get_collection('users').insert_many([user.to_document() for user in users]))
+
+
+def _get_user(mongodb_client, phone_number: str) -> dict:
+    return asyncio.run(mongodb_client.get_collection('users').find_one({'phone_number': phone_number}))
+
+
+def _create_helper(phone_number: str, **fields) -> UserDto:
+    return UserDto(phone_number, cities_ca=['Fresno'], city_ids=[CITY_ID], **fields)
+
+
+def test_connect_claims_the_best_ranked_free_helper(settings, mongodb_client):
+    yesterday = datetime.now() - timedelta(days=1)
+    _insert_users(mongodb_client, _create_helper(HELPERS[0], helper_missed_count=2),
+                  _create_helper(HELPERS[1], last_helped_at=datetime.now()), _create_helper(HELPERS[2], last_helped_at=yesterday),
+                  UserDto(REQUESTOR))
+
+    helper = asyncio.run(_create_matchmaker(settings, mongodb_client).connect(UserDto(REQUESTOR), CITY_ID))
+
+    assert helper.phone_number == HELPERS[2]  # responsive & helped least recently
+    assert helper.connected_phone_number == REQUESTOR and helper.connection_replied is False
+    assert _get_user(mongodb_client, REQUESTOR)['connected_phone_number'] == HELPERS[2]
+    assert _get_user(mongodb_client, REQUESTOR)['connected_name'] == 'FRESNO HELP REQUESTOR'
+
+
+def test_concurrent_requests_never_claim_the_same_helper(settings, mongodb_client):
+    _insert_users(mongodb_client, _create_helper(HELPERS[0]), UserDto(REQUESTOR), UserDto(OTHER_REQUESTOR))
+    matchmakers = [_create_matchmaker(settings, mongodb_client) for _ in range(2)]
+
+    async def connect_concurrently():
+        return await asyncio.gather(*(matchmaker.connect(UserDto(phone_number), CITY_ID)
+                                      for matchmaker, phone_number in zip(matchmakers, (REQUESTOR, OTHER_REQUESTOR))))
+
+    helpers = asyncio.run(connect_concurrently())
+
+    assert sum(helper is not None for helper in helpers) == 1
+    connected_requestor = _get_user(mongodb_client, HELPERS[0])['connected_phone_number']
+    assert _get_user(mongodb_client, connected_requestor)['connected_phone_number'] == HELPERS[0]
+
+
+def test_offboarded_helpers_and_the_requestor_are_not_matched(settings, mongodb_client):
+    _insert_users(mongodb_client, _create_helper(HELPERS[0], deletion_date=datetime.now() + timedelta(days=1)),
+                  _create_helper(REQUESTOR))
+
+    assert asyncio.run(_create_matchmaker(settings, mongodb_client).connect(UserDto(REQUESTOR), CITY_ID)) is None
+
+
+def test_claim_is_rolled_back_when_the_requestor_got_connected_concurrently(settings, mongodb_client):
+    last_helped_at = datetime.now().replace(microsecond=0) - timedelta(days=1)
+    _insert_users(mongodb_client, _create_helper(HELPERS[0], last_helped_at=last_helped_at),
+                  UserDto(REQUESTOR, connected_phone_number=HELPERS[1]))
+
+    assert asyncio.run(_create_matchmaker(settings, mongodb_client).connect(UserDto(REQUESTOR), CITY_ID)) is None
+
+    helper = _get_user(mongodb_client, HELPERS[0])
+    assert helper['connected_phone_number'] is None and 'connection_replied' not in helper
+    assert helper['last_helped_at'] == last_helped_at  # keeps their place in the ranking
+    assert _get_user(mongodb_client, REQUESTOR)['connected_phone_number'] == HELPERS[1]
+
+
+def test_freed_helper_is_connected_to_the_longest_waiting_requestor(settings, mongodb_client):
+    _insert_users(mongodb_client, _create_helper(HELPERS[0]), UserDto(REQUESTOR), UserDto(OTHER_REQUESTOR))
+    matchmaker = _create_matchmaker(settings, mongodb_client)
+
+    async def wait_and_connect():
+        for phone_number in (REQUESTOR, OTHER_REQUESTOR):
+            await matchmaker.add_to_waitlist(UserDto(phone_number), CITY_ID)
+        return await matchmaker.connect_waitlisted(_create_helper(HELPERS[0]))
+
+    requestor, city_id = asyncio.run(wait_and_connect())
+
+    assert (requestor.phone_number, city_id) == (REQUESTOR, CITY_ID)
+    assert _get_user(mongodb_client, HELPERS[0])['connected_phone_number'] == REQUESTOR
+    waitlist = asyncio.run(mongodb_client.get_collection('helper_waitlist').find().to_list(length=None))
+    assert [entry['_id'] for entry in waitlist] == [OTHER_REQUESTOR]
@@ -0,0 +1,63 @@
+import asyncio
+
+from backend.utils.metrics import (STAGE_LATENCY_METRIC, MetricsRegistry,
+                                   RequestTrace, current_trace)
+
+
+def test_metrics_are_identified_by_name_and_labels():
+    registry = MetricsRegistry()
+
+    registry.counter('sms_total', 'Sms', result='ok').inc()
+    registry.counter('sms_total', result='ok').inc(2)
+    registry.counter('sms_total', result='error').inc()
+
+    assert registry.counter('sms_total', result='ok').value == 3
+    assert registry.counter('sms_total', result='error').value == 1
+
+
+def test_prometheus_rendering():
+    registry = MetricsRegistry()
+    registry.counter('sms_total', 'Sms received', source='say "hi"\n').inc()
+    registry.gauge('queue_size', 'Queued sms').set_function(lambda: 7)
+    histogram = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    lines = registry.render_prometheus().splitlines()
+
+    assert '# HELP sms_total Sms received' in lines and '# TYPE sms_total counter' in lines
+    assert 'sms_total{source="say \\"hi\\"\\n"} 1.0' in lines
+    assert 'queue_size 7.0' in lines
+    assert lines[-5:] == ['latency_seconds_bucket{le="0.1"} 1', 'latency_seconds_bucket{le="1.0"} 2',
+                          'latency_seconds_bucket{le="+Inf"} 3', 'latency_seconds_sum 5.55', 'latency_seconds_count 3']
+
+
+def test_stages_are_timed_into_the_histogram_and_the_current_trace():
+    registry = MetricsRegistry()
+    trace = RequestTrace('request_id', 'POST /sms')
+    token = current_trace.set(trace)
+    try:
+        with registry.time_stage('retrieval'):
+            pass
+    finally:
+        current_trace.reset(token)
+
+    assert registry.histogram(STAGE_LATENCY_METRIC, stage='retrieval').count == 1
+    assert [stage for stage, _, _ in trace.stages] == ['retrieval']
+
+
+def test_collectors_refresh_metrics_and_failures_are_counted():
+    registry = MetricsRegistry()
+
+    async def collect_count():
+        registry.gauge('sms_today').set(42)
+
+    async def fail():
+        raise ConnectionError('MongoDB is unreachable')
+
+    registry.set_collector('count', collect_count)
+    registry.set_collector('broken', fail)
+    asyncio.run(registry.collect())
+
+    assert registry.gauge('sms_today').get() == 42
+    assert registry.counter('metrics_collector_errors_total', collector='broken').value == 1
@@ -0,0 +1,37 @@
+import asyncio
+import json
+from argparse import Namespace
+
+import pytest
+from backend.utils.generic import custom_logger
+
+from benchmarks import micro
+
+
+def _create_args(tmp_path, **options) -> Namespace:
+    args = {'cases': None, 'rounds': 1, 'round_seconds': 0.001, 'warmup_seconds': 0, 'baseline': str(tmp_path / 'baseline.json'),
+            'update_baseline': False, 'threshold': 0.25, 'min_regression_us': 20, 'output': str(tmp_path / 'results.json')}
+    return Namespace(**{**args, **options})
+
+
+def test_every_case_runs_and_a_baseline_is_recorded(tmp_path):
+    args = _create_args(tmp_path, update_baseline=True)
+
+    try:
+        assert asyncio.run(micro.main(args)) == 0
+    finally:
+        custom_logger.change_logging_level()  # main only logs errors
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    assert set(baseline['cases']) == set(micro.CASES)
+    assert all(microseconds > 0 for microseconds in baseline['cases'].values())
+
+
+@pytest.mark.parametrize('slowdown, is_regressed', [(1.1, False), (2, True)])
+def test_only_slowdowns_beyond_both_thresholds_regress(slowdown, is_regressed):
+    baseline = {'calibration_us': 100, 'cases': {'case': 100}}
+    results = {'calibration_us': 50, 'cases': {'case': 50 * slowdown, 'new_case': 1}}  # this box is 2x the baseline box
+
+    assert micro._compare(results, baseline, threshold=0.25, min_regression_us=20) == is_regressed
+    assert not micro._compare(results, baseline, threshold=0.25, min_regression_us=1000)
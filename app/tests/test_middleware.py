@@ -0,0 +1,67 @@
+import logging
+
+import pytest
+from backend.middleware import REDACTED, RouterLoggingMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+
+async def echo(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(f'{request.state.request_id}:{(await request.body()).decode()}')
+
+
+async def fail(request: Request):
+    raise RuntimeError('boom')
+
+
+def _create_client(**options):
+    logger = logging.getLogger('tests.middleware')
+    logger.handlers, logger.propagate = [RecordingHandler()], False
+    app = Starlette(routes=[Route('/echo', echo, methods=['POST']), Route('/fail', fail)])
+    app.add_middleware(RouterLoggingMiddleware, logger=logger, **options)
+    return TestClient(app, raise_server_exceptions=False), logger.handlers[0].records
+
+
+def test_request_and_response_are_logged_with_a_request_id():
+    client, records = _create_client()
+
+    response = client.post('/echo', data={'Body': 'hello', 'From': '+15550000001'}, headers={'Authorization': 'Basic secret'})
+
+    request_id = response.headers['x-api-request-id']
+    assert response.text.startswith(f'{request_id}:')
+    logged = records[0].msg
+    assert logged['X-API-REQUEST-ID'] == request_id
+    assert logged['request']['data'] == {'Body': 'hello', 'From': '+15550000001'}
+    assert logged['request']['headers']['authorization'] == REDACTED
+    assert (logged['response']['status_code'], logged['response']['body']) == (200, response.text)
+
+
+def test_bodies_are_capped_and_skipped():
+    client, records = _create_client(max_body_bytes=4, skip_body_paths=['/echo'])
+    client.post('/echo', content=b'hello world')
+    assert records[0].msg['request'].get('data') is None and records[0].msg['response']['body'] is None
+
+    client, records = _create_client(max_body_bytes=4)
+    client.post('/echo', content=b'hello world')
+    assert records[0].msg['request']['data'] == 'hell...'
+
+
+@pytest.mark.parametrize('path, is_logged', [('/echo', False), ('/fail', True)])
+def test_unsampled_requests_are_only_logged_when_they_fail(path, is_logged):
+    client, records = _create_client(sample_rate=0)
+
+    client.request('POST' if path == '/echo' else 'GET', path)
+
+    assert bool(records) == is_logged  # an exception is logged (at error level) before it propagates
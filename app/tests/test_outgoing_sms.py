@@ -0,0 +1,46 @@
+import asyncio
+
+from aiohttp import web
+from backend.twilio.outgoing_sms import (LazyAsyncTwilioHttpClient,
+                                         create_twilio_client)
+
+from benchmarks.fakes import create_fake_settings
+
+
+async def _ok(request: web.Request) -> web.Response:
+    return web.Response(text='ok')
+
+
+def test_twilio_client_can_be_created_outside_the_event_loop():
+    settings = create_fake_settings()
+    settings.configs_app.twilio_api_base_url = 'http://127.0.0.1:9000'
+
+    twilio_client = create_twilio_client(settings)
+
+    assert twilio_client.http_client.session is None
+    assert twilio_client.api.base_url == 'http://127.0.0.1:9000'
+
+
+def test_requests_share_one_session_opened_on_first_use():
+    async def request_twice():
+        app = web.Application()
+        app.router.add_get('/', _ok)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        url = f'http://127.0.0.1:{runner.addresses[0][1]}/'
+        http_client = LazyAsyncTwilioHttpClient()
+        try:
+            responses = [await http_client.request('GET', url)]
+            session = http_client.session
+            responses.append(await http_client.request('GET', url))
+            return responses, session, http_client.session
+        finally:
+            await http_client.close()
+            await runner.cleanup()
+
+    responses, first_session, second_session = asyncio.run(request_twice())
+
+    assert [(response.status_code, response.text) for response in responses] == [(200, 'ok'), (200, 'ok')]
+    assert first_session is not None and first_session is second_session
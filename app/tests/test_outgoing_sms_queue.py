@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from backend.twilio.outgoing_sms_queue import (STATUS_DEAD, STATUS_PENDING,
+                                               STATUS_SENDING, STATUS_SENT,
+                                               OutgoingSmsQueue)
+from twilio.base.exceptions import TwilioRestException
+
+PHONE_NUMBER = '+15550000001'
+
+
+class FakeTwilioClient:
+    """
+    Overview:
+        Twilio client whose messages.create_async raises the given errors (one per call) before it succeeds
+    """
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.sent = []
+        self.messages = SimpleNamespace(create_async=self._create_async)
+
+    async def _create_async(self, from_: str, to: str, body: str):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((to, body))
+        return SimpleNamespace(sid=f'SM{len(self.sent)}', status='queued')
+
+
+def _create_queue(settings, mongodb_client, twilio_client: FakeTwilioClient) -> OutgoingSmsQueue:
+    settings.configs_app.outgoing_sms_poll_interval_seconds = 0.01
+    return OutgoingSmsQueue(settings, mongodb_client.get_collection('outgoing_sms'), twilio_client)
+
+
+async def _make_due(queue: OutgoingSmsQueue):
+    await queue.collection_outgoing_sms.update_many({}, {'$set': {'next_attempt_at': datetime.now()}})
+
+
+def test_workers_deliver_enqueued_sms(settings, mongodb_client):
+    twilio_client = FakeTwilioClient()
+    queue = _create_queue(settings, mongodb_client, twilio_client)
+
+    async def enqueue_and_wait():
+        queue.start()
+        await queue.enqueue(PHONE_NUMBER, 'Hello')
+        for _ in range(100):
+            sms = await queue.collection_outgoing_sms.find_one({'to': PHONE_NUMBER})
+            if sms['status'] == STATUS_SENT:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return sms
+
+    sms = asyncio.run(enqueue_and_wait())
+
+    assert twilio_client.sent == [(PHONE_NUMBER, 'Hello')]
+    assert (sms['status'], sms['sid'], sms['attempts']) == (STATUS_SENT, 'SM1', 1)
+    assert sms['expire_at'] > datetime.now()
+
+
+def test_failed_sms_is_retried_with_backoff(settings, mongodb_client):
+    queue = _create_queue(settings, mongodb_client, FakeTwilioClient(TimeoutError('Twilio timed out')))
+
+    async def deliver():
+        await queue.enqueue(PHONE_NUMBER, 'Hello')
+        await queue._deliver(await queue._claim_next())
+        failed_sms, claimed_too_early = await queue.collection_outgoing_sms.find_one({}), await queue._claim_next()
+        await _make_due(queue)
+        await queue._deliver(await queue._claim_next())
+        return failed_sms, claimed_too_early, await queue.collection_outgoing_sms.find_one({})
+
+    failed_sms, claimed_too_early, sms = asyncio.run(deliver())
+
+    assert (failed_sms['status'], failed_sms['last_error']) == (STATUS_PENDING, 'Twilio timed out')
+    assert failed_sms['next_attempt_at'] > datetime.now() + timedelta(seconds=queue.retry_base_seconds - 1)
+    assert claimed_too_early is None
+    assert (sms['status'], sms['attempts']) == (STATUS_SENT, 2)
+
+
+def test_sms_is_dead_lettered_after_max_attempts(settings, mongodb_client):
+    queue = _create_queue(settings, mongodb_client, FakeTwilioClient(*(ConnectionError('unreachable') for _ in range(10))))
+
+    async def deliver():
+        await queue.enqueue(PHONE_NUMBER, 'Hello')
+        for _ in range(queue.max_attempts):
+            await _make_due(queue)
+            await queue._deliver(await queue._claim_next())
+        await _make_due(queue)
+        return await queue.collection_outgoing_sms.find_one({}), await queue._claim_next()
+
+    sms, claimed = asyncio.run(deliver())
+
+    assert (sms['status'], sms['attempts']) == (STATUS_DEAD, queue.max_attempts)
+    assert claimed is None
+
+
+def test_client_errors_are_not_retried(settings, mongodb_client):
+    queue = _create_queue(settings, mongodb_client, FakeTwilioClient(TwilioRestException(400, '/Messages', msg="Invalid 'To' number")))
+
+    async def deliver():
+        await queue.enqueue(PHONE_NUMBER, 'Hello')
+        await queue._deliver(await queue._claim_next())
+        return await queue.collection_outgoing_sms.find_one({})
+
+    sms = asyncio.run(deliver())
+
+    assert (sms['status'], sms['attempts']) == (STATUS_DEAD, 1)
+
+
+def test_sms_of_a_crashed_worker_is_reclaimed_after_the_lease(settings, mongodb_client):
+    queue = _create_queue(settings, mongodb_client, FakeTwilioClient())
+
+    async def claim_twice():
+        await queue.enqueue(PHONE_NUMBER, 'Hello')
+        claimed = await queue._claim_next()  # the worker crashes before delivering
+        claimed_during_lease = await queue._claim_next()
+        await _make_due(queue)
+        return claimed, claimed_during_lease, await queue._claim_next()
+
+    claimed, claimed_during_lease, reclaimed = asyncio.run(claim_twice())
+
+    assert claimed['status'] == STATUS_SENDING and claimed_during_lease is None
+    assert (reclaimed['_id'], reclaimed['attempts']) == (claimed['_id'], 2)
@@ -0,0 +1,69 @@
+import asyncio
+
+from backend.langchain.question_condenser import QuestionCondenser
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+HISTORY = [HumanMessage('I am going to Fresno next week'), AIMessage('Great, Fresno is close to Yosemite!')]
+
+
+class CountingCondenseChain:
+    def __init__(self):
+        self.calls = 0
+        self.runnable = RunnableLambda(self._condense)
+
+    def _condense(self, params: dict) -> str:
+        self.calls += 1
+        return f'{params["question"]} (in Fresno)'
+
+
+def _create_condenser(skip_enabled: bool = True, memo_max_entries: int = 10):
+    chain = CountingCondenseChain()
+    return QuestionCondenser(chain.runnable, skip_enabled, min_history_messages=2, history_tail_messages=4,
+                             memo_max_entries=memo_max_entries), chain
+
+
+def test_llm_is_skipped_without_history():
+    condenser, chain = _create_condenser()
+
+    assert asyncio.run(condenser.condense('Is it busy?', HISTORY[:1])) == ('Is it busy?', False)
+    assert chain.calls == 0
+
+
+def test_llm_is_skipped_for_self_contained_questions():
+    condenser, chain = _create_condenser()
+
+    assert asyncio.run(condenser.condense('What is the best time to visit Yosemite?', HISTORY)) == \
+        ('What is the best time to visit Yosemite?', False)
+    assert chain.calls == 0
+
+
+def test_follow_ups_are_condensed_and_memoized():
+    condenser, chain = _create_condenser()
+
+    async def condense_twice():
+        return [await condenser.condense(question, HISTORY) for question in ('Is it busy?', ' is it BUSY? ')]
+
+    assert asyncio.run(condense_twice()) == [('Is it busy? (in Fresno)', True), ('Is it busy? (in Fresno)', True)]
+    assert chain.calls == 1
+
+
+def test_memo_depends_on_the_history_and_is_bounded():
+    condenser, chain = _create_condenser(memo_max_entries=1)
+    other_history = [HumanMessage('I am going to Eureka next week'), AIMessage('Eureka is lovely!')]
+
+    async def condense():
+        for question, history in (('Is it busy?', HISTORY), ('Is it busy?', other_history), ('Is it busy?', HISTORY)):
+            await condenser.condense(question, history)
+    asyncio.run(condense())
+
+    assert chain.calls == 3
+    assert len(condenser._memo) == 1
+
+
+def test_every_question_is_condensed_when_skipping_is_disabled():
+    condenser, chain = _create_condenser(skip_enabled=False)
+
+    _, is_condensed = asyncio.run(condenser.condense('What is the best time to visit Yosemite?', HISTORY))
+
+    assert is_condensed and chain.calls == 1
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from backend.dao.mongodb_rate_limiter import MongodbRateLimiter
+from backend.dto.user_dto import RATE_LIMITED_USER_FIELDS, UserDto
+from backend.utils.rate_limiter import (RateLimiter, RateLimitPolicy,
+                                       TokenBucketRateLimiter)
+
+PHONE_NUMBER = '+15550000001'
+SMS_ALLOWED_PER_DAY = 3
+
+
+def _create_user_document(**fields) -> dict:
+    return {'phone_number': PHONE_NUMBER, 'deletion_date': datetime.now() + timedelta(days=30), 'sms_counter': 0,
+            'time_last_sms': datetime.now(), **fields}
+
+
+def _create_user(document: dict) -> UserDto:
+    return UserDto.from_document({field: value for field, value in document.items() if field in RATE_LIMITED_USER_FIELDS}, projected=True)
+
+
+async def _count_allowed(rate_limiter, user: UserDto, policy: RateLimitPolicy, attempts: int) -> int:
+    return sum([not await rate_limiter.is_rate_limited(user, policy) for _ in range(attempts)])
+
+
+def _run_mongodb_rate_limiter(mongodb_client, document: dict, attempts: int):
+    collection = mongodb_client.get_collection('users')
+    policy = RateLimitPolicy('user', SMS_ALLOWED_PER_DAY)
+    rate_limiter = MongodbRateLimiter(policy, RateLimitPolicy('service', 100), collection, None)
+    user = _create_user(document)
+
+    async def run():
+        await collection.insert_one(document)
+        allowed = await _count_allowed(rate_limiter, user, policy, attempts)
+        return allowed, await collection.find_one({'phone_number': PHONE_NUMBER})
+
+    allowed, stored_user = asyncio.run(run())
+    return allowed, stored_user, user
+
+
+def test_mongodb_rate_limiter_allows_exactly_the_daily_limit(mongodb_client):
+    allowed, stored_user, user = _run_mongodb_rate_limiter(mongodb_client, _create_user_document(), SMS_ALLOWED_PER_DAY + 2)
+
+    assert allowed == SMS_ALLOWED_PER_DAY
+    assert stored_user['sms_counter'] == SMS_ALLOWED_PER_DAY
+    assert user.sms_counter == SMS_ALLOWED_PER_DAY  # no sms left, not a negative count
+
+
+def test_mongodb_rate_limiter_resets_the_counter_on_a_new_day(mongodb_client):
+    document = _create_user_document(sms_counter=SMS_ALLOWED_PER_DAY, time_last_sms=datetime.now() - timedelta(days=1))
+
+    allowed, stored_user, user = _run_mongodb_rate_limiter(mongodb_client, document, 1)
+
+    assert allowed == 1
+    assert stored_user['sms_counter'] == 1 and user.sms_counter == 1
+    assert stored_user['time_last_sms'].date() == datetime.now().date()
+
+
+def test_mongodb_rate_limiter_rejects_recently_offboarded_users(mongodb_client):
+    document = _create_user_document(deletion_date=datetime.now() + timedelta(days=1))
+
+    allowed, stored_user, _ = _run_mongodb_rate_limiter(mongodb_client, document, 1)
+
+    assert allowed == 0
+    assert stored_user['sms_counter'] == 0
+
+
+def test_rate_limit_modes_agree_on_the_daily_limit():
+    policy = RateLimitPolicy('user', SMS_ALLOWED_PER_DAY)
+    rate_limiter = TokenBucketRateLimiter(policy, RateLimitPolicy('service', 100))
+    user = UserDto.from_document(_create_user_document(), projected=True)
+
+    allowed = asyncio.run(_count_allowed(rate_limiter, user, policy, SMS_ALLOWED_PER_DAY + 2))
+
+    assert allowed == SMS_ALLOWED_PER_DAY
+
+
+def test_rate_limiters_must_implement_both_checks():
+    class UserOnlyRateLimiter(RateLimiter):
+        async def is_rate_limited(self, user: UserDto, policy: RateLimitPolicy) -> bool:
+            return False
+
+    with pytest.raises(TypeError):
+        UserOnlyRateLimiter(RateLimitPolicy('user', 1), RateLimitPolicy('service', 1))
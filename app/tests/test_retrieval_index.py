@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+from typing import List
+
+from backend.langchain.retrieval_index import RetrievalIndex
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+YOSEMITE, FRESNO, EUREKA = 'Yosemite is best in late spring.', 'Fresno is hot in summer.', 'Eureka is foggy.'
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    embedded_texts: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded_texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+class InMemoryDocsRetrievalIndex(RetrievalIndex):
+    """
+    Overview:
+        Retrieval index over documents given in memory instead of loaded from the docs directory
+    """
+
+    def __init__(self, tmp_path, documents: List[str], embedding_model: str = 'fake'):
+        self.documents = [Document(page_content=document) for document in documents]
+        self.embeddings = CountingEmbeddings(size=8, embedded_texts=[])
+        settings = SimpleNamespace(configs_app=SimpleNamespace(langchain_retrieval_docs_dir=str(tmp_path / 'docs'),
+                                                               langchain_vectorstore_dir=str(tmp_path / 'vectorstore')))
+        super().__init__(settings, self.embeddings, embedding_model)
+
+    def _load_documents(self) -> List[Document]:
+        return self.documents
+
+
+def test_only_new_chunks_are_embedded_and_stale_ones_removed(tmp_path):
+    first_manifest = InMemoryDocsRetrievalIndex(tmp_path, [YOSEMITE, FRESNO]).sync()
+
+    index = InMemoryDocsRetrievalIndex(tmp_path, [YOSEMITE, EUREKA, EUREKA])  # a restart after the docs changed
+    manifest = index.sync()
+
+    assert (manifest['chunks'], manifest['reused'], manifest['embedded'], manifest['deleted']) == (2, 1, 1, 1)
+    assert index.embeddings.embedded_texts == [EUREKA]
+    assert sorted(index.vectorstore.get()['documents']) == sorted([YOSEMITE, EUREKA])
+    assert manifest['fingerprint'] != first_manifest['fingerprint']
+
+
+def test_unchanged_docs_reuse_the_whole_index(tmp_path):
+    first_manifest = InMemoryDocsRetrievalIndex(tmp_path, [YOSEMITE, FRESNO]).sync()
+
+    index = InMemoryDocsRetrievalIndex(tmp_path, [FRESNO, YOSEMITE])
+    manifest = index.sync()
+
+    assert (manifest['reused'], manifest['embedded']) == (2, 0) and index.embeddings.embedded_texts == []
+    assert manifest['fingerprint'] == first_manifest['fingerprint']
+    assert index.load_manifest()['fingerprint'] == manifest['fingerprint']
+
+
+def test_another_embedding_model_builds_a_fresh_index(tmp_path):
+    InMemoryDocsRetrievalIndex(tmp_path, [YOSEMITE]).sync()
+
+    manifest = InMemoryDocsRetrievalIndex(tmp_path, [YOSEMITE], embedding_model='other').sync()
+
+    assert (manifest['reused'], manifest['embedded']) == (0, 1)
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+from backend.routes import REPLY_OUTCOME_ERROR, SMS_REPLY_MODE_DEFERRED, Routes
+from backend.twilio.incoming_sms import FALLBACK_REPLY
+from backend.utils.diagnostics import SlowRequestLog
+from backend.utils.metrics import PROMETHEUS_CONTENT_TYPE, metrics
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from benchmarks.fakes import create_fake_settings
+
+PHONE_NUMBER = '+15550000001'
+
+
+class FailingIncomingSms:
+    sms_from = PHONE_NUMBER
+
+    async def get_reply(self) -> str:
+        raise TimeoutError('OpenAI request timed out')
+
+
+def _create_routes(outgoing_sms_queue) -> Routes:
+    settings = create_fake_settings()
+    settings.configs_app.web_templates_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend',
+                                                          'templates')
+    settings.configs_app.web_route_home = '/'
+    settings.configs_app.web_route_sms = '/sms'
+    settings.configs_app.web_route_metrics = '/metrics'
+    return Routes(settings, None, outgoing_sms_queue, None, None, None, None, SlowRequestLog(threshold_seconds=2, max_entries=10))
+
+
+def test_deferred_reply_sends_fallback_when_processing_fails(outgoing_sms_queue):
+    routes = _create_routes(outgoing_sms_queue)
+    latency = metrics.histogram('sms_reply_latency_seconds', mode=SMS_REPLY_MODE_DEFERRED, outcome=REPLY_OUTCOME_ERROR)
+    count_before = latency.count
+
+    asyncio.run(routes._reply_deferred(FailingIncomingSms(), time.perf_counter(), 'request_id'))
+
+    assert outgoing_sms_queue.messages == [(PHONE_NUMBER, FALLBACK_REPLY)]
+    assert latency.count == count_before + 1
+
+
+def test_metrics_endpoint_requires_credentials_and_runs_the_collectors(outgoing_sms_queue):
+    app = FastAPI()
+    app.include_router(_create_routes(outgoing_sms_queue).router)
+    client = TestClient(app)
+
+    async def collect():
+        metrics.gauge('test_collected').inc()
+
+    metrics.set_collector('test', collect)
+    try:
+        assert client.get('/metrics').status_code == 401
+        response = client.get('/metrics', auth=('username', 'password'))
+    finally:
+        metrics._collectors.pop('test')
+
+    assert (response.status_code, response.headers['content-type']) == (200, PROMETHEUS_CONTENT_TYPE)
+    assert 'test_collected 1.0' in response.text.splitlines()
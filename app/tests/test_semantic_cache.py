@@ -0,0 +1,80 @@
+import asyncio
+
+from benchmarks.fakes import FakeLangchainClient, create_fake_settings
+from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+QUESTION = 'What is the best time to visit Yosemite National Park?'  # self-contained, so the condense step may skip it
+FOLLOW_UP = 'Where should I stay overnight?'  # depends on the history though it has no pronoun
+ALICE, BOB = '+15550000001', '+15550000002'
+
+
+class EchoLangchainClient(FakeLangchainClient):
+    """
+    Overview:
+        Condenses a question to itself and answers with every non-system message of the prompt,
+        so an answer shows which chat history it was generated from
+    """
+
+    def _init_llm_chat(self):
+        self.answer_calls = 0
+        return RunnableLambda(self._echo)
+
+    def _echo(self, prompt) -> str:
+        messages = prompt.to_messages()
+        if 'standalone question' in messages[0].content:
+            return messages[-1].content
+        self.answer_calls += 1
+        return 'Answer: ' + ' | '.join(message.content for message in messages if message.type != 'system')
+
+
+def _create_client(condense_question_skip_enabled: bool) -> EchoLangchainClient:
+    histories = {
+        ALICE: InMemoryChatMessageHistory(messages=[HumanMessage('I am Alice, going to Fresno'), AIMessage('Hi Alice!')]),
+        BOB: InMemoryChatMessageHistory(messages=[HumanMessage('I am Bob, going to Eureka'), AIMessage('Hi Bob!')]),
+    }
+    settings = create_fake_settings()
+    settings.configs_app.condense_question_skip_enabled = condense_question_skip_enabled
+    settings.configs_app.semantic_cache_enabled = True
+    settings.configs_app.semantic_cache_similarity_threshold = 0.95
+    settings.configs_app.semantic_cache_ttl_seconds = 60
+    settings.configs_app.semantic_cache_max_entries = 100
+    return EchoLangchainClient(settings, lambda session_id: histories[session_id])
+
+
+def _ask(client: EchoLangchainClient, phone_number: str, question: str, use_cache: bool = True) -> str:
+    return asyncio.run(client.get_user_chat_response(phone_number, question, use_cache=use_cache))
+
+
+def test_condensed_answers_are_cached_without_chat_history():
+    client = _create_client(condense_question_skip_enabled=False)
+
+    answer_alice, answer_bob = _ask(client, ALICE, QUESTION), _ask(client, BOB, QUESTION)
+
+    assert answer_bob == answer_alice == f'Answer: {QUESTION}'
+    assert client.answer_calls == 1
+
+
+def test_cached_answer_does_not_leak_chat_history_across_users():
+    client = _create_client(condense_question_skip_enabled=True)
+
+    answer_alice, answer_bob = _ask(client, ALICE, QUESTION), _ask(client, BOB, QUESTION)
+
+    assert 'Bob' not in answer_alice and 'Eureka' not in answer_alice
+    assert 'Alice' not in answer_bob and 'Fresno' not in answer_bob
+
+
+def test_follow_up_without_pronoun_is_answered_with_chat_history():
+    client = _create_client(condense_question_skip_enabled=True)
+
+    answer_alice, answer_bob = _ask(client, ALICE, FOLLOW_UP), _ask(client, BOB, FOLLOW_UP)
+
+    assert 'Fresno' in answer_alice and 'Eureka' not in answer_alice
+    assert 'Eureka' in answer_bob and 'Fresno' not in answer_bob
+
+
+def test_uncached_answer_uses_chat_history():
+    client = _create_client(condense_question_skip_enabled=False)
+
+    assert 'Alice' in _ask(client, ALICE, QUESTION, use_cache=False)
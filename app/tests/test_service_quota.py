@@ -0,0 +1,55 @@
+import asyncio
+
+from backend.dao.mongodb_service_quota import MongodbServiceQuota
+from backend.utils.metrics import metrics
+
+SMS_ALLOWED_PER_DAY = 10
+SHARDS = 4
+
+
+def _create_quota(mongodb_client) -> MongodbServiceQuota:
+    return MongodbServiceQuota(mongodb_client.get_collection('service_counters'), SMS_ALLOWED_PER_DAY, SHARDS, count_cache_seconds=0)
+
+
+def test_quota_is_spread_over_shards_up_to_their_share(mongodb_client):
+    quota = _create_quota(mongodb_client)
+
+    async def consume():
+        consumed = [await quota.try_consume() for _ in range(SMS_ALLOWED_PER_DAY + 5)]
+        return consumed, await quota.collection_service_counters.find().to_list(length=None)
+
+    consumed, shard_counters = asyncio.run(consume())
+
+    shard_counts = [counter['count'] for counter in shard_counters]
+    assert len(shard_counts) == SHARDS and all(count == quota.shard_quota for count in shard_counts)
+    assert consumed.count(True) == SHARDS * quota.shard_quota  # overshoots the quota by at most SHARDS-1 sms
+    assert consumed[-1] is False
+
+
+def test_current_count_is_exposed_as_gauge(mongodb_client):
+    quota = _create_quota(mongodb_client)
+
+    async def consume_and_collect(sms: int):
+        for _ in range(sms):
+            await quota.try_consume()
+        await metrics.collect()
+
+    asyncio.run(consume_and_collect(3))
+    assert metrics.gauge('service_quota_sms_consumed').get() == 3
+    assert 'service_quota_sms_consumed 3' in metrics.render_prometheus()
+
+    asyncio.run(consume_and_collect(2))
+    assert metrics.gauge('service_quota_sms_consumed').get() == 5
+    assert metrics.gauge('service_quota_sms_allowed').get() == SMS_ALLOWED_PER_DAY
+
+
+def test_current_count_is_cached(mongodb_client):
+    quota = MongodbServiceQuota(mongodb_client.get_collection('service_counters'), SMS_ALLOWED_PER_DAY, SHARDS, count_cache_seconds=60)
+
+    async def consume_and_count():
+        counts = [await quota.get_current_count()]
+        await quota.try_consume()
+        counts.append(await quota.get_current_count())
+        return counts
+
+    assert asyncio.run(consume_and_count()) == [0, 0]
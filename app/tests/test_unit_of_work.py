@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from backend.dao.mongodb_dao import MongodbDao
+from backend.dao.mongodb_unit_of_work import MongodbUnitOfWork
+from backend.dto.user_dto import NOT_DELETED, UserDto
+from backend.utils.exceptions import MongoDbUserNotFoundException
+
+PHONE_NUMBER, OTHER_PHONE_NUMBER, UNKNOWN_PHONE_NUMBER = '+15550000001', '+15550000002', '+15550000009'
+
+
+class CountingCollection:
+    """
+    Overview:
+        Wraps a collection to count the bulk_write round trips
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.bulk_writes = 0
+
+    async def bulk_write(self, *args, **kwargs):
+        self.bulk_writes += 1
+        return await self.collection.bulk_write(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def _create_unit_of_work(settings, mongodb_client, *users: UserDto) -> MongodbUnitOfWork:
+    mongodb_dao = MongodbDao(settings, mongodb_client)
+    asyncio.run(mongodb_dao.collection_users.insert_many([user.to_document() for user in users]))
+    mongodb_dao.collection_users = CountingCollection(mongodb_dao.collection_users)
+    return MongodbUnitOfWork(mongodb_dao)
+
+
+def _get_user(mongodb_client, phone_number: str) -> dict:
+    return asyncio.run(mongodb_client.get_collection('users').find_one({'phone_number': phone_number}))
+
+
+def test_updates_are_applied_right_away_and_written_once(settings, mongodb_client):
+    unit_of_work = _create_unit_of_work(settings, mongodb_client, UserDto(PHONE_NUMBER), UserDto(OTHER_PHONE_NUMBER))
+    user, other_user = UserDto(PHONE_NUMBER), UserDto(OTHER_PHONE_NUMBER)
+
+    unit_of_work.update_user_name(user, 'Alice')
+    unit_of_work.update_user_cities(user, [' Fresno', 'Eureka '])
+    unit_of_work.delete_user(other_user)
+
+    assert user.name == 'Alice' and user.city_ids == ['fresno', 'eureka']
+    assert _get_user(mongodb_client, PHONE_NUMBER)['name'] is None  # nothing written before the flush
+
+    assert asyncio.run(unit_of_work.flush()) == 2
+    assert unit_of_work.collection_users.bulk_writes == 1
+    stored_user = _get_user(mongodb_client, PHONE_NUMBER)
+    assert (stored_user['name'], stored_user['cities_ca']) == ('Alice', ['Fresno', 'Eureka'])
+    assert _get_user(mongodb_client, OTHER_PHONE_NUMBER)['deletion_date'] != NOT_DELETED
+    assert asyncio.run(unit_of_work.flush()) == 0  # nothing left to write
+    assert unit_of_work.collection_users.bulk_writes == 1
+
+
+def test_updates_of_the_same_user_are_merged(settings, mongodb_client):
+    unit_of_work = _create_unit_of_work(settings, mongodb_client, UserDto(PHONE_NUMBER))
+    user = UserDto(PHONE_NUMBER)
+
+    unit_of_work.update_user_name(user, 'Alice')
+    unit_of_work.update_user_name(user, 'Alicia')
+
+    assert unit_of_work.updates == {PHONE_NUMBER: {'name': 'Alicia'}}
+
+
+def test_missing_user_raises_after_the_other_users_were_updated(settings, mongodb_client):
+    unit_of_work = _create_unit_of_work(settings, mongodb_client, UserDto(PHONE_NUMBER))
+
+    unit_of_work.update_user_name(UserDto(UNKNOWN_PHONE_NUMBER), 'Bob')
+    unit_of_work.update_user_name(UserDto(PHONE_NUMBER), 'Alice')
+
+    with pytest.raises(MongoDbUserNotFoundException):
+        asyncio.run(unit_of_work.flush())
+    assert _get_user(mongodb_client, PHONE_NUMBER)['name'] == 'Alice'
+    assert _get_user(mongodb_client, UNKNOWN_PHONE_NUMBER) is None
@@ -0,0 +1,69 @@
+import asyncio
+
+from backend.dao.mongodb_dao import MongodbDao
+from backend.dao.mongodb_user_cache import MongodbUserCache
+from backend.dto.user_dto import UserDto
+from pymongo.errors import OperationFailure
+
+PHONE_NUMBER = '+15550000001'
+
+
+class UnsupportedChangeStream:
+    async def __aenter__(self):
+        raise OperationFailure('The $changeStream stage is only supported on replica sets', code=40573)
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class StandaloneCollection:
+    def watch(self):
+        return UnsupportedChangeStream()
+
+
+def _create_dao(settings, mongodb_client) -> MongodbDao:
+    mongodb_dao = MongodbDao(settings, mongodb_client)
+    asyncio.run(mongodb_dao.collection_users.insert_one(UserDto(PHONE_NUMBER, name='Alice').to_document()))
+    return mongodb_dao
+
+
+def test_reads_are_served_from_the_cache_until_a_write_invalidates_them(settings, mongodb_client):
+    mongodb_dao = _create_dao(settings, mongodb_client)
+    user = asyncio.run(mongodb_dao.get_user_by_phone_number(PHONE_NUMBER))
+    asyncio.run(mongodb_dao.collection_users.update_one({'phone_number': PHONE_NUMBER}, {'$set': {'name': 'Written elsewhere'}}))
+
+    assert asyncio.run(mongodb_dao.get_user_by_phone_number(PHONE_NUMBER)).name == 'Alice'  # cached
+    asyncio.run(mongodb_dao.update_user_name(user, 'Bob'))
+    assert asyncio.run(mongodb_dao.get_user_by_phone_number(PHONE_NUMBER)).name == 'Bob'
+
+
+def test_cached_users_are_copies(settings, mongodb_client):
+    mongodb_dao = _create_dao(settings, mongodb_client)
+    asyncio.run(mongodb_dao.get_user_by_phone_number(PHONE_NUMBER)).name = 'Mutated'
+
+    assert asyncio.run(mongodb_dao.get_user_by_phone_number(PHONE_NUMBER)).name == 'Alice'
+
+
+def test_change_events_invalidate_all_but_rate_limit_updates(settings, mongodb_client):
+    mongodb_dao = _create_dao(settings, mongodb_client)
+    user_cache = mongodb_dao.user_cache
+    user = asyncio.run(mongodb_dao.get_user_by_phone_number(PHONE_NUMBER))
+
+    def update(**fields):
+        return {'operationType': 'update', 'documentKey': {'_id': user._id}, 'updateDescription': {'updatedFields': fields, 'removedFields': []}}
+
+    user_cache._on_change(update(sms_counter=2))
+    assert user_cache.get(PHONE_NUMBER) is not None
+    user_cache._on_change(update(connected_phone_number='+15550000002'))
+    assert user_cache.get(PHONE_NUMBER) is None
+
+
+def test_cache_disables_itself_without_change_streams(settings, mongodb_client):
+    user_cache = MongodbUserCache(StandaloneCollection(), ttl_seconds=30, max_entries=100)
+    user_cache.put({'_id': 1, 'phone_number': PHONE_NUMBER}, user_cache.version)
+
+    asyncio.run(user_cache.start())
+    user_cache.put({'_id': 1, 'phone_number': PHONE_NUMBER}, user_cache.version)
+
+    assert not user_cache.is_enabled
+    assert user_cache.get(PHONE_NUMBER) is None
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from backend.dao.mongodb_dao import MongodbDao
+from backend.dto.user_dto import (NOT_DELETED, RATE_LIMITED_USER_FIELDS,
+                                  UserDto)
+from conftest import create_configs_app
+
+PHONE_NUMBER = '+15550000001'
+
+
+def _read_user(settings, mongodb_client, user_cache_enabled: bool, fields=None) -> UserDto:
+    settings.configs_app = create_configs_app(user_cache_enabled=user_cache_enabled)
+    mongodb_dao = MongodbDao(settings, mongodb_client)
+
+    async def insert_and_read():
+        await mongodb_dao.collection_users.insert_one(UserDto(PHONE_NUMBER, name='Alice', cities_ca=['Fresno']).to_document())
+        await mongodb_dao.get_user_by_phone_number(PHONE_NUMBER)  # warms the cache (if enabled)
+        return await mongodb_dao.get_user_by_phone_number(PHONE_NUMBER, fields)
+
+    return asyncio.run(insert_and_read())
+
+
+def test_document_round_trip():
+    user = UserDto(PHONE_NUMBER, name='Alice', cities_ca=['Fresno'], city_ids=['fresno'], _id='id')
+
+    assert UserDto.from_document(user.to_document()).to_document() == user.to_document()
+    assert '_id' not in UserDto(PHONE_NUMBER).to_document()  # left to MongoDB
+
+
+def test_full_documents_of_older_users_get_defaults():
+    user = UserDto.from_document({'phone_number': PHONE_NUMBER, 'unknown_field': 1})
+
+    assert (user.deletion_date, user.helper_missed_count, user.connected_phone_number) == (NOT_DELETED, 0, None)
+
+
+@pytest.mark.parametrize('user_cache_enabled', [False, True])
+def test_projected_reads_only_set_the_projected_fields(settings, mongodb_client, user_cache_enabled):
+    user = _read_user(settings, mongodb_client, user_cache_enabled, RATE_LIMITED_USER_FIELDS)
+
+    assert set(user.to_document()) == set(RATE_LIMITED_USER_FIELDS)
+    assert user.phone_number == PHONE_NUMBER and user.deletion_date == NOT_DELETED
+    with pytest.raises(AttributeError):
+        user.name
+
+
+@pytest.mark.parametrize('user_cache_enabled', [False, True])
+def test_unprojected_reads_set_every_field(settings, mongodb_client, user_cache_enabled):
+    user = _read_user(settings, mongodb_client, user_cache_enabled)
+
+    assert (user.name, user.cities_ca) == ('Alice', ['Fresno'])
@@ -1,2 +1,10 @@
 db.users.createIndex({ phone_number: 1 }, { unique: true });
-db.users.createIndex({ deletion_date: 1}, {expireAfterSeconds: 0})
\ No newline at end of file
+db.users.createIndex({ deletion_date: 1}, {expireAfterSeconds: 0})
+db.service_counters.createIndex({ expire_at: 1 }, { expireAfterSeconds: 0 })
+db.outgoing_sms.createIndex({ status: 1, next_attempt_at: 1 })
+db.outgoing_sms.createIndex({ expire_at: 1 }, { expireAfterSeconds: 0 })
+db.chats.createIndex({ SessionId: 1, _id: 1 }, { name: "SessionId_1__id_1" })
+db.users.createIndex({ city_ids: 1, connected_phone_number: 1, helper_missed_count: 1, last_helped_at: 1 })
+db.helper_waitlist.createIndex({ city_id: 1, created_at: 1 })
+db.helper_waitlist.createIndex({ expire_at: 1 }, { expireAfterSeconds: 0 })
+db.users.createIndex({ connected_at: 1 })
\ No newline at end of file